@@ -1,154 +1,32 @@
 import os
-import re
-import urllib.parse
 import tkinter as tk
 from tkinter import scrolledtext, messagebox
-from typing import List, Literal, Optional
 
 # --- Step 1: Load environment variables and initialize OpenAI client ---
 from dotenv import load_dotenv
 from openai import OpenAI
-from pydantic import BaseModel
+
+from app.models import AbuNewsDocument
+from app.markdown_renderer import generate_markdown
+from app.module_store import module_store
+from app.llm_providers import get_http_client, get_limiter, EXPECTED_OUTPUT_TOKENS
+from app.prompt_registry import count_tokens
+from app.rate_limit import call_with_retries
+
+MODEL = "gpt-4o"
 
 # Load API key from .env file
 load_dotenv()
 
 # Initialize the client
 try:
-    client = OpenAI()
+    # Retries are done by call_with_retries against the shared limiter of the model.
+    client = OpenAI(max_retries=0, http_client=get_http_client("OpenAI"))
 except Exception as e:
     messagebox.showerror("Initialization Error", f"Failed to initialize OpenAI client.\nPlease check your .env file and OPENAI_API_KEY.\n\nDetails: {e}")
     exit()
 
 
-# ==============================================================================
-# PYDANTIC MODELS (Unified Section Model)
-# ==============================================================================
-
-class NestedBlock(BaseModel):
-    type: str
-    title: str
-    content_list: List[str]
-
-class IframeDetails(BaseModel):
-    assignmentId: str
-    subIds: str
-    height: str
-    questions: List[str]
-
-class Section(BaseModel):
-    """A single, unified model for all section types."""
-    type: Literal["info", "keywords", "general_education", "iframe_question", "audio"]
-    title: str
-    content: Optional[str] = None
-    nested_block: Optional[NestedBlock] = None
-    items: Optional[List[str]] = None
-    iframe_details: Optional[IframeDetails] = None
-    block_type: Optional[str] = None
-    audio_url: Optional[str] = None
-    source_text: Optional[str] = None
-    source_url: Optional[str] = None
-    nested_quote_title: Optional[str] = None
-    nested_quote_iframe_details: Optional[IframeDetails] = None
-
-class WarningBlock(BaseModel):
-    title: str
-    content: str
-
-class TeacherMaterial(BaseModel):
-    title: str
-    warning_block: Optional[WarningBlock] = None # Make this optional to prevent validation errors
-
-class AbuNewsDocument(BaseModel):
-    """The root model, now using a list of the single, unified Section model."""
-    title: str
-    sections: List[Section]
-    teacher_material: Optional[TeacherMaterial] = None
-
-
-# ==============================================================================
-# MARKDOWN PARSER (v6 - Final Robustness Fix)
-# ==============================================================================
-
-def build_iframe_url(details: IframeDetails) -> str:
-    base_url = "https://allgemeinbildung.github.io/textbox/answers.html?"
-    params = {'assignmentId': details.assignmentId, 'subIds': details.subIds}
-    for i, q in enumerate(details.questions):
-        params[f'question{i+1}'] = q
-    return base_url + urllib.parse.urlencode(params)
-
-def generate_markdown(data: AbuNewsDocument) -> str:
-    """Generates clean markdown with correct spacing and list formatting."""
-    md_blocks = [f"# {data.title}"]
-
-    for section in data.sections:
-        block_parts = []
-        if section.type == 'info':
-            block_parts.append(f">[!{section.type}] {section.title}")
-            if section.content:
-                for line in section.content.strip().split('\n'):
-                    block_parts.append(f"> {line.strip()}")
-            if section.nested_block:
-                block_parts.append(f">")
-                block_parts.append(f">>[!{section.nested_block.type}] {section.nested_block.title}")
-                for item in section.nested_block.content_list:
-                    block_parts.append(f">> - {item.strip()}")
-            md_blocks.append("\n".join(block_parts))
-
-        elif section.type in ['keywords', 'general_education']:
-            block_parts.append(f"#### {section.title}")
-            if section.items:
-                cleaned_items = [re.sub(r'[\[\]]', '', item).strip() for item in section.items]
-                links = [f"[[{item}]]" for item in cleaned_items]
-                block_parts.append(", ".join(links))
-            md_blocks.append("\n".join(block_parts))
-
-        elif section.type == 'iframe_question':
-            block_parts.append(f">[!question] {section.title}")
-            if section.iframe_details:
-                iframe_url = build_iframe_url(section.iframe_details)
-                iframe_tag = (f'<iframe src="{iframe_url}" style="border:0px #ffffff none;" '
-                              f'name="myiFrame" scrolling="yes" frameborder="1" marginheight="0px" '
-                              f'marginwidth="0px" height="{section.iframe_details.height}" '
-                              'width="100%" allowfullscreen></iframe>')
-                block_parts.append(iframe_tag)
-            md_blocks.append("\n".join(block_parts))
-
-        elif section.type == 'audio':
-            block_type = section.block_type if section.block_type and section.block_type.lower() != 'none' else 'hint'
-            source_text = section.source_text if section.source_text and section.source_text.lower() != 'none' else 'Quelle'
-            source_url = section.source_url if section.source_url and section.source_url.lower() != 'none' else '#'
-            
-            block_parts.append(f">[!{block_type}] {section.title} ><audio controls><source src=\"{section.audio_url}\"></audio>")
-            block_parts.append(f">Quelle: [{source_text}]({source_url})")
-
-            if section.nested_quote_title and section.nested_quote_iframe_details:
-                block_parts.append(f">")
-                block_parts.append(f">>[!quote] {section.nested_quote_title}")
-                nested_iframe_url = build_iframe_url(section.nested_quote_iframe_details)
-                nested_iframe_tag = (f'>> <iframe src="{nested_iframe_url}" style="border:0px #ffffff none;" '
-                                     f'name="myiFrame" scrolling="yes" frameborder="1" marginheight="0px" '
-                                     f'marginwidth="0px" height="{section.nested_quote_iframe_details.height}" '
-                                     'width="100%" allowfullscreen></iframe>')
-                block_parts.append(nested_iframe_tag)
-            md_blocks.append("\n".join(block_parts))
-
-    # Handle Teacher Material section
-    if data.teacher_material:
-        md_blocks.append("%-%-%-")
-        # Add the safety check for the warning_block itself
-        if data.teacher_material.warning_block:
-            tm = data.teacher_material
-            tm_block_parts = [f"# {tm.title}"]
-            tm_block_parts.append(f">[!warning] {tm.warning_block.title}")
-            if tm.warning_block.content:
-                for line in tm.warning_block.content.strip().split('\n'):
-                    tm_block_parts.append(f"> {line.strip()}")
-            md_blocks.append("\n".join(tm_block_parts))
-        
-    return "\n\n".join(md_blocks)
-
-
 # ==============================================================================
 # CORE LOGIC & UI (No changes needed here)
 # ==============================================================================
@@ -156,15 +34,22 @@ def generate_markdown(data: AbuNewsDocument) -> str:
 def run_generation_process(system_prompt: str, user_prompt: str):
     """Handles the API call, parsing, and file saving."""
     try:
-        response = client.responses.parse(
-            model="gpt-4o",
+        # Booked against the model's shared token budget like the Streamlit app's calls,
+        # then corrected with the real usage.
+        limiter = get_limiter(MODEL)
+        estimate = count_tokens(system_prompt + user_prompt, MODEL) + EXPECTED_OUTPUT_TOKENS
+        response = call_with_retries(lambda: client.responses.parse(
+            model=MODEL,
             input=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
             text_format=AbuNewsDocument,
-        )
+        ), limiter, tokens=estimate)
+        if response.usage is not None:
+            limiter.adjust(response.usage.total_tokens - estimate)
         lesson_plan_data = response.output_parsed
+        module_store.save(lesson_plan_data, topic=user_prompt, model=MODEL)
         markdown_output = generate_markdown(lesson_plan_data)
         output_filename = "generated_lesson.md"
         with open(output_filename, "w", encoding="utf-8") as f:
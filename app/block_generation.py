@@ -0,0 +1,107 @@
+# app/block_generation.py
+
+import asyncio
+import time
+from pydantic import BaseModel, Field
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import PydanticOutputParser
+
+from .prompt_registry import prompt_registry
+from .retrieval import format_context
+from .tracing import span
+from .models import (
+    FullLearningUnit, Frontmatter, LearningObjectives, InteractiveQuestionsBlock,
+    ImportanceBlock, MediaBlock, AnswersBlock, SolutionSuggestions, DeepDiveLanguage,
+)
+
+BLOCK_PROMPT_PATH = 'app/prompts/learning_module_block_prompt.md'
+
+
+class HeaderBlock(BaseModel):
+    """The frontmatter and main title of a learning unit."""
+    frontmatter: Frontmatter
+    title: str = Field(description="The main H1 title of the document, e.g., 'ABUnews - Zürcher Jugendkriminalität'.")
+
+class MediaAndSolutionsBlock(BaseModel):
+    """The media block together with the answers and solutions that depend on its questions."""
+    media_block: MediaBlock
+    answers_block: AnswersBlock
+    solution_suggestions: SolutionSuggestions
+
+
+# Each entry: (block name, Pydantic model, FullLearningUnit field or None to merge
+# the model's fields into the unit, instruction for the LLM).
+GENERATION_BLOCKS = [
+    ("header", HeaderBlock, None,
+     "The frontmatter (topics, chapter, type, source, summary) and the main H1 title of the module."),
+    ("objectives_block", LearningObjectives, "objectives_block",
+     "The 'Worum geht es?' introduction, the learning objectives, the key terms and the 'Aspekte der Allgemeinbildung'."),
+    ("activation_questions", InteractiveQuestionsBlock, "activation_questions",
+     "The activation block: 3 open reflection questions that connect the topic to the students' everyday life. "
+     "Derive the assignment_id from the topic and use a sub_id such as 'A. Einstiegsfragen <topic>'."),
+    ("importance_block", ImportanceBlock, "importance_block",
+     "The 'Warum ist das wichtig?' block explaining the topic's significance."),
+    ("media", MediaAndSolutionsBlock, None,
+     "The media block with 6-7 comprehension questions, the answers iframe, and the teacher's solution "
+     "suggestions (one concise answer per comprehension question, in the same order). "
+     "Derive the assignment_id from the topic."),
+    ("language_deep_dive", DeepDiveLanguage, "language_deep_dive",
+     "The 'Vertiefung Sprache' section with its instruction and 3 different writing assignments, "
+     "each with 5 step-by-step guiding questions. Derive the assignment_id from the topic."),
+]
+
+
+async def agenerate_learning_unit(llm, retriever, topic):
+    """
+    Generates a FullLearningUnit by requesting its independent blocks concurrently
+    against one shared retrieved context, then assembling and validating the result.
+
+    Returns:
+        A tuple (FullLearningUnit, timings) where timings maps each stage and block
+        name to its wall-clock duration in seconds.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    with span("retrieval"):
+        docs = await retriever.ainvoke(topic)
+    context = format_context(docs)
+    timings["retrieval"] = time.perf_counter() - started
+
+    template = prompt_registry.load_text(BLOCK_PROMPT_PATH)
+
+    async def run_block(name, model, instruction):
+        block_started = time.perf_counter()
+        parser = PydanticOutputParser(pydantic_object=model)
+        prompt = PromptTemplate(
+            template=template,
+            input_variables=["context", "input"],
+            partial_variables={
+                "block_instruction": instruction,
+                "format_instructions": prompt_registry.format_instructions(model),
+            },
+        )
+        with span(f"block {name}"):
+            result = await (prompt | llm | parser).ainvoke({"context": context, "input": topic})
+        timings[name] = time.perf_counter() - block_started
+        return result
+
+    results = await asyncio.gather(*(
+        run_block(name, model, instruction) for name, model, _, instruction in GENERATION_BLOCKS
+    ))
+
+    unit_data = {}
+    for (_, _, field_name, _), result in zip(GENERATION_BLOCKS, results):
+        if field_name is None:
+            unit_data.update(result.model_dump())
+        else:
+            unit_data[field_name] = result.model_dump()
+    unit = FullLearningUnit.model_validate(unit_data)
+
+    timings["total"] = time.perf_counter() - started
+    return unit, timings
+
+
+def generate_learning_unit(llm, retriever, topic):
+    """Synchronous entry point for agenerate_learning_unit, e.g. from a Streamlit script."""
+    return asyncio.run(agenerate_learning_unit(llm, retriever, topic))
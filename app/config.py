@@ -1,5 +1,6 @@
 # app/config.py
 
+import argparse
 import os
 from dotenv import load_dotenv
 
@@ -13,4 +14,20 @@ def load_api_keys():
     if not os.environ.get("OPENAI_API_KEY"):
         print("Warning: OPENAI_API_KEY not found in .env file.")
     if not os.environ.get("GOOGLE_API_KEY"):
-        print("Warning: GOOGLE_API_KEY not found in .env file.")
\ No newline at end of file
+        print("Warning: GOOGLE_API_KEY not found in .env file.")
+
+def parse_cli_args(argv=None):
+    """
+    Parses the app's command-line options. With Streamlit they are passed after
+    `--`, e.g. `streamlit run main_app.py -- --extract-workers 4`.
+    Unknown arguments are ignored.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--extract-workers",
+        type=int,
+        default=int(os.environ.get("PIMP_EXTRACT_WORKERS", "1")),
+        help="Number of processes used to extract the pages of large PDFs.",
+    )
+    args, _ = parser.parse_known_args(argv)
+    return args
@@ -1,53 +1,145 @@
 # app/document_processor.py
 
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredWordDocumentLoader
+from docx import Document as DocxDocument
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from pypdf import PdfReader
+from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-@st.cache_data(show_spinner="Processing document...")
-def load_and_split_document(uploaded_file):
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt', '.docx')
+
+# Below this many pages per worker, process start-up costs more than it saves.
+MIN_PAGES_PER_WORKER = 8
+
+# Set in each extraction worker process by _init_pdf_worker.
+_worker_reader = None
+
+
+def _file_extension(file_name):
+    _, file_extension = os.path.splitext(file_name)
+    return file_extension.lower()
+
+
+def _docx_text(stream):
     """
-    Loads an uploaded document, saves it temporarily, selects the appropriate loader,
-    loads the content, and splits it into chunks for processing.
-    
-    Args:
-        uploaded_file: The file uploaded via Streamlit's file_uploader.
+    Extracts the text of a .docx file in document order: paragraphs as they are,
+    each table row as one " | "-joined line where the table stands.
+    """
+    document = DocxDocument(stream)
+    parts = []
+    for child in document.element.body.iterchildren():
+        if child.tag == qn('w:p'):
+            text = Paragraph(child, document).text
+            if text.strip():
+                parts.append(text)
+        elif child.tag == qn('w:tbl'):
+            for row in Table(child, document).rows:
+                cells = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+                if cells:
+                    parts.append(" | ".join(cells))
+    return "\n\n".join(parts)
 
-    Returns:
-        A list of Document objects (chunks) or None if an error occurs.
+
+def _init_pdf_worker(data):
+    """Opens the PDF once per worker process instead of once per task."""
+    global _worker_reader
+    _worker_reader = PdfReader(io.BytesIO(data))
+
+
+def _extract_pdf_page_range(start, end):
+    """Extracts the text of pages [start, end) in a worker process."""
+    return [_worker_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _iter_pdf_pages_parallel(file_name, data, page_count, workers):
+    """
+    Extracts PDF pages across a process pool. The page range is split into
+    contiguous slices (a few per worker for load balancing) and the results are
+    yielded back in page order.
     """
-    temp_dir = "temp"
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
+    slice_size = max(1, -(-page_count // (workers * 4)))
+    ranges = [(start, min(start + slice_size, page_count)) for start in range(0, page_count, slice_size)]
 
-    temp_path = os.path.join(temp_dir, uploaded_file.name)
-    with open(temp_path, "wb") as f:
-        f.write(uploaded_file.getvalue())
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pdf_worker, initargs=(data,)) as pool:
+        futures = [pool.submit(_extract_pdf_page_range, start, end) for start, end in ranges]
+        for (start, _), future in zip(ranges, futures):
+            for offset, text in enumerate(future.result()):
+                yield Document(page_content=text, metadata={"source": file_name, "page": start + offset})
 
-    _, file_extension = os.path.splitext(temp_path)
-    file_extension = file_extension.lower()
+
+def iter_document_pages(file_name, stream, workers=1):
+    """
+    Reads an uploaded document straight from its byte stream and yields it as
+    Document objects, one per PDF page (or one for a whole TXT/DOCX file).
+    Nothing is written to disk, so concurrent uploads cannot collide.
+
+    Args:
+        file_name: The original file name, used for the file type and metadata.
+        stream: A binary file-like object, e.g. Streamlit's UploadedFile.
+        workers: Number of processes for PDF text extraction. Large PDFs are
+            extracted in parallel when this is greater than 1.
+
+    Raises:
+        ValueError: If the file type is not supported.
+    """
+    file_extension = _file_extension(file_name)
+    stream.seek(0)
 
     if file_extension == '.pdf':
-        loader = PyPDFLoader(temp_path)
+        reader = PdfReader(stream)
+        page_count = len(reader.pages)
+        workers = min(workers, page_count // MIN_PAGES_PER_WORKER)
+        if workers > 1:
+            stream.seek(0)
+            yield from _iter_pdf_pages_parallel(file_name, stream.read(), page_count, workers)
+            return
+        for page_number, page in enumerate(reader.pages):
+            yield Document(
+                page_content=page.extract_text() or "",
+                metadata={"source": file_name, "page": page_number},
+            )
     elif file_extension == '.txt':
-        loader = TextLoader(temp_path, encoding='utf-8')
+        text = stream.read().decode('utf-8')
+        yield Document(page_content=text, metadata={"source": file_name})
     elif file_extension == '.docx':
-        loader = UnstructuredWordDocumentLoader(temp_path)
+        yield Document(page_content=_docx_text(stream), metadata={"source": file_name})
     else:
-        st.error(f"Unsupported file type: '{file_extension}'")
-        os.remove(temp_path)
-        return None
+        raise ValueError(f"Unsupported file type: '{file_extension}'")
+
+
+def iter_split_chunks(file_name, stream, workers=1):
+    """
+    Lazily yields the chunks of a document. Each page is split as soon as it has
+    been parsed, so only one page of raw text is held at a time.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    for page in iter_document_pages(file_name, stream, workers=workers):
+        yield from text_splitter.split_documents([page])
+
 
+@st.cache_data(show_spinner="Processing document...")
+def load_and_split_document(uploaded_file, workers=1):
+    """
+    Loads an uploaded document from memory and splits it into chunks for processing.
+
+    Args:
+        uploaded_file: The file uploaded via Streamlit's file_uploader.
+        workers: Number of processes used to extract the pages of large PDFs.
+
+    Returns:
+        A list of Document objects (chunks) or None if an error occurs.
+    """
     try:
-        documents = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
-        split_docs = text_splitter.split_documents(documents)
-    finally:
-        # Ensure the temporary file is deleted even if an error occurs
-        try:
-            os.remove(temp_path)
-        except OSError as e:
-            st.warning(f"Could not delete temporary file: {e}")
-
-    return split_docs
\ No newline at end of file
+        return list(iter_split_chunks(uploaded_file.name, uploaded_file, workers=workers))
+    except ValueError as e:
+        st.error(str(e))
+        return None
@@ -0,0 +1,200 @@
+# app/docx_writer.py
+
+import copy
+import io
+import os
+from functools import lru_cache
+from docx import Document
+from docx.enum.text import WD_BREAK
+from docx.shared import Pt
+from docx.oxml.ns import qn
+from docx.oxml import OxmlElement
+
+# An optional .docx whose styles (headings, 'List Bullet', 'Table Grid') replace
+# python-docx's default template. Its body content is ignored.
+DOCX_TEMPLATE_PATH = os.environ.get("PIMP_DOCX_TEMPLATE")
+
+SHADING_FILL = 'EAEAEA'  # Light gray
+ANSWER_LINES = 4
+
+
+@lru_cache(maxsize=1)
+def _template_bytes():
+    """The template package, loaded and emptied once per process."""
+    document = Document(DOCX_TEMPLATE_PATH) if DOCX_TEMPLATE_PATH else Document()
+    body = document.element.body
+    for child in list(body):
+        if child.tag != qn('w:sectPr'):
+            body.remove(child)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def new_document():
+    """A fresh, empty document based on the template."""
+    return Document(io.BytesIO(_template_bytes()))
+
+
+@lru_cache(maxsize=1)
+def _fragments():
+    """
+    Prebuilt XML elements, created once through python-docx in a scratch document
+    and cloned for every use afterwards.
+    """
+    scratch = new_document()
+    fragments = {
+        'p': scratch.add_paragraph()._p,
+        'r': scratch.add_paragraph().add_run()._r,
+        'List Bullet': scratch.add_paragraph(style='List Bullet')._p,
+    }
+    bold_run = scratch.add_paragraph().add_run()
+    bold_run.bold = True
+    fragments['r_bold'] = bold_run._r
+    for level in range(0, 10):
+        fragments[f'heading{level}'] = scratch.add_heading(level=level)._p
+
+    box = scratch.add_table(rows=1, cols=1)
+    box.style = 'Table Grid'
+    shading_elm = OxmlElement('w:shd')
+    shading_elm.set(qn('w:val'), 'clear')
+    shading_elm.set(qn('w:fill'), SHADING_FILL)
+    box.cell(0, 0)._tc.get_or_add_tcPr().append(shading_elm)
+    fragments['shaded_box'] = box._tbl
+
+    answer_lines = scratch.add_table(rows=ANSWER_LINES, cols=1)
+    for row in answer_lines.rows:
+        # Removing the default paragraph margins to make the lines tighter
+        p = row.cells[0].paragraphs[0]
+        p.paragraph_format.space_before = Pt(0)
+        p.paragraph_format.space_after = Pt(4)
+    fragments['answer_lines'] = answer_lines._tbl
+
+    page_break = scratch.add_paragraph()
+    page_break.add_run().add_break(WD_BREAK.PAGE)
+    fragments['page_break'] = page_break._p
+    return fragments
+
+
+def _field_char(char_type, dirty=True):
+    r = OxmlElement('w:r')
+    fld_char = OxmlElement('w:fldChar')
+    fld_char.set(qn('w:fldCharType'), char_type)
+    if char_type == 'begin' and dirty:
+        # Asks Word to recompute the field (page numbers) when the file is opened.
+        fld_char.set(qn('w:dirty'), 'true')
+    r.append(fld_char)
+    return r
+
+
+def _instruction(text):
+    r = OxmlElement('w:r')
+    instr_text = OxmlElement('w:instrText')
+    instr_text.set(qn('xml:space'), 'preserve')
+    instr_text.text = text
+    r.append(instr_text)
+    return r
+
+
+class TableOfContents:
+    """
+    A TOC field whose cached entries are filled in while the document is written.
+    Word replaces them with a paginated table when it updates the field.
+
+    With `identifier`, the TOC lists only the entries marked with `add_entry(...,
+    at=paragraph)` (TC fields with that identifier) instead of the heading
+    levels, so the cached and the updated table always agree.
+    """
+
+    def __init__(self, writer, levels, identifier=None):
+        self._writer = writer
+        self.identifier = identifier
+        begin = OxmlElement('w:p')
+        begin.append(_field_char('begin'))
+        if identifier:
+            begin.append(_instruction(f' TOC \\f {identifier} \\l "{levels}" \\h \\z '))
+        else:
+            begin.append(_instruction(f' TOC \\o "{levels}" \\h \\z \\u '))
+        begin.append(_field_char('separate'))
+        writer._append(begin)
+        self._end = OxmlElement('w:p')
+        self._end.append(_field_char('end'))
+        writer._append(self._end)
+
+    def add_entry(self, text, at=None, level=1):
+        """
+        Adds a cached entry. With an identifier, `at` is the paragraph whose
+        page the entry points to; a TC field for it is appended there.
+        """
+        self._end.addprevious(self._writer._p(text))
+        if self.identifier and at is not None:
+            quoted = text.replace('"', '\\"')
+            at.append(_field_char('begin', dirty=False))
+            at.append(_instruction(f' TC "{quoted}" \\f {self.identifier} \\l {level} '))
+            at.append(_field_char('end'))
+
+
+class DocxWriter:
+    """
+    Appends worksheet elements to a python-docx document by cloning cached XML
+    fragments instead of going through python-docx's object layer each time.
+    The result is the same XML python-docx would produce.
+    """
+
+    def __init__(self, document=None):
+        self.document = document if document is not None else new_document()
+        self._body = self.document.element.body
+        # Looked up once: finding it again for every element makes long documents quadratic.
+        self._sect_pr = self._body.find(qn('w:sectPr'))
+        self._fragments = _fragments()
+
+    def _clone(self, name):
+        return copy.deepcopy(self._fragments[name])
+
+    def _append(self, element):
+        if self._sect_pr is not None:
+            self._sect_pr.addprevious(element)
+        else:
+            self._body.append(element)
+        return element
+
+    def _p(self, text='', bold=False, fragment='p'):
+        p = self._clone(fragment)
+        if text or bold:
+            # python-docx's add_run('') still writes an (empty) run when it gets formatted.
+            r = self._clone('r_bold' if bold else 'r')
+            r.text = text
+            p.append(r)
+        return p
+
+    def heading(self, text, level=1):
+        return self._append(self._p(text, fragment=f'heading{level}'))
+
+    def paragraph(self, text='', style=None, bold=False):
+        return self._append(self._p(text, bold=bold, fragment=style or 'p'))
+
+    def shaded_box(self, title, lines):
+        """A one-cell table with a gray background holding a bold title and the lines."""
+        tbl = self._clone('shaded_box')
+        tc = tbl.find(f"{qn('w:tr')}/{qn('w:tc')}")
+        tc.append(self._p(title, bold=True))
+        for line in lines:
+            tc.append(self._p(line))
+        return self._append(tbl)
+
+    def answer_lines(self):
+        """Empty table rows to write a printed answer on."""
+        return self._append(self._clone('answer_lines'))
+
+    def page_break(self):
+        return self._append(self._clone('page_break'))
+
+    def table_of_contents(self, levels="1-1", identifier=None):
+        """
+        Inserts a TOC field at the current position, over the given heading
+        levels or, with `identifier`, over the TC entries marked with it.
+        """
+        return TableOfContents(self, levels, identifier)
+
+    def save(self, path):
+        self.document.save(path)
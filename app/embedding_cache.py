@@ -0,0 +1,123 @@
+# app/embedding_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from .tracing import span
+
+EMBEDDING_CACHE_PATH = os.environ.get("PIMP_EMBEDDING_CACHE_PATH", os.path.join("cache", "embeddings.sqlite"))
+
+
+def embedding_key(text, model_name):
+    """Hash of (chunk text, embedding model) used as the cache key."""
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """A persistent key-value store of float32 embedding vectors, backed by SQLite."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Streamlit runs each session in its own thread, so the connection is
+            # shared and guarded by our own lock.
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+        return self._conn
+
+    def get_many(self, keys):
+        """Returns a dict mapping each cached key to its vector (a list of floats)."""
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            # Stay well below SQLite's limit on bound parameters.
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                )
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, items):
+        """Stores (key, vector) pairs."""
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items],
+            )
+            conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings backend so that document chunks are only embedded once per
+    model. Only the cache misses are sent to the backend, in batches.
+    """
+
+    def __init__(self, underlying, model_name, store, batch_size=256):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.store = store
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        with span("embed", model=self.model_name, chunks=len(texts)) as embed_span:
+            keys = [embedding_key(text, self.model_name) for text in texts]
+            cached = self.store.get_many(list(set(keys)))
+
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in cached and key not in missing:
+                    missing[key] = text
+
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            embed_span.set(cached=len(texts) - len(missing), embedded=len(missing))
+
+            missing_items = list(missing.items())
+            for start in range(0, len(missing_items), self.batch_size):
+                batch = missing_items[start:start + self.batch_size]
+                vectors = self.underlying.embed_documents([text for _, text in batch])
+                new_items = [(key, vector) for (key, _), vector in zip(batch, vectors)]
+                self.store.put_many(new_items)
+                cached.update(new_items)
+
+            return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.underlying.embed_query(text)
+
+    def stats(self):
+        """Returns the chunk-level hit/miss counters of this wrapper."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+embedding_store = EmbeddingStore()
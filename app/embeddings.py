@@ -0,0 +1,111 @@
+# app/embeddings.py
+
+import math
+import re
+import threading
+import zlib
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+try:
+    import torch
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # the local backend is optional
+    SentenceTransformer = None
+
+LOCAL_EMBEDDING_BACKEND = "Local (multilingual, CPU)"
+EMBEDDING_BACKENDS = ["OpenAI", LOCAL_EMBEDDING_BACKEND]
+LOCAL_BACKEND_HINT = "The local embedding backend needs `pip install sentence-transformers`."
+
+# Offline backend for benchmarks and load tests; not offered in the UI.
+FAKE_EMBEDDING_BACKEND = "Fake"
+
+# Small multilingual model that handles German well and runs fast on CPU.
+DEFAULT_LOCAL_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embeds texts on the local CPU with a sentence-transformers model. Texts are
+    encoded in batches, and the model's linear layers can be quantized to int8,
+    which is roughly twice as fast on CPU with almost the same retrieval quality.
+    """
+
+    def __init__(self, model_name=DEFAULT_LOCAL_MODEL, batch_size=64, quantize=True):
+        if SentenceTransformer is None:
+            raise ImportError(LOCAL_BACKEND_HINT)
+        encoder = SentenceTransformer(model_name, device="cpu")
+        if quantize:
+            encoder = torch.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8)
+        self._encoder = encoder
+        self.batch_size = batch_size
+        # Used in cache keys, so quantized and full-precision vectors never mix.
+        self.model = f"{model_name}+int8" if quantize else model_name
+
+    def _encode(self, texts):
+        vectors = self._encoder.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    def embed_documents(self, texts):
+        return self._encode(list(texts))
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic offline embeddings: every word is hashed into one of
+    `dimensions` buckets and the counts are L2-normalized. Texts sharing words
+    get similar vectors, so retrieval still behaves plausibly, and the same text
+    gives the same vector in every process.
+    """
+
+    _WORD = re.compile(r"\w+")
+
+    def __init__(self, dimensions=1536):
+        self.dimensions = dimensions
+        self.model = f"fake-hashing-{dimensions}"
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        for word in self._WORD.findall(text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dimensions] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def embedding_backend_available(backend):
+    """Whether the backend's optional dependencies are installed."""
+    return backend != LOCAL_EMBEDDING_BACKEND or SentenceTransformer is not None
+
+
+_backend_lock = threading.Lock()
+_local_backends = {}
+
+
+def get_embeddings(backend="OpenAI"):
+    """
+    Returns the embeddings object for one of EMBEDDING_BACKENDS. The local model is
+    loaded once per process; the OpenAI client is cheap to create.
+    """
+    if backend == "OpenAI":
+        return OpenAIEmbeddings()
+    if backend == FAKE_EMBEDDING_BACKEND:
+        return FakeEmbeddings()
+    with _backend_lock:
+        if backend not in _local_backends:
+            _local_backends[backend] = LocalEmbeddings()
+        return _local_backends[backend]
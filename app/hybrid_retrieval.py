@@ -0,0 +1,122 @@
+# app/hybrid_retrieval.py
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, List, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # reranking is optional
+    CrossEncoder = None
+
+# A small multilingual cross-encoder that runs fine on CPU.
+DEFAULT_RERANKER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+# Unicode word tokens, so umlauts and article numbers such as "25a" stay intact.
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """Lower-cases and splits text into word tokens for the keyword index."""
+    return [token for token in TOKEN_PATTERN.findall(text.casefold()) if len(token) > 1 or token.isdigit()]
+
+
+class BM25Index:
+    """
+    An in-memory inverted index with Okapi BM25 scoring. Exact terms (legal terms,
+    article numbers, Schlüsselbegriffe) are matched literally, which dense
+    embeddings often miss.
+    """
+
+    def __init__(self, docs, k1=1.5, b=0.75):
+        self.docs = list(docs)
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc_id, doc in enumerate(self.docs):
+            term_counts = Counter(tokenize(doc.page_content))
+            self.doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                self.postings[term].append((doc_id, count))
+        doc_count = len(self.docs)
+        self.avg_doc_length = sum(self.doc_lengths) / doc_count if doc_count else 0.0
+        self.idf = {
+            term: math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, k):
+        """Returns up to k (Document, score) pairs, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.docs[doc_id], score) for doc_id, score in best]
+
+
+_reranker_lock = threading.Lock()
+_rerankers = {}
+
+
+def get_reranker(model_name=DEFAULT_RERANKER_MODEL):
+    """Loads a cross-encoder once per process. Returns None if sentence-transformers is missing."""
+    if CrossEncoder is None:
+        return None
+    with _reranker_lock:
+        if model_name not in _rerankers:
+            _rerankers[model_name] = CrossEncoder(model_name, device="cpu")
+        return _rerankers[model_name]
+
+
+def _doc_key(doc):
+    return (doc.page_content, doc.metadata.get("source"), doc.metadata.get("page"))
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses BM25 keyword hits and FAISS vector hits with weighted reciprocal rank
+    fusion, optionally reranks the fused candidates with a cross-encoder, and
+    returns the top k.
+    """
+
+    vectorstore: Any
+    bm25: Any
+    k: int = 5
+    fetch_k: int = 20
+    vector_weight: float = 0.5
+    rrf_k: int = 60
+    reranker: Optional[Any] = None
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_hits = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        keyword_hits = [doc for doc, _ in self.bm25.search(query, self.fetch_k)]
+
+        fused = {}
+        for weight, hits in ((self.vector_weight, vector_hits), (1 - self.vector_weight, keyword_hits)):
+            for rank, doc in enumerate(hits):
+                key = _doc_key(doc)
+                score = weight / (self.rrf_k + rank + 1)
+                if key in fused:
+                    fused[key] = (fused[key][0] + score, fused[key][1])
+                else:
+                    fused[key] = (score, doc)
+        candidates = [doc for _, doc in sorted(fused.values(), key=lambda item: item[0], reverse=True)]
+
+        if self.reranker is not None and candidates:
+            candidates = candidates[:self.fetch_k]
+            scores = self.reranker.predict([(query, doc.page_content) for doc in candidates])
+            candidates = [doc for _, doc in sorted(zip(scores, candidates), key=lambda item: item[0], reverse=True)]
+
+        return candidates[:self.k]
@@ -0,0 +1,142 @@
+# app/index_cache.py
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from langchain_community.vectorstores import FAISS
+
+INDEX_CACHE_DIR = os.environ.get("PIMP_INDEX_CACHE_DIR", os.path.join("cache", "faiss"))
+INDEX_CACHE_MAX_BYTES = int(os.environ.get("PIMP_INDEX_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+META_FILE = "meta.json"
+
+
+def compute_index_key(docs, embedding_model, chunk_size, chunk_overlap, index_type="Flat"):
+    """
+    Builds a content-addressed key for a set of chunks. Two uploads with the same
+    chunk texts, embedding model, splitter settings and index type map to the same index.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{embedding_model}|{chunk_size}|{chunk_overlap}|{index_type}\n".encode("utf-8"))
+    for doc in docs:
+        text = doc.page_content.encode("utf-8")
+        # Length prefix so that chunk boundaries are part of the key.
+        digest.update(f"{len(text)}:".encode("utf-8"))
+        digest.update(text)
+    return digest.hexdigest()
+
+
+def _folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class IndexCache:
+    """
+    An on-disk store of FAISS indexes (index + docstore) keyed by content hash.
+    The total size on disk is bounded; the least recently used entries are
+    evicted first.
+    """
+
+    def __init__(self, cache_dir=INDEX_CACHE_DIR, max_bytes=INDEX_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_meta(self, path):
+        try:
+            with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, path, meta):
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def load(self, key, embeddings):
+        """Returns the cached vector store for `key`, or None on a miss."""
+        path = self._entry_path(key)
+        with self._lock:
+            meta = self._read_meta(path)
+            if meta is None:
+                self.misses += 1
+                return None
+            try:
+                # The index files are written by this process only, so loading the
+                # pickled docstore is safe here.
+                vector_store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+            except Exception as e:
+                print(f"Warning: Could not load cached index {key}: {e}")
+                shutil.rmtree(path, ignore_errors=True)
+                self.misses += 1
+                return None
+            meta["last_access"] = time.time()
+            self._write_meta(path, meta)
+            self.hits += 1
+            return vector_store
+
+    def save(self, key, vector_store):
+        """Persists a vector store under `key` and evicts old entries if needed."""
+        path = self._entry_path(key)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            try:
+                vector_store.save_local(tmp_path)
+                self._write_meta(tmp_path, {
+                    "size": _folder_size(tmp_path),
+                    "created": time.time(),
+                    "last_access": time.time(),
+                })
+                if os.path.exists(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Warning: Could not write index cache entry {key}: {e}")
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            meta = self._read_meta(path)
+            if meta is None:
+                continue
+            entries.append((meta.get("last_access", 0), meta.get("size", 0), path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        """Returns the hit/miss counters of this process."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+index_cache = IndexCache()
@@ -0,0 +1,213 @@
+# app/index_registry.py
+
+import os
+import threading
+import time
+import uuid
+import weakref
+
+from .hybrid_retrieval import BM25Index
+
+# Indexes that no session holds anymore are kept around (least recently used
+# first out) up to this number, so a teacher returning to a chapter gets it back
+# without reloading it from disk.
+MAX_UNREFERENCED_INDEXES = int(os.environ.get("PIMP_MAX_UNREFERENCED_INDEXES", "8"))
+# Hard limits on what is resident in memory, held by sessions or not. A new
+# build that would exceed them (after evicting unreferenced indexes) is refused.
+MAX_INDEXES_IN_MEMORY = int(os.environ.get("PIMP_MAX_INDEXES_IN_MEMORY", "16"))
+MAX_CHUNKS_IN_MEMORY = int(os.environ.get("PIMP_MAX_CHUNKS_IN_MEMORY", "200000"))
+
+
+class IndexCapacityError(RuntimeError):
+    """Raised when a new index would not fit the registry's memory limits."""
+
+
+class IndexEntry:
+    """One indexed document in the shared registry."""
+
+    def __init__(self, key, name, vector_store, docs, embedding_stats=None):
+        self.key = key
+        self.name = name
+        self.vector_store = vector_store
+        self.docs = docs
+        self.embedding_stats = embedding_stats
+        self.holders = set()
+        self.last_used = time.time()
+        self._bm25 = None
+        self._bm25_lock = threading.Lock()
+
+    @property
+    def chunk_count(self):
+        return len(self.docs)
+
+    @property
+    def bm25(self):
+        """The keyword index for hybrid retrieval, built on first use."""
+        with self._bm25_lock:
+            if self._bm25 is None:
+                self._bm25 = BM25Index(self.docs)
+            return self._bm25
+
+
+class IndexRegistry:
+    """
+    A process-wide registry of document indexes shared by all browser sessions.
+    Sessions hold the indexes they use through an IndexLease; the reference count
+    of an entry is the number of leases holding it. Unreferenced entries are
+    evicted once there are more than `max_unreferenced` of them.
+
+    Held entries are never evicted, so memory is bounded by refusing new builds
+    instead: at most `max_indexes` indexes with `max_chunks` chunks in total are
+    resident. Building another one first evicts unreferenced entries to make
+    room and raises IndexCapacityError if the held ones alone leave none.
+    """
+
+    def __init__(self, max_unreferenced=MAX_UNREFERENCED_INDEXES, max_indexes=MAX_INDEXES_IN_MEMORY,
+                 max_chunks=MAX_CHUNKS_IN_MEMORY):
+        self.max_unreferenced = max_unreferenced
+        self.max_indexes = max_indexes
+        self.max_chunks = max_chunks
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def get_or_build(self, key, name, build, docs, holder_id=None):
+        """
+        Returns the entry for `key`, calling `build()` -> (vector_store, embedding_stats)
+        only if no session has indexed the same content yet. Concurrent sessions
+        uploading the same document wait for a single build. With `holder_id`,
+        the entry is held for that holder before it is returned, so it cannot be
+        evicted before the caller's lease takes it over. Raises
+        IndexCapacityError if a new index would exceed the memory limits.
+        """
+        with self._lock:
+            entry = self._lookup(key, holder_id)
+            if entry is not None:
+                return entry
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        try:
+            with build_lock:
+                with self._lock:
+                    entry = self._lookup(key, holder_id)
+                    if entry is None:
+                        # Checked before the (expensive) build, and again when the entry is added.
+                        self._make_room(name, len(docs))
+                if entry is None:
+                    vector_store, embedding_stats = build()
+                    entry = IndexEntry(key, name, vector_store, docs, embedding_stats)
+                    with self._lock:
+                        self._make_room(name, entry.chunk_count)
+                        self._entries[key] = entry
+                        if holder_id is not None:
+                            entry.holders.add(holder_id)
+                        self._evict()
+        finally:
+            # Also after a failed build, so the lock objects don't pile up.
+            with self._lock:
+                if self._build_locks.get(key) is build_lock:
+                    del self._build_locks[key]
+        return entry
+
+    def _lookup(self, key, holder_id):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.last_used = time.time()
+            if holder_id is not None:
+                entry.holders.add(holder_id)
+        return entry
+
+    def _make_room(self, name, chunk_count):
+        """Evicts unreferenced entries until an index of `chunk_count` chunks fits the limits."""
+        unreferenced = sorted(
+            (entry for entry in self._entries.values() if not entry.holders),
+            key=lambda entry: entry.last_used,
+        )
+        chunks = sum(entry.chunk_count for entry in self._entries.values())
+        while len(self._entries) >= self.max_indexes or chunks + chunk_count > self.max_chunks:
+            if not unreferenced:
+                raise IndexCapacityError(
+                    f"Cannot index '{name}' ({chunk_count} chunks): the open chapters already use "
+                    f"{len(self._entries)} of {self.max_indexes} indexes and {chunks} of "
+                    f"{self.max_chunks} chunks in memory."
+                )
+            entry = unreferenced.pop(0)
+            del self._entries[entry.key]
+            chunks -= entry.chunk_count
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.last_used = time.time()
+            return entry
+
+    def entries(self):
+        """All registered entries, sorted by name."""
+        with self._lock:
+            return sorted(self._entries.values(), key=lambda entry: entry.name.casefold())
+
+    def acquire(self, holder_id, keys):
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.holders.add(holder_id)
+                    entry.last_used = time.time()
+
+    def release(self, holder_id, keys):
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.holders.discard(holder_id)
+            self._evict()
+
+    def _evict(self):
+        unreferenced = sorted(
+            (entry for entry in self._entries.values() if not entry.holders),
+            key=lambda entry: entry.last_used,
+        )
+        for entry in unreferenced[:max(0, len(unreferenced) - self.max_unreferenced)]:
+            del self._entries[entry.key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "indexes": len(self._entries),
+                "chunks": sum(entry.chunk_count for entry in self._entries.values()),
+                "max_indexes": self.max_indexes,
+                "max_chunks": self.max_chunks,
+                "references": sum(len(entry.holders) for entry in self._entries.values()),
+            }
+
+    def lease(self):
+        return IndexLease(self)
+
+
+class IndexLease:
+    """
+    The set of indexes one session holds. Keep it in the session state: when the
+    session ends and the lease is garbage collected, its references are released.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.holder_id = uuid.uuid4().hex
+        self.keys = set()
+        weakref.finalize(self, registry.release, self.holder_id, self.keys)
+
+    def adopt(self, key):
+        """Records `key` as held; for entries the registry already holds for this lease (see get_or_build)."""
+        self.keys.add(key)
+
+    def hold(self, keys):
+        """Holds exactly `keys`, releasing whatever this lease held before."""
+        keys = set(keys)
+        self.registry.acquire(self.holder_id, keys - self.keys)
+        self.registry.release(self.holder_id, self.keys - keys)
+        self.keys.clear()
+        self.keys.update(keys)
+
+
+index_registry = IndexRegistry()
@@ -1,83 +1,206 @@
 # app/langchain_logic.py
 
-import os
 import streamlit as st
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain.chains import create_retrieval_chain
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.utils.json import parse_json_markdown
 from langchain.chains.combine_documents import create_stuff_documents_chain
 
-# Use our new, highly detailed Pydantic model
+from .document_processor import CHUNK_SIZE, CHUNK_OVERLAP
+from .index_cache import index_cache, compute_index_key
+from .embedding_cache import CachedEmbeddings, embedding_store
+from .prompt_registry import prompt_registry
+from .embeddings import get_embeddings
+from .retrieval import build_search_config, format_context, BudgetedRetriever, MergedRetriever
+from .hybrid_retrieval import HybridRetriever, get_reranker
+from .index_registry import index_registry
+from .vector_index import build_vector_store, tune_search_params
+from .llm_providers import get_chat_model, provider_for, provider_available
 from .models import FullLearningUnit
+from .tolerant_parsing import TolerantParser
 
-def load_knowledge_file(file_path):
-    """Reads a knowledge file and returns its content as a single string."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        print(f"Warning: Knowledge file not found at {file_path}")
-        return ""
+def get_prompt_hash(structured_output=True):
+    """A fingerprint of the current prompt, used to key cached responses."""
+    return prompt_registry.get_learning_module_prompt(structured_output).prompt_hash
 
-def get_learning_module_chain(llm, retriever):
+def _retrieve_unless_given(retriever):
+    """
+    Uses the documents passed as "context" if the caller already retrieved them
+    (e.g. to build a response cache key), otherwise retrieves them for "input".
+    """
+    def retrieve(inputs):
+        if inputs.get("context") is not None:
+            return inputs["context"]
+        return retriever.invoke(inputs["input"])
+    return RunnableLambda(retrieve)
+
+def _structured_document_chain(llm, prompt):
+    """
+    Like create_stuff_documents_chain, but the model answers through the
+    provider's structured output, so the answer is a dict (streamed as the
+    object parsed so far) instead of text.
+    """
+    stuff = RunnableLambda(lambda inputs: {**inputs, "context": format_context(inputs["context"])})
+    structured_llm = llm.with_structured_output(FullLearningUnit.model_json_schema())
+    return (stuff | prompt | structured_llm).with_config(run_name="stuff_documents_chain")
+
+def get_learning_module_chain(llm, retriever, structured_output=True):
     """
     Creates the complete RAG chain for generating a FullLearningUnit.
-    This version loads multiple knowledge files into the prompt.
+    The prompt with all knowledge files comes from the prompt registry.
+    The chain's output has the same "input", "context" and "answer" keys as
+    create_retrieval_chain, but "context" may also be passed in pre-retrieved.
+
+    With `structured_output`, the provider enforces the FullLearningUnit JSON
+    schema and the prompt carries no format instructions; "answer" is then a
+    dict. Otherwise it is the model's text. The returned parser takes either,
+    and repairs broken answers block by block with `llm` instead of failing
+    the whole module (see tolerant_parsing); its stats cover the answers
+    parsed with it.
     """
-    parser = PydanticOutputParser(pydantic_object=FullLearningUnit)
-    
-    # 1. Load the main prompt template
-    main_prompt_template = load_knowledge_file('app/prompts/learning_module_prompt.md')
-    
-    # 2. Load the content from all knowledge files
-    schluesselbegriffe_list = load_knowledge_file('app/prompts/schluesselbegriffe.txt')
-    themen_list = load_knowledge_file('app/prompts/themen.txt')
-    aspekte_list = load_knowledge_file('app/prompts/aspekte_der_allgemeinbildung.txt')
-    chapters_list = load_knowledge_file('app/prompts/chapters.txt')
-    
-    # 3. Inject the knowledge lists into the main prompt template
-    # This creates the final, complete "mega-prompt"
-    final_prompt_str = main_prompt_template.format(
-        schluesselbegriffe_list=schluesselbegriffe_list,
-        themen_list=themen_list,
-        aspekte_list=aspekte_list,
-        chapters_list=chapters_list,
-        # We still need to leave the other placeholders for the chain to fill
-        context="{context}",
-        input="{input}",
-        format_instructions="{format_instructions}"
-    )
+    # The prompt is compiled once and only rebuilt when a prompt file changes.
+    prompt = prompt_registry.get_learning_module_prompt(structured_output).prompt
+    parser = TolerantParser(FullLearningUnit, llm, model_name=getattr(llm, "model_name", "gpt-4o"))
 
-    prompt = PromptTemplate(
-        template=final_prompt_str,
-        input_variables=["context", "input"],
-        partial_variables={"format_instructions": parser.get_format_instructions()}
+    if structured_output:
+        document_chain = _structured_document_chain(llm, prompt)
+    else:
+        document_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
+    rag_chain = (
+        RunnablePassthrough.assign(context=_retrieve_unless_given(retriever))
+        .assign(answer=document_chain)
+        .with_config(run_name="retrieval_chain")
     )
-
-    document_chain = create_stuff_documents_chain(llm=llm, prompt=prompt)
-    rag_chain = create_retrieval_chain(retriever, document_chain)
     
     return rag_chain, parser
 
+def parse_partial_answer(answer_text):
+    """
+    Parses the JSON streamed so far (optionally inside a ```json fence) into a dict,
+    closing any open strings, lists and objects. Returns None if nothing usable
+    has arrived yet.
+    """
+    try:
+        data = parse_json_markdown(answer_text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
 # Keep the other functions (get_retriever, get_llm) as they are.
 # ... (get_retriever and get_llm functions remain the same) ...
-@st.cache_resource(show_spinner="Indexing document...")
-def get_retriever(_docs):
-    """Creates a FAISS vector store and retriever from document chunks."""
-    embeddings = OpenAIEmbeddings()
-    vector_store = FAISS.from_documents(_docs, embeddings)
-    return vector_store.as_retriever(search_kwargs={"k": 10})
+def _load_or_build_vector_store(index_key, docs, embeddings, index_type="Auto"):
+    """
+    Returns the FAISS vector store for `index_key` together with the chunk-level
+    embedding cache stats of the build (None if the index itself was cached).
+    The on-disk index cache is checked first, so repeat uploads survive process
+    restarts without re-embedding; edited documents only embed changed chunks.
+    Large corpora get an approximate, compressed index (see vector_index).
+    """
+    vector_store = index_cache.load(index_key, embeddings)
+    if vector_store is not None:
+        tune_search_params(vector_store.index)
+        return vector_store, None
+
+    cached_embeddings = CachedEmbeddings(embeddings, embeddings.model, embedding_store)
+    # Queries against the index go straight to the backend; only chunks go through the cache.
+    vector_store = build_vector_store(docs, embeddings, cached_embeddings.embed_documents, index_type)
+    index_cache.save(index_key, vector_store)
+    return vector_store, cached_embeddings.stats()
+
+def index_document(docs, name, embedding_backend="OpenAI", index_type="Auto", lease=None):
+    """
+    Adds a document's chunks to the shared, process-wide index registry and
+    returns its key. Sessions that upload the same content share one index.
+    `embedding_backend` is one of embeddings.EMBEDDING_BACKENDS and `index_type`
+    one of vector_index.INDEX_TYPES. With a `lease`, the index is held by it
+    from the moment it is registered. Raises index_registry.IndexCapacityError
+    if the registry's memory limits leave no room for it.
+    """
+    embeddings = get_embeddings(embedding_backend)
+    index_key = compute_index_key(docs, embeddings.model, CHUNK_SIZE, CHUNK_OVERLAP, index_type)
+    index_registry.get_or_build(
+        index_key,
+        name,
+        lambda: _load_or_build_vector_store(index_key, docs, embeddings, index_type),
+        docs,
+        holder_id=lease.holder_id if lease is not None else None,
+    )
+    if lease is not None:
+        lease.adopt(index_key)
+    return index_key
+
+def _entry_retriever(entry, mode, k, fetch_k, lambda_mult, score_threshold, rerank, metadata):
+    if mode == "Hybrid (BM25 + vector)":
+        reranker = get_reranker() if rerank else None
+        if rerank and reranker is None:
+            print("Warning: sentence-transformers is not installed, skipping reranking.")
+        return HybridRetriever(
+            vectorstore=entry.vector_store,
+            bm25=entry.bm25,
+            k=k,
+            fetch_k=fetch_k,
+            reranker=reranker,
+            metadata=metadata,
+        )
+    search_type, search_kwargs = build_search_config(mode, k, fetch_k, lambda_mult, score_threshold)
+    return entry.vector_store.as_retriever(
+        search_type=search_type,
+        search_kwargs=search_kwargs,
+        metadata=metadata,
+    )
+
+def build_retriever(index_keys, mode="Similarity", k=10, fetch_k=30, lambda_mult=0.5,
+                    score_threshold=0.5, max_context_tokens=None, model_name="gpt-4o", rerank=False):
+    """
+    Creates a retriever over one or several indexed documents from the registry.
+    Several documents are queried as one merged retriever. The embedding cache
+    stats of a single document's build are stored in `retriever.metadata`.
+
+    `mode` is one of retrieval.RETRIEVAL_MODES (see build_search_config for the
+    other search settings). The hybrid mode fuses BM25 keyword hits with vector
+    hits and, with `rerank`, reorders them with a local cross-encoder. With
+    `max_context_tokens`, the retrieved chunks are trimmed to that many tokens
+    of `model_name` before they reach the prompt.
+    """
+    entries = [index_registry.get(key) for key in index_keys]
+    entries = [entry for entry in entries if entry is not None]
+    if not entries:
+        return None
+
+    metadata = {"embedding_cache": entries[0].embedding_stats if len(entries) == 1 else None}
+    retrievers = [
+        _entry_retriever(entry, mode, k, fetch_k, lambda_mult, score_threshold, rerank, metadata)
+        for entry in entries
+    ]
+    if len(retrievers) == 1:
+        retriever = retrievers[0]
+    else:
+        retriever = MergedRetriever(retrievers=retrievers, k=k, metadata=metadata)
+    if max_context_tokens:
+        retriever = BudgetedRetriever(
+            retriever=retriever,
+            max_tokens=max_context_tokens,
+            model_name=model_name,
+            metadata=metadata,
+        )
+    return retriever
+
+def get_retriever(docs, name="document", embedding_backend="OpenAI", index_type="Auto", **retrieval_settings):
+    """
+    Creates (or loads from cache) the index for one document's chunks and returns
+    a retriever over it. See build_retriever for the retrieval settings.
+    """
+    index_key = index_document(docs, name, embedding_backend, index_type)
+    return build_retriever([index_key], **retrieval_settings)
 
 def get_llm(provider, model_name):
-    """Initializes and returns the selected LLM object."""
-    if provider == "OpenAI":
-        return ChatOpenAI(model=model_name, temperature=0.1)
-    elif provider == "Google":
-        if not os.environ.get("GOOGLE_API_KEY"):
-            st.error("Please add your GOOGLE_API_KEY to the .env file.")
-            st.stop()
-        return ChatGoogleGenerativeAI(model=model_name, temperature=0.1)
-    return None
\ No newline at end of file
+    """
+    Returns the shared, rate-limited chat model for `model_name` (see
+    app/llm_providers.py): one client per model and process, with retries and
+    a fallback model.
+    """
+    if provider == "Google" and not provider_available(provider):
+        st.error("Please add your GOOGLE_API_KEY to the .env file.")
+        st.stop()
+    if provider_for(model_name) != provider:
+        raise ValueError(f"Model '{model_name}' is not offered by {provider}.")
+    return get_chat_model(model_name)
@@ -0,0 +1,398 @@
+# app/llm_providers.py
+
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import List
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import ensure_config
+from pydantic import PrivateAttr
+
+from .prompt_registry import count_tokens
+from .tracing import span, start_span, usage_callback_handler, record_usage
+from .rate_limit import (
+    RateLimiter, call_with_retries, acall_with_retries, backoff_delay,
+    is_rate_limit_error, is_retryable_error,
+)
+
+MODEL_PROVIDERS = {
+    "gpt-4o": "OpenAI",
+    "gpt-4.1": "OpenAI",
+    "gemini-2.5-pro": "Google",
+    "gemini-2.5-flash": "Google",
+    "fake": "Fake",
+}
+
+# Used when the primary model is still rate limited (or unreachable) after all retries.
+FALLBACK_MODELS = {
+    "gpt-4o": "gemini-2.5-flash",
+}
+
+# (requests, tokens) per minute of the entry-level API tiers. PIMP_LLM_RPM and
+# PIMP_LLM_TPM override them for every model, e.g. for accounts on higher tiers.
+MODEL_LIMITS = {
+    "gpt-4o": (500, 30_000),
+    "gpt-4.1": (500, 30_000),
+    "gemini-2.5-pro": (150, 2_000_000),
+    "gemini-2.5-flash": (1000, 1_000_000),
+    "fake": (None, None),
+}
+
+MAX_RETRIES = int(os.environ.get("PIMP_LLM_MAX_RETRIES", "4"))
+MAX_CONNECTIONS = int(os.environ.get("PIMP_LLM_MAX_CONNECTIONS", "20"))
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get("PIMP_LLM_TIMEOUT", "180"))
+
+# Tokens reserved for the answer when a request is booked against the TPM budget;
+# corrected with the real usage once the answer arrives.
+EXPECTED_OUTPUT_TOKENS = 3000
+
+API_KEY_VARIABLES = {"OpenAI": "OPENAI_API_KEY", "Google": "GOOGLE_API_KEY"}
+
+# How `with_structured_output` asks the providers for schema-conforming JSON:
+# OpenAI's response_format json_schema and Gemini's response JSON schema.
+STRUCTURED_OUTPUT_METHOD = "json_schema"
+
+
+def provider_for(model_name):
+    try:
+        return MODEL_PROVIDERS[model_name]
+    except KeyError:
+        raise ValueError(f"Unknown model: '{model_name}'") from None
+
+
+def provider_available(provider):
+    variable = API_KEY_VARIABLES.get(provider)
+    return variable is None or bool(os.environ.get(variable))
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    An offline stand-in for a chat model. It answers with the given responses in
+    turn after a simulated latency and fails with a 429 at the given rate, so the
+    scheduler can be load-tested without API calls.
+    """
+
+    responses: List[str] = ['{"status": "ok"}']
+    latency_seconds: float = 0.2
+    rate_limit_probability: float = 0.0
+    chunk_size: int = 40
+    _counter: itertools.count = PrivateAttr(default_factory=itertools.count)
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _answer(self, messages):
+        if random.random() < self.rate_limit_probability:
+            raise FakeRateLimitError("Fake provider: 429 rate limit exceeded")
+        content = self.responses[next(self._counter) % len(self.responses)]
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+        usage = {"input_tokens": prompt_tokens, "output_tokens": len(content) // 4,
+                 "total_tokens": prompt_tokens + len(content) // 4}
+        return AIMessage(content=content, usage_metadata=usage, response_metadata={"model_name": "fake"})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self._answer(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self._answer(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_seconds)
+        answer = self._answer(messages)
+        for start in range(0, len(answer.content), self.chunk_size):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=answer.content[start:start + self.chunk_size]))
+        # Like the providers, the usage arrives with the last chunk.
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=answer.usage_metadata, response_metadata=answer.response_metadata))
+
+    def with_structured_output(self, schema, **kwargs):
+        """Parses the canned answers like a provider's structured output would (dicts for JSON schemas)."""
+        if isinstance(schema, type):
+            return self | PydanticOutputParser(pydantic_object=schema)
+        return self | JsonOutputParser()
+
+
+@lru_cache(maxsize=None)
+def get_http_client(provider):
+    """One connection pool per provider, shared by all its models and sessions."""
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=10.0),
+    )
+
+
+def create_chat_model(model_name, temperature=0.1):
+    """
+    The raw LangChain chat model. Its own retries are switched off; ResilientLLM
+    retries against the shared rate limiter instead.
+    """
+    provider = provider_for(model_name)
+    if provider == "OpenAI":
+        from langchain_openai import ChatOpenAI
+        # stream_usage: streamed answers report their tokens too (for the limiter and traces).
+        return ChatOpenAI(model=model_name, temperature=temperature, max_retries=0, stream_usage=True,
+                          timeout=REQUEST_TIMEOUT_SECONDS, http_client=get_http_client(provider))
+    if provider == "Google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=model_name, temperature=temperature, max_retries=0,
+                                      timeout=REQUEST_TIMEOUT_SECONDS)
+    return FakeChatModel(
+        latency_seconds=float(os.environ.get("PIMP_FAKE_LLM_LATENCY", "0.2")),
+        rate_limit_probability=float(os.environ.get("PIMP_FAKE_LLM_429_RATE", "0")),
+    )
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model_name):
+    """The process-wide limiter of a model, shared by all sessions and batch workers."""
+    with _limiters_lock:
+        if model_name not in _limiters:
+            rpm, tpm = MODEL_LIMITS.get(model_name, (None, None))
+            rpm = float(os.environ.get("PIMP_LLM_RPM") or 0) or rpm
+            tpm = float(os.environ.get("PIMP_LLM_TPM") or 0) or tpm
+            _limiters[model_name] = RateLimiter(rpm, tpm)
+        return _limiters[model_name]
+
+
+def configure_limits(model_name, requests_per_minute=None, tokens_per_minute=None):
+    """Replaces a model's limiter, e.g. with the budgets given on the command line."""
+    default_rpm, default_tpm = MODEL_LIMITS.get(model_name, (None, None))
+    with _limiters_lock:
+        _limiters[model_name] = RateLimiter(requests_per_minute or default_rpm, tokens_per_minute or default_tpm)
+    # Models built before keep the limiter they were created with.
+    get_chat_model.cache_clear()
+
+
+def _with_handler(config, handler):
+    """A copy of a runnable config with one more callback handler."""
+    config = ensure_config(config)
+    callbacks = config.get("callbacks")
+    if callbacks is None:
+        callbacks = [handler]
+    elif isinstance(callbacks, list):
+        callbacks = [*callbacks, handler]
+    else:  # a callback manager
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler, inherit=True)
+    return {**config, "callbacks": callbacks}
+
+
+def _prompt_text(input):
+    if isinstance(input, str):
+        return input
+    if hasattr(input, "to_string"):  # PromptValue
+        return input.to_string()
+    if isinstance(input, (list, tuple)):
+        return "\n".join(str(getattr(message, "content", message)) for message in input)
+    return str(input)
+
+
+class ResilientLLM(Runnable):
+    """
+    A chat model behind the model's shared rate limiter. Calls are booked against
+    the RPM/TPM budgets, rate-limit and transient errors are retried with
+    jittered backoff, and once the retries are used up the fallback model (if
+    any) takes over. Streams are only retried before their first chunk.
+    """
+
+    def __init__(self, model_name, runnable, limiter, fallback=None, max_retries=MAX_RETRIES):
+        self.model_name = model_name
+        self.runnable = runnable
+        self.limiter = limiter
+        self.fallback = fallback
+        self.max_retries = max_retries
+        self._stats = {"calls": 0, "retries": 0, "rate_limited": 0, "fallbacks": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _on_retry(self, error):
+        self._count("rate_limited" if is_rate_limit_error(error) else "retries")
+
+    def _estimate_tokens(self, input):
+        return count_tokens(_prompt_text(input), self.model_name) + EXPECTED_OUTPUT_TOKENS
+
+    def _record_usage(self, llm_span, usage, estimate):
+        used = record_usage(llm_span, self.model_name, usage)
+        if used:
+            self.limiter.adjust(used - estimate)
+
+    def _retry_hook(self, llm_span):
+        retries = 0
+
+        def on_retry(error):
+            nonlocal retries
+            retries += 1
+            self._on_retry(error)
+            llm_span.set(retries=retries)
+        return on_retry
+
+    def _should_fall_back(self, error):
+        return self.fallback is not None and is_retryable_error(error)
+
+    def invoke(self, input, config=None, **kwargs):
+        self._count("calls")
+        tokens = self._estimate_tokens(input)
+        with span(f"llm {self.model_name}", model=self.model_name) as llm_span:
+            usage = usage_callback_handler()
+            call_config = _with_handler(config, usage)
+            try:
+                result = call_with_retries(lambda: self.runnable.invoke(input, call_config, **kwargs), self.limiter,
+                                           self.max_retries, tokens=tokens, on_retry=self._retry_hook(llm_span))
+            except Exception as e:
+                if not self._should_fall_back(e):
+                    raise
+                self._count("fallbacks")
+                llm_span.set(fallback=self.fallback.model_name)
+                return self.fallback.invoke(input, config, **kwargs)
+            self._record_usage(llm_span, usage, tokens)
+            return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        self._count("calls")
+        tokens = self._estimate_tokens(input)
+        with span(f"llm {self.model_name}", model=self.model_name) as llm_span:
+            usage = usage_callback_handler()
+            call_config = _with_handler(config, usage)
+            try:
+                result = await acall_with_retries(lambda: self.runnable.ainvoke(input, call_config, **kwargs),
+                                                  self.limiter, self.max_retries, tokens=tokens,
+                                                  on_retry=self._retry_hook(llm_span))
+            except Exception as e:
+                if not self._should_fall_back(e):
+                    raise
+                self._count("fallbacks")
+                llm_span.set(fallback=self.fallback.model_name)
+                return await self.fallback.ainvoke(input, config, **kwargs)
+            self._record_usage(llm_span, usage, tokens)
+            return result
+
+    def stream(self, input, config=None, **kwargs):
+        self._count("calls")
+        tokens = self._estimate_tokens(input)
+        # Not a context manager: the generator may be resumed from another context.
+        llm_span = start_span(f"llm {self.model_name}", model=self.model_name, streaming=True)
+        on_retry = self._retry_hook(llm_span)
+        usage = usage_callback_handler()
+        call_config = _with_handler(config, usage)
+        try:
+            for attempt in range(self.max_retries + 1):
+                self.limiter.acquire(tokens)
+                chunks = iter(self.runnable.stream(input, call_config, **kwargs))
+                try:
+                    first = next(chunks)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    if attempt < self.max_retries and is_retryable_error(e):
+                        on_retry(e)
+                        delay = backoff_delay(attempt)
+                        if is_rate_limit_error(e):
+                            self.limiter.back_off(delay)
+                        else:
+                            time.sleep(delay)
+                        continue
+                    if not self._should_fall_back(e):
+                        raise
+                    self._count("fallbacks")
+                    llm_span.set(fallback=self.fallback.model_name)
+                    yield from self.fallback.stream(input, config, **kwargs)
+                    return
+                yield first
+                yield from chunks
+                self._record_usage(llm_span, usage, tokens)
+                return
+        finally:
+            llm_span.end()
+
+    async def astream(self, input, config=None, **kwargs):
+        self._count("calls")
+        tokens = self._estimate_tokens(input)
+        llm_span = start_span(f"llm {self.model_name}", model=self.model_name, streaming=True)
+        on_retry = self._retry_hook(llm_span)
+        usage = usage_callback_handler()
+        call_config = _with_handler(config, usage)
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.aacquire(tokens)
+                chunks = self.runnable.astream(input, call_config, **kwargs).__aiter__()
+                try:
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    if attempt < self.max_retries and is_retryable_error(e):
+                        on_retry(e)
+                        delay = backoff_delay(attempt)
+                        if is_rate_limit_error(e):
+                            self.limiter.back_off(delay)
+                        else:
+                            await asyncio.sleep(delay)
+                        continue
+                    if not self._should_fall_back(e):
+                        raise
+                    self._count("fallbacks")
+                    llm_span.set(fallback=self.fallback.model_name)
+                    async for chunk in self.fallback.astream(input, config, **kwargs):
+                        yield chunk
+                    return
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+                self._record_usage(llm_span, usage, tokens)
+                return
+        finally:
+            llm_span.end()
+
+    def with_structured_output(self, schema, method=STRUCTURED_OUTPUT_METHOD, **kwargs):
+        """
+        The same model (and fallback) with provider-native structured output for
+        `schema`. It shares the limiter and the counters of this model.
+        """
+        fallback = self.fallback.with_structured_output(schema, method=method, **kwargs) if self.fallback else None
+        structured = ResilientLLM(
+            self.model_name, self.runnable.with_structured_output(schema, method=method, **kwargs),
+            self.limiter, fallback, self.max_retries,
+        )
+        structured._stats, structured._stats_lock = self._stats, self._stats_lock
+        return structured
+
+    def stats(self):
+        """Call, retry and fallback counters of this model in this process."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name, with_fallback=True):
+    """
+    The shared, rate-limited chat model for `model_name`. Built once per process,
+    so every session reuses the same client and connection pool.
+    """
+    fallback = None
+    fallback_name = FALLBACK_MODELS.get(model_name) if with_fallback else None
+    if fallback_name and provider_available(provider_for(fallback_name)):
+        fallback = get_chat_model(fallback_name, with_fallback=False)
+    return ResilientLLM(model_name, create_chat_model(model_name), get_limiter(model_name), fallback)
@@ -0,0 +1,250 @@
+# app/markdown_renderer.py
+
+import urllib.parse
+from pydantic import TypeAdapter, ValidationError
+
+from .models import FullLearningUnit, AbuNewsDocument
+
+# All markup is defined once here as templates. Their bound `format` methods are
+# looked up a single time at import, and every renderer appends to a list that is
+# joined once at the end instead of growing a string piece by piece.
+
+IFRAME_BASE_URL = "https://allgemeinbildung.github.io/textbox/answers.html?"
+
+_iframe = (
+    '{prefix}<iframe src="{url}" style="border:0px #ffffff none;" name="myiFrame" scrolling="yes" '
+    'frameborder="1" marginheight="0px" marginwidth="0px" height="{height}" width="100%" allowfullscreen></iframe>'
+).format
+_audio = '{prefix}<audio controls><source src="{url}"></audio>'.format
+
+# FullLearningUnit templates
+_frontmatter = (
+    '---\ntopic: {topic}\nchapter: {chapter}\ntype: {type}\nsource: {source}\nsummary: "{summary}"\n---\n'
+    '# {title}\n'
+).format
+_objectives_intro = "\n>[!info] Worum geht es?\n> {}\n>>[!success] Lernziele\n".format
+_objective = ">> - {}\n".format
+_keywords_aspects = "\n>#### Schlüsselbegriffe\n> {}\n\n>#### Aspekte der Allgemeinbildung\n> {}\n".format
+_question_callout = "\n>[!question] {}\n".format
+_importance_header = "\n>[!info] Warum ist das wichtig?\n"
+_bullet = "> - {}\n".format
+_radio_callout = "\n>[!hint] **Radiobeitrag** \n{}\n".format
+_media_source = "> Quelle: [Originalquelle]({})\n>>[!quote] Beantworten Sie folgende Verständnisfragen:\n".format
+_answers_header = "\n>[!success]- Antworten\n"
+_solutions_header = "\n%-%-%-\n\n# LP-MATERIAL\n>[!warning] {} - Lösungsvorschläge\n".format
+_solution = "> {0}. **Antwort zu Frage {0}:** {1}\n".format
+_deep_dive_header = "\n# {}\n\n>[!abstract] Auftrag\n> {}\n".format
+_nested_radio = ">>[!hint] **Radiobeitrag** \n{}\n".format
+_text_types_header = "\n## Textsorten\n"
+_writing_assignment = (
+    "\n### {0}\n>[!info] **[[{0}]]**\n> Ziel: {1}\n"
+    ">>[!note]- {0} erfassen \n>>#### Schritt-für-Schritt Anleitung\n"
+).format
+_writing_assignment_footer = ">>\n>>[[{}#✔ Bewertung]]\n".format
+
+# AbuNewsDocument templates
+_callout = ">[!{}] {}".format
+_nested_callout = ">>[!{}] {}".format
+_quoted_line = "> {}".format
+_nested_bullet = ">> - {}".format
+_heading = "{} {}".format
+_wiki_link = "[[{}]]".format
+_audio_callout = ">[!{}] {} {}".format
+_audio_source = ">Quelle: [{}]({})".format
+
+_STRIP_BRACKETS = str.maketrans("", "", "[]")
+
+
+def build_iframe_url(assignment_id, sub_id, questions):
+    """Builds the answers.html URL that shows `questions` as an interactive worksheet."""
+    params = {'assignmentId': assignment_id, 'subIds': sub_id}
+    for i, q_text in enumerate(questions, 1):
+        params[f'question{i}'] = q_text
+    return IFRAME_BASE_URL + urllib.parse.urlencode(params)
+
+
+def render_interactive_block(block):
+    """Helper function to render an interactive questions block to an iframe string."""
+    url = build_iframe_url(block.assignment_id, block.sub_id, block.questions)
+    return _iframe(prefix=">", url=url, height="450px") + "\n"
+
+
+# --- FullLearningUnit ---
+
+def _render_header(module, out):
+    fm = module.frontmatter
+    out.append(_frontmatter(topic=fm.topic, chapter=fm.chapter, type=fm.type, source=fm.source,
+                            summary=fm.summary, title=module.title))
+
+def _render_objectives(module, out):
+    obj_block = module.objectives_block
+    out.append(_objectives_intro(obj_block.introduction))
+    out.extend(map(_objective, obj_block.objectives))
+    out.append(_keywords_aspects(', '.join(obj_block.keywords), ', '.join(obj_block.aspects)))
+
+def _render_activation(module, out):
+    act_block = module.activation_questions
+    out.append(_question_callout(act_block.title))
+    out.append(render_interactive_block(act_block))
+
+def _render_importance(module, out):
+    out.append(_importance_header)
+    out.extend(map(_bullet, module.importance_block.points))
+
+def _render_media(module, out):
+    media = module.media_block
+    if media.audio_url:
+        out.append(_radio_callout(_audio(prefix=">", url=media.audio_url)))
+    out.append(_media_source(media.source_url))
+    out.append(render_interactive_block(media.comprehension_questions))
+
+def _render_answers(module, out):
+    out.append(_answers_header)
+    out.append(_iframe(prefix=">", url=module.answers_block.iframe_url, height="400px") + "\n")
+
+def _render_solutions(module, out):
+    solutions = module.solution_suggestions
+    out.append(_solutions_header(solutions.answer_key_name))
+    out.extend(_solution(i, sol) for i, sol in enumerate(solutions.solutions, 1))
+
+def _render_deep_dive(module, out):
+    deep_dive = module.language_deep_dive
+    audio_url = module.media_block.audio_url
+    out.append(_deep_dive_header(deep_dive.title, deep_dive.instruction))
+    if audio_url:
+        out.append(_nested_radio(_audio(prefix=">>", url=audio_url)))
+    out.append(_text_types_header)
+    for assign in deep_dive.writing_assignments:
+        out.append(_writing_assignment(assign.text_type, assign.objective))
+        out.append(render_interactive_block(assign.guidance_questions))
+        out.append(_writing_assignment_footer(assign.text_type))
+
+# The document's sections in output order, with the FullLearningUnit fields each one needs.
+SECTIONS = [
+    (("frontmatter", "title"), _render_header),
+    (("objectives_block",), _render_objectives),
+    (("activation_questions",), _render_activation),
+    (("importance_block",), _render_importance),
+    (("media_block",), _render_media),
+    (("answers_block",), _render_answers),
+    (("solution_suggestions",), _render_solutions),
+    (("language_deep_dive", "media_block"), _render_deep_dive),
+]
+
+def render_module_to_markdown(module):
+    """Takes a FullLearningUnit object and converts it to a markdown string."""
+    out = []
+    for _, render in SECTIONS:
+        render(module, out)
+    return "".join(out)
+
+def render_partial_module(partial_data, finished=False):
+    """
+    Renders the leading sections of a FullLearningUnit that is still being streamed.
+
+    Args:
+        partial_data: The dict parsed so far from the (incomplete) JSON answer.
+        finished: Whether the stream has ended, i.e. the last field is complete too.
+
+    A field counts as complete once a later field has started (the model writes
+    the keys in schema order) and it validates. Rendering stops at the first
+    section that is not complete yet, so content only ever grows at the end.
+    """
+    field_names = list(FullLearningUnit.model_fields)
+    present = [name for name in field_names if name in partial_data]
+
+    complete = {}
+    for name in present:
+        if name == present[-1] and not finished:
+            break
+        annotation = FullLearningUnit.model_fields[name].annotation
+        try:
+            complete[name] = TypeAdapter(annotation).validate_python(partial_data[name])
+        except ValidationError:
+            break
+
+    module = FullLearningUnit.model_construct(**complete)
+    out = []
+    for required, render in SECTIONS:
+        if not all(name in complete for name in required):
+            break
+        render(module, out)
+    return "".join(out)
+
+
+# --- AbuNewsDocument ---
+
+def _value_or(value, default):
+    """The LLM sometimes writes the string 'None' instead of leaving a field empty."""
+    return value if value and value.lower() != 'none' else default
+
+def _render_info_section(section, out):
+    out.append(_callout(section.type, section.title))
+    if section.content:
+        out.extend(_quoted_line(line.strip()) for line in section.content.strip().split('\n'))
+    if section.nested_block:
+        out.append(">")
+        out.append(_nested_callout(section.nested_block.type, section.nested_block.title))
+        out.extend(_nested_bullet(item.strip()) for item in section.nested_block.content_list)
+
+def _render_link_list_section(section, out):
+    out.append(_heading("####", section.title))
+    if section.items:
+        out.append(", ".join(_wiki_link(item.translate(_STRIP_BRACKETS).strip()) for item in section.items))
+
+def _render_iframe_section(section, out):
+    out.append(_callout("question", section.title))
+    details = section.iframe_details
+    if details:
+        url = build_iframe_url(details.assignmentId, details.subIds, details.questions)
+        out.append(_iframe(prefix="", url=url, height=details.height))
+
+def _render_audio_section(section, out):
+    block_type = _value_or(section.block_type, 'hint')
+    out.append(_audio_callout(block_type, section.title, _audio(prefix=">", url=section.audio_url)))
+    out.append(_audio_source(_value_or(section.source_text, 'Quelle'), _value_or(section.source_url, '#')))
+    details = section.nested_quote_iframe_details
+    if section.nested_quote_title and details:
+        out.append(">")
+        out.append(_nested_callout("quote", section.nested_quote_title))
+        url = build_iframe_url(details.assignmentId, details.subIds, details.questions)
+        out.append(_iframe(prefix=">> ", url=url, height=details.height))
+
+_SECTION_RENDERERS = {
+    'info': _render_info_section,
+    'keywords': _render_link_list_section,
+    'general_education': _render_link_list_section,
+    'iframe_question': _render_iframe_section,
+    'audio': _render_audio_section,
+}
+
+def generate_markdown(data):
+    """Generates clean markdown for an AbuNewsDocument with correct spacing and list formatting."""
+    md_blocks = [_heading("#", data.title)]
+
+    for section in data.sections:
+        render = _SECTION_RENDERERS.get(section.type)
+        if render is None:
+            continue
+        block_parts = []
+        render(section, block_parts)
+        md_blocks.append("\n".join(block_parts))
+
+    # Handle Teacher Material section
+    tm = data.teacher_material
+    if tm:
+        md_blocks.append("%-%-%-")
+        if tm.warning_block:
+            tm_block_parts = [_heading("#", tm.title), _callout("warning", tm.warning_block.title)]
+            if tm.warning_block.content:
+                tm_block_parts.extend(_quoted_line(line.strip()) for line in tm.warning_block.content.strip().split('\n'))
+            md_blocks.append("\n".join(tm_block_parts))
+
+    return "\n\n".join(md_blocks)
+
+
+def render_document(document):
+    """Renders either document model to Markdown."""
+    if isinstance(document, AbuNewsDocument):
+        return generate_markdown(document)
+    return render_module_to_markdown(document)
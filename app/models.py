@@ -1,7 +1,7 @@
 # app/models.py
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class Frontmatter(BaseModel):
     """Defines the metadata frontmatter for the markdown file."""
@@ -66,4 +66,47 @@ class FullLearningUnit(BaseModel):
     media_block: MediaBlock
     answers_block: AnswersBlock
     solution_suggestions: SolutionSuggestions
-    language_deep_dive: DeepDiveLanguage
\ No newline at end of file
+    language_deep_dive: DeepDiveLanguage
+
+
+# --- ABUnews document (generated by the desktop tool in app.py) ---
+
+class NestedBlock(BaseModel):
+    type: str
+    title: str
+    content_list: List[str]
+
+class IframeDetails(BaseModel):
+    assignmentId: str
+    subIds: str
+    height: str
+    questions: List[str]
+
+class Section(BaseModel):
+    """A single, unified model for all section types."""
+    type: Literal["info", "keywords", "general_education", "iframe_question", "audio"]
+    title: str
+    content: Optional[str] = None
+    nested_block: Optional[NestedBlock] = None
+    items: Optional[List[str]] = None
+    iframe_details: Optional[IframeDetails] = None
+    block_type: Optional[str] = None
+    audio_url: Optional[str] = None
+    source_text: Optional[str] = None
+    source_url: Optional[str] = None
+    nested_quote_title: Optional[str] = None
+    nested_quote_iframe_details: Optional[IframeDetails] = None
+
+class WarningBlock(BaseModel):
+    title: str
+    content: str
+
+class TeacherMaterial(BaseModel):
+    title: str
+    warning_block: Optional[WarningBlock] = None # Make this optional to prevent validation errors
+
+class AbuNewsDocument(BaseModel):
+    """The root model, now using a list of the single, unified Section model."""
+    title: str
+    sections: List[Section]
+    teacher_material: Optional[TeacherMaterial] = None
@@ -0,0 +1,103 @@
+# app/module_store.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from .models import FullLearningUnit, AbuNewsDocument
+
+MODULE_STORE_PATH = os.environ.get("PIMP_MODULE_STORE_PATH", os.path.join("data", "modules.sqlite"))
+
+# Stored documents are tagged with their model name so they can be validated again.
+MODEL_TYPES = {model.__name__: model for model in (FullLearningUnit, AbuNewsDocument)}
+
+
+def load_document(kind, data):
+    """Validates a stored JSON document as the model it was saved from."""
+    return MODEL_TYPES[kind].model_validate_json(data)
+
+
+class ModuleStore:
+    """
+    A persistent archive of every generated document as validated JSON, so the
+    Markdown, DOCX and HTML outputs can be rebuilt without calling the LLM.
+    Identical documents are stored once.
+    """
+
+    def __init__(self, path=MODULE_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS modules ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, title TEXT NOT NULL, topic TEXT, "
+                "source TEXT, model TEXT, created REAL NOT NULL, data TEXT NOT NULL)"
+            )
+        return self._conn
+
+    def save(self, document, topic=None, source=None, model=None):
+        """Stores a FullLearningUnit or AbuNewsDocument and returns its ID."""
+        kind = type(document).__name__
+        if kind not in MODEL_TYPES:
+            raise ValueError(f"Cannot store documents of type '{kind}'.")
+        data = document.model_dump_json()
+        module_id = hashlib.sha256(f"{kind}\n{data}".encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR IGNORE INTO modules (id, kind, title, topic, source, model, created, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (module_id, kind, document.title, topic, source, model, time.time(), data),
+            )
+            conn.commit()
+        return module_id
+
+    def get(self, module_id):
+        """Returns the stored document with `module_id`, or None."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT kind, data FROM modules WHERE id = ?", (module_id,)
+            ).fetchone()
+        return load_document(*row) if row else None
+
+    def records(self, kind=None):
+        """
+        Yields the stored rows as dicts, oldest first, with the raw JSON under "data".
+        Only the small columns are read up front; each document's JSON is loaded
+        when its row is reached, so iterating holds one document at a time.
+        Documents are not validated here, so the rows can be handed to worker processes as they are.
+        """
+        query = "SELECT id, kind, title, topic, source, model, created FROM modules"
+        params = ()
+        if kind:
+            query += " WHERE kind = ?"
+            params = (kind,)
+        with self._lock:
+            cursor = self._connection().execute(query + " ORDER BY created", params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        for row in rows:
+            record = dict(zip(columns, row))
+            with self._lock:
+                data = self._connection().execute(
+                    "SELECT data FROM modules WHERE id = ?", (record["id"],)
+                ).fetchone()
+            if data is not None:  # deleted meanwhile
+                record["data"] = data[0]
+                yield record
+
+    def count(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM modules").fetchone()[0]
+
+
+module_store = ModuleStore()
@@ -1,33 +1,34 @@
 # app/output_generator.py
 
+import html
 import os
-from docx import Document as DocxDocument
-from docx.shared import Inches
+import re
+
+from .docx_writer import DocxWriter
 
 def create_docx(content_data, task_type):
     """Generates a .docx file from the structured data."""
-    doc = DocxDocument()
-    doc.add_heading(content_data.title, level=1)
+    doc = DocxWriter()
+    doc.heading(content_data.title, level=1)
 
     if task_type == "Lektion erstellen":
-        doc.add_heading("Learning Objectives", level=2)
+        doc.heading("Learning Objectives", level=2)
         for obj in content_data.learning_objectives:
-            doc.add_paragraph(obj, style='List Bullet')
-        doc.add_heading("Key Concepts", level=2)
+            doc.paragraph(obj, style='List Bullet')
+        doc.heading("Key Concepts", level=2)
         for concept in content_data.key_concepts:
-            doc.add_paragraph(concept, style='List Bullet')
-        doc.add_heading("Activities", level=2)
+            doc.paragraph(concept, style='List Bullet')
+        doc.heading("Activities", level=2)
         for activity in content_data.activities:
-            doc.add_paragraph(activity, style='List Bullet')
+            doc.paragraph(activity, style='List Bullet')
 
     elif task_type == "Quiz erstellen":
         for i, q in enumerate(content_data.questions, 1):
-            doc.add_heading(f"Question {i}: {q.question_text}", level=3)
+            doc.heading(f"Question {i}: {q.question_text}", level=3)
             for opt in q.options:
-                doc.add_paragraph(f"- {opt}")
-            p = doc.add_paragraph(f"Correct Answer: {q.correct_answer}")
-            p.runs[0].bold = True
-            doc.add_paragraph()
+                doc.paragraph(f"- {opt}")
+            doc.paragraph(f"Correct Answer: {q.correct_answer}", bold=True)
+            doc.paragraph()
     
     temp_dir = "temp"
     if not os.path.exists(temp_dir): os.makedirs(temp_dir)
@@ -56,4 +57,98 @@ def create_html(content_data, task_type):
     file_path = os.path.join(temp_dir, f"{content_data.title.replace(' ', '_')}.html")
     with open(file_path, "w", encoding='utf-8') as f:
         f.write(html)
-    return file_path
\ No newline at end of file
+    return file_path
+
+# --- HTML export of rendered Markdown modules ---
+
+_HTML_STYLE = (
+    "body { font-family: sans-serif; margin: 2em; max-width: 60em; } h1, h2, h3, h4 { color: #333; } "
+    ".callout { border-left: 4px solid #888; background: #f5f5f5; margin: 1em 0; padding: 0.5em 1em; } "
+    ".callout .callout { background: #fff; } .callout-title { font-weight: bold; } "
+    ".info { border-color: #2a7ae2; } .success { border-color: #2e9e44; } .question { border-color: #d48a00; } "
+    ".warning { border-color: #d9534f; } .hint, .quote, .note, .abstract { border-color: #7a5ac8; }"
+)
+_html_head = '<!DOCTYPE html><html><head><meta charset="utf-8"><title>{}</title><style>{}</style></head><body>'.format
+
+_FRONTMATTER = re.compile(r'\A---\n.*?\n---\n', re.DOTALL)
+_CALLOUT = re.compile(r'\[!(\w+)\]-?\s*(.*)')
+_HEADING = re.compile(r'(#{1,6})\s+(.*)')
+# Embedded players are written as raw HTML and must not be escaped.
+_RAW_HTML = re.compile(r'>?\s*(<(iframe|audio)\b.*?</\2>)')
+_INLINE = [
+    (re.compile(r'\*\*(.+?)\*\*'), r'<strong>\1</strong>'),
+    (re.compile(r'\*(.+?)\*'), r'<em>\1</em>'),
+    (re.compile(r'\[\[([^\]#|]*)[^\]]*\]\]'), r'\1'),
+    (re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)'), r'<a href="\2">\1</a>'),
+]
+
+
+def _inline_html(text):
+    parts = []
+    position = 0
+    for match in _RAW_HTML.finditer(text):
+        parts.append(_inline_text(text[position:match.start()]))
+        parts.append(match.group(1))
+        position = match.end()
+    parts.append(_inline_text(text[position:]))
+    return "".join(parts)
+
+
+def _inline_text(text):
+    text = html.escape(text, quote=False)
+    for pattern, replacement in _INLINE:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def markdown_to_html(markdown_text, title):
+    """
+    Converts a rendered module (FullLearningUnit or AbuNewsDocument Markdown) to a
+    standalone HTML page. Callouts (`>[!type] title`) become nested boxes.
+    """
+    out = [_html_head(html.escape(title), _HTML_STYLE)]
+    open_callouts = 0
+    in_list = False
+
+    for raw_line in _FRONTMATTER.sub("", markdown_text, count=1).split("\n"):
+        level = len(raw_line) - len(raw_line.lstrip(">"))
+        line = raw_line[level:].strip()
+        callout = _CALLOUT.match(line)
+        is_item = line.startswith("- ")
+
+        if in_list and not is_item:
+            out.append("</ul>")
+            in_list = False
+        # A callout opens the box of its own quote level; other lines stay inside it.
+        keep_open = level - 1 if callout else level
+        while open_callouts > keep_open:
+            if in_list:
+                out.append("</ul>")
+                in_list = False
+            out.append("</div>")
+            open_callouts -= 1
+
+        if callout:
+            out.append(f'<div class="callout {callout.group(1).lower()}">'
+                       f'<p class="callout-title">{_inline_html(callout.group(2))}</p>')
+            open_callouts += 1
+        elif not line:
+            continue
+        elif line == "%-%-%-":
+            out.append("<hr>")
+        elif heading := _HEADING.match(line):
+            depth = len(heading.group(1))
+            out.append(f"<h{depth}>{_inline_html(heading.group(2))}</h{depth}>")
+        elif is_item:
+            if not in_list:
+                out.append("<ul>")
+                in_list = True
+            out.append(f"<li>{_inline_html(line[2:])}</li>")
+        else:
+            out.append(f"<p>{_inline_html(line)}</p>")
+
+    if in_list:
+        out.append("</ul>")
+    out.extend(["</div>"] * open_callouts)
+    out.append("</body></html>")
+    return "\n".join(out)
@@ -0,0 +1,162 @@
+# app/prompt_registry.py
+
+import hashlib
+import os
+import threading
+from functools import lru_cache
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import PydanticOutputParser
+
+from .models import FullLearningUnit
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken ships with langchain-openai, but stay usable without it
+    tiktoken = None
+
+LEARNING_MODULE_PROMPT_PATH = 'app/prompts/learning_module_prompt.md'
+
+# Replaces the format instructions when the provider enforces the JSON schema
+# itself (structured output): the schema is sent with the request, not in the prompt.
+NATIVE_FORMAT_NOTE = "The response is a JSON object; its schema is enforced by the API. Fill in every field."
+
+KNOWLEDGE_FILES = {
+    "schluesselbegriffe_list": 'app/prompts/schluesselbegriffe.txt',
+    "themen_list": 'app/prompts/themen.txt',
+    "aspekte_list": 'app/prompts/aspekte_der_allgemeinbildung.txt',
+    "chapters_list": 'app/prompts/chapters.txt',
+}
+
+
+def load_knowledge_file(file_path):
+    """Reads a knowledge file and returns its content as a single string."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Warning: Knowledge file not found at {file_path}")
+        return ""
+
+
+def _mtime(file_path):
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def _encoding(model_name):
+    """
+    The model's tiktoken encoding, or None if there is none: tiktoken doesn't
+    know the model (e.g. Gemini), is not installed, or cannot download the
+    encoding file (no network). Cached, so a failed download is not retried
+    on every call.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except Exception:
+        return None
+
+
+def count_tokens(text, model_name="gpt-4o"):
+    """
+    Counts the tokens of `text` with the model's tiktoken encoding. Falls back to
+    the usual ~4 characters per token estimate when there is no encoding for
+    the model (see _encoding).
+    """
+    encoding = _encoding(model_name)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4
+
+
+class CompiledPrompt:
+    """A prompt whose static parts (template, knowledge lists, format instructions) are filled in once."""
+
+    def __init__(self, prompt, parser):
+        self.prompt = prompt
+        self.parser = parser
+        # The static prefix: everything the LLM sees before the per-request context.
+        self.static_text = prompt.format(context="", input="")
+        self.prompt_hash = hashlib.sha256(self.static_text.encode("utf-8")).hexdigest()
+        self.token_count = count_tokens(self.static_text)
+
+
+class PromptRegistry:
+    """
+    Compiles prompts once per process and only recompiles them when one of their
+    source files changes on disk (by mtime).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._texts = {}
+        self._compiled = {}
+        self._format_instructions = {}
+
+    def load_text(self, file_path):
+        """Returns the content of a prompt file, re-reading it only after it changed."""
+        mtime = _mtime(file_path)
+        with self._lock:
+            cached = self._texts.get(file_path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        text = load_knowledge_file(file_path)
+        with self._lock:
+            self._texts[file_path] = (mtime, text)
+        return text
+
+    def format_instructions(self, model):
+        """Returns the (cached) PydanticOutputParser format instructions for a model class."""
+        with self._lock:
+            if model not in self._format_instructions:
+                self._format_instructions[model] = PydanticOutputParser(pydantic_object=model).get_format_instructions()
+            return self._format_instructions[model]
+
+    def get_learning_module_prompt(self, structured_output=False):
+        """
+        Returns the CompiledPrompt for a FullLearningUnit: the main template with
+        all knowledge files injected. The static instructions come first and the
+        per-request context and topic last, so providers can cache the prefix.
+        With `structured_output`, the schema's format instructions are left out
+        because the provider enforces the schema (see NATIVE_FORMAT_NOTE).
+        """
+        source_files = [LEARNING_MODULE_PROMPT_PATH, *KNOWLEDGE_FILES.values()]
+        mtimes = tuple(_mtime(path) for path in source_files)
+        cache_key = ("learning_module", structured_output)
+        with self._lock:
+            cached = self._compiled.get(cache_key)
+            if cached is not None and cached[0] == mtimes:
+                return cached[1]
+
+        parser = PydanticOutputParser(pydantic_object=FullLearningUnit)
+        knowledge = {name: self.load_text(path) for name, path in KNOWLEDGE_FILES.items()}
+
+        # Inject the knowledge lists into the main prompt template.
+        # This creates the final, complete "mega-prompt"
+        final_prompt_str = self.load_text(LEARNING_MODULE_PROMPT_PATH).format(
+            **knowledge,
+            # We still need to leave the other placeholders for the chain to fill
+            context="{context}",
+            input="{input}",
+            format_instructions="{format_instructions}"
+        )
+        prompt = PromptTemplate(
+            template=final_prompt_str,
+            input_variables=["context", "input"],
+            partial_variables={
+                "format_instructions": NATIVE_FORMAT_NOTE if structured_output
+                else self.format_instructions(FullLearningUnit)
+            }
+        )
+        compiled = CompiledPrompt(prompt, parser)
+
+        with self._lock:
+            self._compiled[cache_key] = (mtimes, compiled)
+        return compiled
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,159 @@
+# app/rate_limit.py
+
+import asyncio
+import random
+import threading
+import time
+
+TRANSIENT_STATUS_CODES = {408, 409, 500, 502, 503, 504}
+
+
+def is_rate_limit_error(error):
+    """Best-effort check whether an exception from an LLM provider is a 429 / quota error."""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    name = type(error).__name__
+    message = str(error).lower()
+    return (
+        "RateLimit" in name
+        or "ResourceExhausted" in name
+        or "429" in message
+        or "rate limit" in message
+        or "quota" in message
+    )
+
+
+def is_transient_error(error):
+    """Timeouts, dropped connections and 5xx answers, which usually succeed when retried."""
+    if getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES:
+        return True
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return any(marker in name for marker in ("Timeout", "Connection", "ServiceUnavailable", "InternalServerError"))
+
+
+def is_retryable_error(error):
+    return is_rate_limit_error(error) or is_transient_error(error)
+
+
+def backoff_delay(attempt, base_delay=2.0):
+    """Exponential backoff with jitter, so that callers limited together do not retry together."""
+    return base_delay * (2 ** attempt) * (0.5 + random.random())
+
+
+class TokenBucket:
+    """
+    A bucket refilled at `per_minute / 60` units per second, holding at most
+    `capacity` units. `reserve` takes the units right away and returns how long
+    the caller has to wait until the bucket would have held them, so waiting
+    callers are served in order and a request larger than the capacity still passes.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0 if per_minute else 0.0
+        self.capacity = capacity if capacity is not None else (per_minute or 0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        if not self.rate:
+            return 0.0
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= amount
+        return max(0.0, -self._tokens / self.rate)
+
+    def adjust(self, amount):
+        """Takes (or with a negative amount, returns) units after the fact."""
+        self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class RateLimiter:
+    """
+    Keeps request starts below a requests-per-minute budget and, optionally, the
+    estimated tokens below a tokens-per-minute budget. Requests are spaced out
+    evenly; tokens may be spent in bursts of up to one minute's budget. When the
+    provider answers with a rate-limit error, `back_off` pauses all callers.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute, capacity=1)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=0):
+        """Books a request of `tokens` and returns the seconds to wait before starting it."""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+            return max(delay, self._paused_until - now)
+
+    def acquire(self, tokens=0):
+        """Blocks until the caller may start its next request."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens=0):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def adjust(self, tokens):
+        """Corrects the token budget once the real usage of a request is known."""
+        with self._lock:
+            self.tokens.adjust(tokens)
+
+    def back_off(self, seconds):
+        """Delays every request that has not started yet by at least `seconds`."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def call_with_retries(func, limiter, max_retries=5, base_delay=2.0, tokens=0, on_retry=None):
+    """
+    Calls `func()` after acquiring a slot for `tokens` from `limiter`. Rate-limit
+    and transient errors are retried with exponential, jittered backoff; other
+    errors are raised.
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire(tokens)
+        try:
+            return func()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable_error(e):
+                raise
+            delay = _schedule_retry(e, limiter, attempt, max_retries, base_delay, on_retry)
+            if not is_rate_limit_error(e):
+                time.sleep(delay)
+
+
+async def acall_with_retries(func, limiter, max_retries=5, base_delay=2.0, tokens=0, on_retry=None):
+    """Async variant of `call_with_retries`; `func()` returns an awaitable."""
+    for attempt in range(max_retries + 1):
+        await limiter.aacquire(tokens)
+        try:
+            return await func()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable_error(e):
+                raise
+            delay = _schedule_retry(e, limiter, attempt, max_retries, base_delay, on_retry)
+            if not is_rate_limit_error(e):
+                await asyncio.sleep(delay)
+
+
+def _schedule_retry(error, limiter, attempt, max_retries, base_delay, on_retry):
+    """
+    Computes the backoff for a failed attempt. A rate-limit error pauses every
+    caller of the limiter; a transient error only delays the failed request.
+    """
+    delay = backoff_delay(attempt, base_delay)
+    kind = "Rate limited" if is_rate_limit_error(error) else f"{type(error).__name__}"
+    print(f"{kind}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+    if is_rate_limit_error(error):
+        limiter.back_off(delay)
+    if on_retry is not None:
+        on_retry(error)
+    return delay
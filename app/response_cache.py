@@ -0,0 +1,139 @@
+# app/response_cache.py
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+RESPONSE_CACHE_PATH = os.environ.get("PIMP_RESPONSE_CACHE_PATH", os.path.join("cache", "responses.sqlite"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("PIMP_RESPONSE_CACHE_TTL_DAYS", "30")) * 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("PIMP_RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+# Cosine similarity above which two topics count as the same request.
+SIMILARITY_THRESHOLD = 0.95
+
+
+def normalize_topic(topic):
+    """Case-folds the topic and collapses whitespace and trailing punctuation."""
+    return re.sub(r"\s+", " ", topic.casefold()).strip(" .!?;:")
+
+
+def chunk_ids(docs):
+    """Stable IDs of the retrieved chunks, independent of the retrieval order."""
+    return sorted(hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:16] for doc in docs)
+
+
+def make_cache_keys(model_name, prompt_hash, topic, docs):
+    """
+    Returns (key, scope). The key identifies one exact request; the scope groups
+    requests that differ only in the topic wording, for similarity matching.
+    """
+    scope = hashlib.sha256(
+        "\n".join([model_name, prompt_hash, *chunk_ids(docs)]).encode("utf-8")
+    ).hexdigest()
+    key = hashlib.sha256(f"{scope}\n{normalize_topic(topic)}".encode("utf-8")).hexdigest()
+    return key, scope
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """
+    A persistent cache of raw LLM answers in front of the generation chain, with a
+    time-to-live and a maximum number of entries (least recently used go first).
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, scope TEXT NOT NULL, topic TEXT NOT NULL, "
+                "topic_vector BLOB, answer TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)")
+        return self._conn
+
+    def get(self, key, scope, topic_vector=None):
+        """
+        Returns the cached answer for `key`. If there is none and a topic vector is
+        given, the most similar topic in the same scope is used instead.
+        """
+        with self._lock:
+            conn = self._connection()
+            oldest = time.time() - self.ttl_seconds
+            row = conn.execute(
+                "SELECT key, answer FROM responses WHERE key = ? AND created >= ?", (key, oldest)
+            ).fetchone()
+
+            if row is None and topic_vector is not None:
+                best_similarity = SIMILARITY_THRESHOLD
+                for candidate_key, answer, blob in conn.execute(
+                    "SELECT key, answer, topic_vector FROM responses "
+                    "WHERE scope = ? AND created >= ? AND topic_vector IS NOT NULL", (scope, oldest)
+                ):
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    similarity = _cosine(topic_vector, vector)
+                    if similarity >= best_similarity:
+                        best_similarity, row = similarity, (candidate_key, answer)
+
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), row[0]))
+            conn.commit()
+            self.hits += 1
+            return row[1]
+
+    def put(self, key, scope, topic, answer, topic_vector=None):
+        """Stores an answer and evicts expired and least recently used entries."""
+        blob = array("f", topic_vector).tobytes() if topic_vector is not None else None
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, topic, topic_vector, answer, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, scope, topic, blob, answer, now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.commit()
+
+    def stats(self):
+        """Returns the hit/miss counters of this process."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,100 @@
+# app/retrieval.py
+
+from typing import List
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+from .prompt_registry import count_tokens
+
+RETRIEVAL_MODES = ["Similarity", "MMR", "Score threshold", "Hybrid (BM25 + vector)"]
+
+
+def build_search_config(mode, k=10, fetch_k=30, lambda_mult=0.5, score_threshold=0.5):
+    """
+    Maps a retrieval mode from the UI to the `search_type` and `search_kwargs`
+    of a vector store retriever.
+
+    - Similarity: the k nearest chunks.
+    - MMR: k chunks picked from the fetch_k nearest, trading relevance against
+      redundancy (lambda_mult 1.0 = pure relevance, 0.0 = maximum diversity).
+    - Score threshold: up to k chunks whose relevance score is at least score_threshold.
+    """
+    if mode == "MMR":
+        return "mmr", {"k": k, "fetch_k": max(fetch_k, k), "lambda_mult": lambda_mult}
+    if mode == "Score threshold":
+        return "similarity_score_threshold", {"k": k, "score_threshold": score_threshold}
+    return "similarity", {"k": k}
+
+
+def format_context(docs):
+    """Joins retrieved chunks into prompt context the same way the stuff-documents chain does."""
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def trim_to_token_budget(docs, max_tokens, model_name="gpt-4o"):
+    """
+    Keeps the highest-ranked chunks that fit into `max_tokens`. Chunks are taken in
+    retrieval order; one that doesn't fit is skipped so a smaller one can still be used.
+    """
+    kept = []
+    used = 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content, model_name)
+        if used + tokens > max_tokens:
+            continue
+        kept.append(doc)
+        used += tokens
+    return kept
+
+
+def context_stats(docs, static_tokens, model_name="gpt-4o"):
+    """Per-request numbers on the input tokens sent to the LLM."""
+    context_tokens = sum(count_tokens(doc.page_content, model_name) for doc in docs)
+    return {
+        "chunks_sent": len(docs),
+        "context_tokens": context_tokens,
+        "prompt_tokens": static_tokens + context_tokens,
+    }
+
+
+class BudgetedRetriever(BaseRetriever):
+    """Wraps a retriever and trims its results to a context token budget."""
+
+    retriever: BaseRetriever
+    max_tokens: int
+    model_name: str = "gpt-4o"
+
+    @property
+    def vectorstore(self):
+        return self.retriever.vectorstore
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return trim_to_token_budget(docs, self.max_tokens, self.model_name)
+
+
+class MergedRetriever(BaseRetriever):
+    """
+    Queries several per-document retrievers as one. Their rankings are combined
+    with reciprocal rank fusion, which works for every retrieval mode because it
+    only needs ranks, not comparable scores.
+    """
+
+    retrievers: List[BaseRetriever]
+    k: int = 10
+    rrf_k: int = 60
+
+    @property
+    def vectorstore(self):
+        return self.retrievers[0].vectorstore
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        fused = {}
+        for retriever in self.retrievers:
+            docs = retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+            for rank, doc in enumerate(docs):
+                key = (doc.page_content, doc.metadata.get("source"), doc.metadata.get("page"))
+                score = fused.get(key, (0.0, doc))[0] + 1 / (self.rrf_k + rank + 1)
+                fused[key] = (score, doc)
+        ranked = sorted(fused.values(), key=lambda item: item[0], reverse=True)
+        return [doc for _, doc in ranked[:self.k]]
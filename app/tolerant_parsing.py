@@ -0,0 +1,296 @@
+# app/tolerant_parsing.py
+
+import asyncio
+import json
+import re
+import threading
+import typing
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.utils.json import parse_json_markdown
+
+from .block_generation import BLOCK_PROMPT_PATH
+from .prompt_registry import prompt_registry, count_tokens
+from .retrieval import format_context
+from .tracing import span
+
+MAX_REPAIR_ATTEMPTS = 2
+# Invalid values longer than this are cut when they are shown to the LLM again.
+MAX_INVALID_CHARS = 2000
+
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_FENCE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+
+def repair_json(text):
+    """
+    Parses an LLM's JSON answer, repairing what commonly goes wrong: a code fence
+    or chatter around the object, trailing commas, raw line breaks inside strings
+    and output that was cut off (open strings, lists and objects are closed).
+
+    Returns:
+        A tuple (data, repaired) where repaired tells whether the answer needed
+        any repair. Raises ValueError if nothing parseable is left.
+    """
+    fenced = _FENCE.match(text)
+    try:
+        return json.loads(fenced.group(1) if fenced else text), False
+    except ValueError:
+        pass
+
+    candidates = [text]
+    start = text.find("{")
+    if start > 0:
+        candidates.append(text[start:])
+    candidates += [_TRAILING_COMMA.sub(r'\1', candidate) for candidate in candidates]
+    for candidate in candidates:
+        try:
+            data = parse_json_markdown(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data, True
+    raise ValueError("The answer contains no parseable JSON object.")
+
+
+class Failure(NamedTuple):
+    """
+    The smallest block of an answer that failed validation. `path` leads to it
+    from the root (field names and list indexes). If the failing value is not a
+    model itself, `model` wraps it as its only field, `field`.
+    """
+    path: Tuple
+    model: type
+    field: Optional[str]
+    errors: str
+
+
+def _model_of(annotation):
+    """(model, is_list) if the annotation is a model or a list of models, else (None, False)."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    if typing.get_origin(annotation) in (list, List):
+        args = typing.get_args(annotation)
+        if args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            return args[0], True
+    return None, False
+
+
+@lru_cache(maxsize=None)
+def _field_model(model, name):
+    """
+    A one-field model, so a single scalar field can be re-requested on its own.
+    Cached, so the prompt registry's format instructions are built once per field.
+    """
+    field = model.model_fields[name]
+    return create_model(f"{model.__name__}_{name}", **{name: (field.annotation, field)})
+
+
+def _error_text(error):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or '(root)'}: {e['msg']}" for e in error.errors()
+    )
+
+
+def find_failures(model, data, path=()):
+    """
+    Validates `data` against `model` block by block and returns the smallest
+    failing blocks, so that the valid rest of an answer can be kept. Below the
+    root, a block with more than one failing part is returned as a whole.
+    """
+    try:
+        model.model_validate(data)
+        return []
+    except ValidationError as e:
+        if not isinstance(data, dict):
+            return [Failure(path, model, None, _error_text(e))]
+        root_errors = e
+
+    failures = []
+    for name, field in model.model_fields.items():
+        sub_path = path + (name,)
+        sub_model, is_list = _model_of(field.annotation)
+        if name not in data:
+            if field.is_required():
+                if sub_model is not None and not is_list:
+                    failures.append(Failure(sub_path, sub_model, None, "missing"))
+                else:
+                    failures.append(Failure(sub_path, _field_model(model, name), name, "missing"))
+            continue
+        value = data[name]
+        if sub_model is not None and not is_list:
+            failures += find_failures(sub_model, value, sub_path)
+        elif sub_model is not None and isinstance(value, list):
+            for i, item in enumerate(value):
+                failures += find_failures(sub_model, item, sub_path + (i,))
+        else:
+            try:
+                TypeAdapter(field.annotation).validate_python(value)
+            except ValidationError as e:
+                failures.append(Failure(sub_path, _field_model(model, name), name, _error_text(e)))
+    if not failures or (path and len(failures) > 1):
+        # Several broken parts of one block (or a validator on the whole block):
+        # one request for the block is cheaper than one per part.
+        return [Failure(path, model, None, _error_text(root_errors))]
+    return failures
+
+
+def _get(data, path):
+    for key in path:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
+
+
+def _set(data, path, value):
+    if not path:
+        return value
+    parent = data
+    for key in path[:-1]:
+        parent = parent[key]
+    parent[path[-1]] = value
+    return data
+
+
+def _path_text(path):
+    text = ""
+    for key in path:
+        text += f"[{key}]" if isinstance(key, int) else (f".{key}" if text else key)
+    return text or "(whole answer)"
+
+
+class TolerantParser:
+    """
+    Parses a structured answer without throwing the whole completion away over
+    one bad field: the JSON is repaired locally first, then every block is
+    validated on its own and only the blocks that still fail are requested
+    again from the LLM, each with a small prompt of its own.
+
+    Counters (see `stats`) record repaired answers, re-requested blocks, repair
+    attempts and the tokens wasted on discarded output and on the repairs.
+    """
+
+    def __init__(self, model, llm=None, model_name="gpt-4o", max_attempts=MAX_REPAIR_ATTEMPTS):
+        self.model = model
+        self.llm = llm
+        self.model_name = model_name
+        self.max_attempts = max_attempts
+        self._stats = {"answers": 0, "json_repaired": 0, "blocks_rerequested": 0, "repair_calls": 0,
+                       "failed": 0, "wasted_tokens": 0, "repair_tokens": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _tokens(self, text):
+        return count_tokens(text, self.model_name)
+
+    def _repair_prompt(self, failure, invalid_value):
+        invalid_text = json.dumps(invalid_value, ensure_ascii=False)[:MAX_INVALID_CHARS]
+        instruction = (
+            f"Only the part `{_path_text(failure.path)}` of the module ({failure.model.__doc__ or failure.model.__name__}). "
+            f"An earlier answer for this part was invalid ({failure.errors}). "
+            f"The invalid value was: {invalid_text}\n"
+            f"Return a corrected, complete version of this part."
+        )
+        return PromptTemplate(
+            template=prompt_registry.load_text(BLOCK_PROMPT_PATH),
+            input_variables=["context", "input"],
+            partial_variables={
+                "block_instruction": instruction,
+                "format_instructions": prompt_registry.format_instructions(failure.model),
+            },
+        )
+
+    async def _arepair(self, failure, invalid_value, context, topic):
+        prompt = self._repair_prompt(failure, invalid_value)
+        inputs = {"context": context, "input": topic}
+        prompt_tokens = self._tokens(prompt.format(**inputs))
+        last_error = None
+        for _ in range(self.max_attempts):
+            self._count("repair_calls")
+            answer = await (prompt | self.llm | StrOutputParser()).ainvoke(inputs)
+            self._count("repair_tokens", prompt_tokens + self._tokens(answer))
+            try:
+                data, _ = repair_json(answer)
+                block = failure.model.model_validate(data).model_dump()
+            except (ValueError, ValidationError) as e:
+                last_error = e
+                continue
+            return block[failure.field] if failure.field else block
+        raise OutputParserException(
+            f"Could not repair `{_path_text(failure.path)}` after {self.max_attempts} attempts: {last_error}"
+        )
+
+    async def aparse(self, answer, context="", topic=""):
+        """
+        Parses `answer` (text, or a dict from structured output) into
+        `self.model`. `context` and `topic` are what the answer was generated
+        from; the repair prompts need them again. The context may be given as
+        text or as the retrieved documents.
+        """
+        if not isinstance(context, str):
+            context = format_context(context)
+        self._count("answers")
+        try:
+            # Structured output arrives already parsed.
+            data, repaired = (answer, False) if isinstance(answer, dict) else repair_json(answer)
+        except ValueError as e:
+            self._count("failed")
+            self._count("wasted_tokens", self._tokens(answer))
+            raise OutputParserException(f"Failed to parse {self.model.__name__}: {e}", llm_output=answer) from e
+        if repaired:
+            self._count("json_repaired")
+
+        failures = find_failures(self.model, data)
+        if failures and self.llm is None:
+            self._count("failed")
+            raise OutputParserException(
+                f"Invalid {self.model.__name__}: "
+                + "; ".join(f"{_path_text(f.path)}: {f.errors}" for f in failures),
+                llm_output=answer,
+            )
+        if failures:
+            self._count("blocks_rerequested", len(failures))
+            invalid_values = [_get(data, failure.path) for failure in failures]
+            self._count("wasted_tokens", sum(
+                self._tokens(json.dumps(value, ensure_ascii=False)) for value in invalid_values if value is not None
+            ))
+            try:
+                blocks = await asyncio.gather(*(
+                    self._arepair(failure, value, context, topic) for failure, value in zip(failures, invalid_values)
+                ))
+            except Exception:
+                self._count("failed")
+                raise
+            for failure, block in zip(failures, blocks):
+                data = _set(data, failure.path, block)
+        return self.model.model_validate(data)
+
+    def parse(self, answer, context="", topic=""):
+        """Synchronous entry point for aparse, e.g. from a Streamlit script."""
+        with span("parse", model=self.model.__name__) as parse_span:
+            try:
+                # Fast path: valid answers need no event loop.
+                if isinstance(answer, dict):
+                    result = self.model.model_validate(answer)
+                else:
+                    result = self.model.model_validate_json(answer)
+            except ValueError:
+                parse_span.set(repaired=True)
+                return asyncio.run(self.aparse(answer, context, topic))
+            self._count("answers")
+            return result
+
+    def stats(self):
+        """The repair counters of this parser in this process."""
+        with self._stats_lock:
+            return dict(self._stats)
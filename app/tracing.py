@@ -0,0 +1,284 @@
+# app/tracing.py
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+
+TRACE_PATH = os.environ.get("PIMP_TRACE_PATH", os.path.join("data", "traces.jsonl"))
+# A local OpenTelemetry collector (OTLP over gRPC).
+OTEL_ENDPOINT = os.environ.get("PIMP_OTEL_ENDPOINT", "http://localhost:4317")
+
+# USD per million (input, output) tokens, for the cost estimate of a trace.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1": (2.00, 8.00),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+}
+
+_current_trace = contextvars.ContextVar("pimp_trace", default=None)
+_current_span = contextvars.ContextVar("pimp_span", default=None)
+
+
+class Span:
+    """One timed stage of a trace, with free-form attributes and token counters."""
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def seconds(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_usage(self, model_name, input_tokens, output_tokens):
+        """Adds an LLM call's tokens and their estimated cost to the span."""
+        input_price, output_price = MODEL_PRICES.get(model_name, (0.0, 0.0))
+        attributes = self.attributes
+        attributes["input_tokens"] = attributes.get("input_tokens", 0) + input_tokens
+        attributes["output_tokens"] = attributes.get("output_tokens", 0) + output_tokens
+        attributes["cost_usd"] = attributes.get("cost_usd", 0.0) + (
+            input_tokens * input_price + output_tokens * output_price) / 1e6
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start_ns - self.trace.start_ns) / 1e6, 2),
+            "ms": round(self.seconds * 1000, 2),
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    """Stands in for a span outside of any trace, so instrumented code needs no checks."""
+
+    def set(self, **attributes):
+        pass
+
+    def add_usage(self, model_name, input_tokens, output_tokens):
+        pass
+
+    def end(self):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """The spans of one unit of work, e.g. indexing an upload or generating one module."""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name, parent_id=None, **attributes):
+        span = Span(self, name, parent_id, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @property
+    def seconds(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def totals(self):
+        """Tokens and cost summed over all spans."""
+        totals = {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+        for span in self.spans:
+            for name in totals:
+                totals[name] += span.attributes.get(name, 0)
+        return totals
+
+    def rows(self):
+        """One row per span in start order, indented by depth, for a timing table."""
+        depth = {}
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            depth[span.span_id] = depth.get(span.parent_id, -1) + 1
+            rows.append({
+                "Stage": "  " * depth[span.span_id] + span.name,
+                "ms": round(span.seconds * 1000, 1),
+                "Tokens in": span.attributes.get("input_tokens"),
+                "Tokens out": span.attributes.get("output_tokens"),
+                "Cost (USD)": round(span.attributes["cost_usd"], 4) if "cost_usd" in span.attributes else None,
+            })
+        return rows
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": datetime.fromtimestamp(self.start_ns / 1e9, timezone.utc).isoformat(),
+            "seconds": round(self.seconds, 3),
+            "attributes": self.attributes,
+            "totals": self.totals(),
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def start_span(name, **attributes):
+    """
+    Starts a span in the current trace (a no-op outside of traces) without
+    making it the parent of later spans; call `end()` on it. For generators,
+    where a context manager would outlive its context.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return trace.start_span(name, _current_span.get(), **attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times the enclosed block as a span of the current trace; spans started inside become its children."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield NULL_SPAN
+        return
+    current = trace.start_span(name, _current_span.get(), **attributes)
+    token = _current_span.set(current.span_id)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def usage_callback_handler():
+    """A LangChain callback collecting the token usage of the LLM calls it is passed to."""
+    from langchain_core.callbacks import UsageMetadataCallbackHandler
+    return UsageMetadataCallbackHandler()
+
+
+def record_usage(target_span, model_name, handler):
+    """Adds the usage collected by `handler` to the span. Returns the total tokens (0 if unknown)."""
+    input_tokens = output_tokens = 0
+    for usage in handler.usage_metadata.values():
+        input_tokens += usage.get("input_tokens", 0)
+        output_tokens += usage.get("output_tokens", 0)
+    if input_tokens or output_tokens:
+        target_span.add_usage(model_name, input_tokens, output_tokens)
+    return input_tokens + output_tokens
+
+
+@lru_cache(maxsize=None)
+def _otel_tracer(endpoint):
+    """The OpenTelemetry tracer exporting to `endpoint`, or None if the SDK is not installed."""
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": "pimp"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, insecure=True)))
+    return provider.get_tracer("pimp")
+
+
+def otel_available():
+    return _otel_tracer(OTEL_ENDPOINT) is not None
+
+
+def _otel_attributes(attributes):
+    # OpenTelemetry only takes primitive values.
+    return {name: value for name, value in attributes.items()
+            if isinstance(value, (str, bool, int, float))}
+
+
+def export_otel(trace):
+    """Replays a finished trace as OpenTelemetry spans with their original timestamps."""
+    otel_tracer = _otel_tracer(OTEL_ENDPOINT)
+    if otel_tracer is None:
+        return False
+    from opentelemetry import trace as otel_trace
+
+    root = otel_tracer.start_span(trace.name, start_time=trace.start_ns,
+                                  attributes=_otel_attributes({**trace.attributes, **trace.totals()}))
+    exported = {None: root}
+    # Parents start before their children, so they are exported first.
+    for item in sorted(trace.spans, key=lambda s: s.start_ns):
+        parent = exported.get(item.parent_id, root)
+        otel_span = otel_tracer.start_span(item.name, context=otel_trace.set_span_in_context(parent),
+                                           start_time=item.start_ns, attributes=_otel_attributes(item.attributes))
+        otel_span.end(end_time=item.end_ns or trace.end_ns)
+        exported[item.span_id] = otel_span
+    root.end(end_time=trace.end_ns)
+    return True
+
+
+class Tracer:
+    """
+    Starts traces and writes every finished one as a JSON line to `path`
+    (None disables the file), optionally also to OpenTelemetry.
+    """
+
+    def __init__(self, path=TRACE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name, export_otel_spans=False, **attributes):
+        """Collects the spans started in the enclosed block (and its tasks) into a new trace."""
+        trace = Trace(name, attributes)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(None)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            trace.end_ns = time.time_ns()
+            self._write(trace)
+            if export_otel_spans:
+                export_otel(trace)
+
+    def _write(self, trace):
+        if not self.path:
+            return
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+tracer = Tracer()
@@ -0,0 +1,164 @@
+# app/vector_index.py
+
+import math
+import uuid
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+INDEX_TYPES = ["Auto", "Flat", "HNSW (int8)", "IVF (float16)", "IVF-PQ"]
+
+# Corpus sizes (in chunks) at which "Auto" switches to an approximate index.
+FLAT_MAX_VECTORS = 20_000
+HNSW_MAX_VECTORS = 200_000
+
+# Vectors are embedded and added in batches of this size, so the raw float32
+# matrix of a whole corpus never has to fit in memory at once.
+ADD_BATCH_SIZE = 4096
+
+# Upper bound on the vectors held in memory for IVF training.
+MAX_TRAINING_VECTORS = 32768
+
+
+def resolve_index_type(index_type, vector_count):
+    """Maps "Auto" to a concrete index type for a corpus of `vector_count` chunks."""
+    if index_type != "Auto":
+        return index_type
+    if vector_count <= FLAT_MAX_VECTORS:
+        return "Flat"
+    if vector_count <= HNSW_MAX_VECTORS:
+        return "HNSW (int8)"
+    return "IVF-PQ"
+
+
+def _pq_subquantizers(dimensions):
+    """The largest common PQ code size that divides the vector dimension."""
+    for m in (64, 48, 32, 24, 16, 12, 8, 4):
+        if dimensions % m == 0:
+            return m
+    return 1
+
+
+def _nlist(vector_count):
+    """
+    Number of IVF lists: FAISS's rule of thumb of ~4*sqrt(n), capped so that the
+    training sample still has the recommended 39 vectors per list.
+    """
+    return max(1, min(int(4 * math.sqrt(vector_count)), MAX_TRAINING_VECTORS // 39))
+
+
+def _training_minimum(index_type, vector_count):
+    """
+    The fewest vectors an index type can be trained on: one per IVF list, and
+    for IVF-PQ also the 256 centroids of each 8-bit subquantizer (at FAISS's
+    recommended 39 vectors per list).
+    """
+    if index_type == "IVF (float16)":
+        return _nlist(vector_count)
+    if index_type == "IVF-PQ":
+        return max(256, 39 * _nlist(vector_count))
+    return 0
+
+
+def index_factory_string(index_type, vector_count, dimensions):
+    """
+    Returns the faiss.index_factory description for an index type. IVF types
+    fall back to "Flat" for corpora too small to train them on.
+    """
+    if vector_count < _training_minimum(index_type, vector_count):
+        print(f"Warning: {vector_count} chunks are too few to train an {index_type} index, using Flat.")
+        return "Flat"
+    if index_type == "Flat":
+        return "Flat"
+    if index_type == "HNSW (int8)":
+        return "HNSW32,SQ8"
+    if index_type == "IVF (float16)":
+        return f"IVF{_nlist(vector_count)},SQfp16"
+    if index_type == "IVF-PQ":
+        return f"IVF{_nlist(vector_count)},PQ{_pq_subquantizers(dimensions)}"
+    raise ValueError(f"Unknown index type: '{index_type}'")
+
+
+def tune_search_params(index):
+    """
+    Sets the query-time accuracy knobs. They are not part of the saved index,
+    so this runs again after an index is loaded from the cache.
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        ivf.nprobe = max(1, min(ivf.nlist, ivf.nlist // 16))
+        # Needed for reconstruct(), which the MMR search uses.
+        ivf.make_direct_map()
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = 64
+    return index
+
+
+def _training_size(index, vector_count):
+    """
+    How many vectors to collect for training before anything is added. IVF
+    indexes need enough vectors for every list; scalar quantizers (HNSW int8)
+    only need a sample to learn the value ranges.
+    """
+    if index.is_trained:
+        return 0
+    try:
+        nlist = faiss.extract_index_ivf(index).nlist
+    except RuntimeError:
+        nlist = 0
+    return min(vector_count, max(ADD_BATCH_SIZE, 39 * nlist), MAX_TRAINING_VECTORS)
+
+
+def build_vector_store(docs, embeddings, embed_documents=None, index_type="Auto"):
+    """
+    Builds a FAISS vector store with an index type suited to the corpus size.
+    Chunks are embedded in batches; IVF indexes are trained on a leading sample
+    and then filled batch by batch.
+
+    Args:
+        docs: The document chunks.
+        embeddings: The embeddings object used for queries.
+        embed_documents: Function used to embed chunk texts (defaults to
+            embeddings.embed_documents), e.g. a cache-backed one.
+        index_type: One of INDEX_TYPES.
+    """
+    embed_documents = embed_documents or embeddings.embed_documents
+    docs = list(docs)
+    if not docs:
+        raise ValueError("Cannot build a vector store without documents.")
+    index_type = resolve_index_type(index_type, len(docs))
+
+    index = None
+    training_size = 0
+    pending = []
+    for start in range(0, len(docs), ADD_BATCH_SIZE):
+        batch = docs[start:start + ADD_BATCH_SIZE]
+        vectors = np.asarray(embed_documents([doc.page_content for doc in batch]), dtype=np.float32)
+
+        if index is None:
+            # The first batch tells us the vector dimension.
+            factory = index_factory_string(index_type, len(docs), vectors.shape[1])
+            index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+            training_size = _training_size(index, len(docs))
+
+        if not index.is_trained:
+            pending.append(vectors)
+            if sum(len(v) for v in pending) < training_size:
+                continue
+            vectors = np.concatenate(pending)
+            pending = []
+            index.train(vectors)
+        index.add(vectors)
+
+    ids = [str(uuid.uuid4()) for _ in docs]
+    docstore = InMemoryDocstore(dict(zip(ids, docs)))
+    return FAISS(
+        embedding_function=embeddings,
+        index=tune_search_params(index),
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
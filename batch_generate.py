@@ -0,0 +1,286 @@
+# batch_generate.py
+"""
+Headless batch generation of learning modules from a folder of chapters.
+
+Usage:
+    python batch_generate.py chapters/ manifest.json --out modules/ --concurrency 4 --rpm 30
+
+The manifest maps file names in the input folder to one topic or a list of topics:
+
+    {
+        "Kapitel_3.pdf": ["Die Gewaltentrennung in der Schweiz", "Das Parlament"],
+        "ABUnews_Jugendstrafrecht.docx": "Das Schweizer Jugendstrafrecht"
+    }
+
+Finished jobs are recorded in <out>/.batch_state.jsonl, so re-running the same
+command after a crash only generates the modules that are still missing.
+
+Each document is indexed when its first job starts and released from the
+shared index registry when its last job finishes. Jobs run in document order,
+so only the documents currently being worked on are held in memory.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app.config import load_api_keys
+from app.document_processor import iter_split_chunks, SUPPORTED_EXTENSIONS
+from app.langchain_logic import index_document, build_retriever, get_learning_module_chain, get_prompt_hash
+from app.index_registry import index_registry
+from app.response_cache import response_cache, make_cache_keys
+from app.block_generation import generate_learning_unit
+from app.markdown_renderer import render_module_to_markdown
+from app.llm_providers import configure_limits, get_chat_model, provider_available, MODEL_PROVIDERS
+from app.module_store import module_store
+from app.tracing import tracer, span
+
+STATE_FILE = ".batch_state.jsonl"
+
+
+def load_manifest(manifest_path, input_dir):
+    """Returns a list of (file path, topic) jobs from the manifest."""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    jobs = []
+    for file_name, topics in manifest.items():
+        path = os.path.join(input_dir, file_name)
+        if os.path.splitext(file_name)[1].lower() not in SUPPORTED_EXTENSIONS:
+            print(f"Skipping '{file_name}': unsupported file type.")
+            continue
+        if not os.path.exists(path):
+            print(f"Skipping '{file_name}': file not found in {input_dir}.")
+            continue
+        if isinstance(topics, str):
+            topics = [topics]
+        jobs.extend((path, topic) for topic in topics)
+    return jobs
+
+
+def job_key(path, topic):
+    return hashlib.sha256(f"{os.path.basename(path)}\n{topic.strip()}".encode("utf-8")).hexdigest()[:16]
+
+
+def output_name(path, topic, key):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    slug = re.sub(r'[^\w-]+', '_', topic.strip())[:40].strip('_')
+    return f"{stem}__{slug}__{key[:8]}.md"
+
+
+def load_completed(out_dir):
+    """Reads the keys of jobs that finished in a previous run."""
+    completed = set()
+    state_path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        return completed
+    with open(state_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crash can leave a half-written last line behind.
+                continue
+            if entry.get("status") == "done":
+                completed.add(entry["key"])
+    return completed
+
+
+class StateLog:
+    """Append-only JSONL log of finished jobs, safe to use from worker threads."""
+
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, STATE_FILE)
+        self._lock = threading.Lock()
+
+    def record(self, **entry):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def load_chunks(path, extract_workers):
+    with open(path, 'rb') as f:
+        return list(iter_split_chunks(os.path.basename(path), f, workers=extract_workers))
+
+
+class DocumentIndexes:
+    """
+    Indexes each document of the batch on first use and holds it in the shared
+    registry through its own lease until the document's last job is done.
+    """
+
+    def __init__(self, job_counts, extract_workers, export_otel=False):
+        self.extract_workers = extract_workers
+        self.export_otel = export_otel
+        self._remaining = dict(job_counts)
+        self._retrievers = {}
+        self._leases = {}
+        self._locks = {path: threading.Lock() for path in job_counts}
+        self._lock = threading.Lock()
+
+    def acquire(self, path):
+        """The retriever for `path`, indexing the document if no job has done so yet."""
+        with self._locks[path]:
+            retriever = self._retrievers.get(path)
+            if retriever is None:
+                name = os.path.basename(path)
+                lease = index_registry.lease()
+                with tracer.trace("ingest", export_otel_spans=self.export_otel, file=name):
+                    with span("load_and_split"):
+                        chunks = load_chunks(path, self.extract_workers)
+                    with span("index", chunks=len(chunks)):
+                        index_key = index_document(chunks, name, lease=lease)
+                retriever = build_retriever([index_key])
+                with self._lock:
+                    self._retrievers[path] = retriever
+                    self._leases[path] = lease
+                print(f"Indexed {name} ({len(chunks)} chunks).")
+            return retriever
+
+    def release(self, path):
+        """Marks one job of `path` as finished; after the last one the index is released."""
+        with self._lock:
+            self._remaining[path] -= 1
+            if self._remaining[path] > 0:
+                return
+            self._retrievers.pop(path, None)
+            lease = self._leases.pop(path, None)
+        if lease is not None:
+            lease.hold(())
+
+
+def generate_module(llm, retriever, topic, args):
+    """Returns the module and the repair stats of its answer (None in parallel mode)."""
+    if args.mode == "parallel":
+        module, _ = generate_learning_unit(llm, retriever, topic)
+        return module, None
+    rag_chain, parser = get_learning_module_chain(llm, retriever, args.structured_output)
+    with span("retrieval"):
+        context_docs = retriever.invoke(topic)
+    cache_key, cache_scope = make_cache_keys(args.model, get_prompt_hash(args.structured_output), topic, context_docs)
+    answer = None if args.force else response_cache.get(cache_key, cache_scope)
+    if answer is not None:
+        return parser.parse(answer), parser.stats()
+    result = rag_chain.invoke({"input": topic, "context": context_docs})
+    module = parser.parse(result['answer'], context=context_docs, topic=topic)
+    response_cache.put(cache_key, cache_scope, topic, module.model_dump_json())
+    return module, parser.stats()
+
+
+def run_job(path, topic, key, indexes, llm, args, state_log):
+    started = time.perf_counter()
+    try:
+        retriever = indexes.acquire(path)
+        with tracer.trace("batch_job", export_otel_spans=args.otel, file=os.path.basename(path), topic=topic,
+                          model=args.model, key=key):
+            # Rate limiting, retries and the fallback model are handled per LLM call by `llm`.
+            module, parse_stats = generate_module(llm, retriever, topic, args)
+            module_store.save(module, topic=topic, source=os.path.basename(path), model=args.model)
+            with span("render"):
+                markdown = render_module_to_markdown(module)
+    finally:
+        indexes.release(path)
+
+    out_path = os.path.join(args.out, output_name(path, topic, key))
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(markdown)
+    os.replace(tmp_path, out_path)
+
+    elapsed = time.perf_counter() - started
+    state_log.record(key=key, status="done", file=os.path.basename(path), topic=topic,
+                     output=os.path.basename(out_path), seconds=round(elapsed, 2), parsing=parse_stats)
+    return out_path, elapsed, parse_stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate learning modules for a folder of chapters.")
+    parser.add_argument("input_dir", help="Folder containing the PDF, TXT and DOCX chapters.")
+    parser.add_argument("manifest", help="JSON file mapping file names to one topic or a list of topics.")
+    parser.add_argument("--out", default="generated_modules", help="Output folder for the Markdown modules.")
+    parser.add_argument("--provider", default="OpenAI", choices=sorted(set(MODEL_PROVIDERS.values())),
+                        help="'Fake' (with --model fake) answers offline, for load tests.")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--mode", default="single", choices=["single", "parallel"],
+                        help="'parallel' requests the module's blocks concurrently.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of modules generated at the same time.")
+    parser.add_argument("--rpm", type=float, help="Maximum LLM requests started per minute (default: the model's tier limit).")
+    parser.add_argument("--tpm", type=float, help="Maximum LLM tokens per minute (default: the model's tier limit).")
+    parser.add_argument("--force", action="store_true", help="Ignore the response cache and always call the LLM.")
+    parser.add_argument("--no-structured-output", dest="structured_output", action="store_false",
+                        help="Put the schema's format instructions into the prompt instead of using the "
+                             "provider's native structured output.")
+    parser.add_argument("--otel", action="store_true",
+                        help="Also export the traces to a local OpenTelemetry collector (see app/tracing.py).")
+    parser.add_argument("--extract-workers", type=int, default=1,
+                        help="Number of processes used to extract the pages of large PDFs.")
+    args = parser.parse_args(argv)
+
+    load_api_keys()
+    if MODEL_PROVIDERS.get(args.model) != args.provider:
+        parser.error(f"Model '{args.model}' is not offered by {args.provider}.")
+    if not provider_available(args.provider):
+        parser.error(f"No API key for {args.provider}: add it to the .env file.")
+    os.makedirs(args.out, exist_ok=True)
+
+    jobs = load_manifest(args.manifest, args.input_dir)
+    completed = load_completed(args.out)
+    pending = [(path, topic, job_key(path, topic)) for path, topic in jobs]
+    # In document order, so one document's jobs run together and its index can be released early.
+    pending = sorted((job for job in pending if job[2] not in completed), key=lambda job: job[0])
+    print(f"{len(jobs)} jobs in manifest, {len(jobs) - len(pending)} already done, {len(pending)} to run.")
+    if not pending:
+        return 0
+
+    job_counts = {}
+    for path, _, _ in pending:
+        job_counts[path] = job_counts.get(path, 0) + 1
+    # Each document's topics share one index, built when its first job starts.
+    indexes = DocumentIndexes(job_counts, args.extract_workers, export_otel=args.otel)
+
+    if args.rpm or args.tpm:
+        configure_limits(args.model, args.rpm, args.tpm)
+    llm = get_chat_model(args.model)
+    state_log = StateLog(args.out)
+
+    failures = 0
+    parse_totals = {}
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {
+            pool.submit(run_job, path, topic, key, indexes, llm, args, state_log): (path, topic)
+            for path, topic, key in pending
+        }
+        for future in as_completed(futures):
+            path, topic = futures[future]
+            try:
+                out_path, elapsed, parse_stats = future.result()
+                print(f"[done] {os.path.basename(path)} / {topic} -> {out_path} ({elapsed:.1f}s)")
+                for name, value in (parse_stats or {}).items():
+                    parse_totals[name] = parse_totals.get(name, 0) + value
+            except Exception as e:
+                failures += 1
+                print(f"[failed] {os.path.basename(path)} / {topic}: {e}")
+
+    print(f"Finished: {len(pending) - failures} generated, {failures} failed.")
+    stats = llm.stats()
+    print(f"LLM calls: {stats['calls']}, rate limited: {stats['rate_limited']}, "
+          f"other retries: {stats['retries']}, fallbacks: {stats['fallbacks']}")
+    if parse_totals:
+        print(f"Answer repairs: {parse_totals['json_repaired']} JSON repaired, "
+              f"{parse_totals['blocks_rerequested']} blocks requested again in {parse_totals['repair_calls']} calls "
+              f"({parse_totals['repair_tokens']} tokens), {parse_totals['wasted_tokens']} tokens discarded")
+    if tracer.path:
+        print(f"Per-stage timings and tokens of every job: {tracer.path}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
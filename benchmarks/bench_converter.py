@@ -0,0 +1,124 @@
+# benchmarks/bench_converter.py
+"""
+Measures the Markdown-to-DOCX converter on a large multi-module Markdown file.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_converter --modules 500
+    python -m benchmarks.bench_converter path/to/course.md
+
+Without a file, a synthetic course of concatenated modules is written to a
+temporary file first. Parsing is measured separately from DOCX generation, with
+the peak Python memory of the streaming parse.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import urllib.parse
+from app.docx_writer import new_document
+
+from converter import parse_markdown, emit_docx
+
+QUESTIONS_URL = "https://allgemeinbildung.github.io/textbox/answers.html?" + urllib.parse.urlencode(
+    {"assignmentId": "bench", "subIds": "A", **{f"question{i}": f"**Frage {i}:** *Begründen Sie Ihre Antwort.*"
+                                                 for i in range(1, 8)}}
+)
+
+MODULE_TEMPLATE = """---
+topic: ["Recht", "Jugend"]
+chapter: ["3 Recht"]
+type: news
+source: ABUnews
+summary: "Modul {n}"
+---
+# ABUnews - Modul {n}
+
+>[!info] Worum geht es?
+> Eine Einleitung mit **fetten** Begriffen und [[Wiki-Links]].
+>>[!success] Lernziele
+>> - Sie können das Thema erklären.
+>> - Sie können die Folgen beurteilen.
+
+>#### Schlüsselbegriffe
+> [[Strafrecht]], [[Jugend]]
+
+>[!question] Aktivierung
+><iframe src="{url}" style="border:0px #ffffff none;" height="450px" width="100%" allowfullscreen></iframe>
+
+>[!hint] **Radiobeitrag**
+><audio controls><source src="https://example.org/modul{n}.mp3"></audio>
+> Quelle: [Originalquelle](https://example.org)
+
+%-%-%-
+
+# LP-MATERIAL
+>[!warning] Lösungsvorschläge
+> 1. **Antwort zu Frage 1:** Eine Antwort.
+"""
+
+
+def write_synthetic_course(path, modules):
+    with open(path, "w", encoding="utf-8") as f:
+        for n in range(modules):
+            f.write(MODULE_TEMPLATE.format(n=n, url=QUESTIONS_URL))
+
+
+def _parse(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for _ in parse_markdown(f))
+
+
+def bench_parse(path):
+    started = time.perf_counter()
+    blocks = _parse(path)
+    seconds = time.perf_counter() - started
+    # Memory is traced in a second pass, since tracing slows the parser down.
+    tracemalloc.start()
+    _parse(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return blocks, seconds, peak
+
+
+def bench_convert(path):
+    started = time.perf_counter()
+    document = new_document()
+    with open(path, "r", encoding="utf-8") as f:
+        emit_docx(document, parse_markdown(f))
+    emit_seconds = time.perf_counter() - started
+    with tempfile.TemporaryFile() as out:
+        document.save(out)
+    return emit_seconds, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("markdown", nargs="?", help="A (multi-module) Markdown file.")
+    parser.add_argument("--modules", type=int, default=200, help="Modules in the synthetic course (without a file).")
+    parser.add_argument("--parse-only", action="store_true", help="Skip the DOCX generation.")
+    args = parser.parse_args(argv)
+
+    path = args.markdown
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix=".md")
+        os.close(handle)
+        write_synthetic_course(path, args.modules)
+    try:
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"{path}: {size_mb:.1f} MB\n")
+
+        blocks, seconds, peak = bench_parse(path)
+        print(f"parse    {blocks:>8} blocks {seconds:>8.3f}s {size_mb / seconds:>8.1f} MB/s  peak {peak / 1e3:.0f} kB")
+        if not args.parse_only:
+            emit_seconds, total_seconds = bench_convert(path)
+            print(f"convert  {'':>15} {total_seconds:>8.3f}s {size_mb / total_seconds:>8.1f} MB/s  "
+                  f"(of which save {total_seconds - emit_seconds:.3f}s)")
+    finally:
+        if args.markdown is None:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_docx.py
+"""
+Compares building a printable worksheet through python-docx's object layer with
+the fragment-cloning DocxWriter.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_docx --questions 100 --repeat 20
+
+The worksheet consists of one shaded box per ten questions and every question
+with its answer-line table, like the output of converter.py.
+"""
+
+import argparse
+import io
+import time
+from docx import Document
+from docx.shared import Pt
+from docx.oxml.ns import qn
+from docx.oxml import OxmlElement
+
+from app.docx_writer import DocxWriter, new_document
+
+
+def legacy_worksheet(questions):
+    """The previous implementation: every element is built through python-docx."""
+    document = Document()
+    for start in range(0, len(questions), 10):
+        table = document.add_table(rows=1, cols=1)
+        table.style = 'Table Grid'
+        cell = table.cell(0, 0)
+        shading_elm = OxmlElement('w:shd')
+        shading_elm.set(qn('w:val'), 'clear')
+        shading_elm.set(qn('w:fill'), 'EAEAEA')
+        cell._tc.get_or_add_tcPr().append(shading_elm)
+        cell.add_paragraph().add_run(f"Block {start // 10 + 1}").bold = True
+        cell.add_paragraph("Lesen Sie den Text und beantworten Sie die Fragen.")
+
+        document.add_heading("Fragen zum Beantworten", level=3)
+        for i, question in enumerate(questions[start:start + 10], start + 1):
+            document.add_paragraph().add_run(f"{i}. {question}").bold = True
+            table = document.add_table(rows=4, cols=1)
+            for row in table.rows:
+                p = row.cells[0].paragraphs[0]
+                p.paragraph_format.space_before = Pt(0)
+                p.paragraph_format.space_after = Pt(4)
+    return document
+
+
+def writer_worksheet(questions):
+    writer = DocxWriter(new_document())
+    for start in range(0, len(questions), 10):
+        writer.shaded_box(f"Block {start // 10 + 1}", ["Lesen Sie den Text und beantworten Sie die Fragen."])
+        writer.heading("Fragen zum Beantworten", level=3)
+        for i, question in enumerate(questions[start:start + 10], start + 1):
+            writer.paragraph(f"{i}. {question}", bold=True)
+            writer.answer_lines()
+    return writer.document
+
+
+def bench(build, questions, repeat):
+    build_seconds = save_seconds = 0.0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        document = build(questions)
+        built = time.perf_counter()
+        document.save(io.BytesIO())
+        build_seconds += built - started
+        save_seconds += time.perf_counter() - built
+    return build_seconds * 1000 / repeat, save_seconds * 1000 / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    questions = [f"Wie beurteilen Sie Aspekt {i} des Themas? Begründen Sie Ihre Antwort." for i in range(args.questions)]
+    # Warm up: loads the template and builds the fragments once, as a long-running process would.
+    writer_worksheet(questions[:1])
+
+    print(f"Worksheet with {args.questions} questions, mean of {args.repeat} runs\n")
+    print(f"{'writer':<12} {'build ms':>9} {'save ms':>9} {'total ms':>9}")
+    results = {}
+    for name, build in (("python-docx", legacy_worksheet), ("DocxWriter", writer_worksheet)):
+        build_ms, save_ms = bench(build, questions, args.repeat)
+        results[name] = build_ms + save_ms
+        print(f"{name:<12} {build_ms:>9.1f} {save_ms:>9.1f} {build_ms + save_ms:>9.1f}")
+    print(f"\nSpeed-up: {results['python-docx'] / results['DocxWriter']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_embeddings.py
+"""
+Compares the indexing throughput of the embedding backends.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_embeddings path/to/chapter.pdf
+    python -m benchmarks.bench_embeddings --synthetic 2000
+
+The OpenAI backend is skipped when OPENAI_API_KEY is not set, the local backend
+when sentence-transformers is not installed. The embedding cache is bypassed so
+every chunk is really embedded.
+"""
+
+import argparse
+import os
+import time
+
+from app.config import load_api_keys
+from app.document_processor import iter_split_chunks
+from app.embeddings import EMBEDDING_BACKENDS, get_embeddings
+
+
+def synthetic_chunks(count):
+    sentence = ("Das Jugendstrafrecht gilt für Personen, die zwischen dem vollendeten 10. und dem "
+                "vollendeten 18. Altersjahr eine strafbare Handlung begangen haben. ")
+    return [f"Abschnitt {i}: " + sentence * 10 for i in range(count)]
+
+
+def load_texts(path):
+    with open(path, 'rb') as f:
+        return [doc.page_content for doc in iter_split_chunks(os.path.basename(path), f)]
+
+
+def bench_backend(backend, texts):
+    started = time.perf_counter()
+    embeddings = get_embeddings(backend)
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    seconds = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "model": embeddings.model,
+        "dimensions": len(vectors[0]) if vectors else 0,
+        "load_seconds": load_seconds,
+        "embed_seconds": seconds,
+        "chunks_per_second": len(texts) / seconds if seconds else float("inf"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("document", nargs="?", help="A PDF, TXT or DOCX file to split and embed.")
+    parser.add_argument("--synthetic", type=int, default=500, help="Number of synthetic chunks if no document is given.")
+    args = parser.parse_args(argv)
+
+    load_api_keys()
+    texts = load_texts(args.document) if args.document else synthetic_chunks(args.synthetic)
+    print(f"Embedding {len(texts)} chunks ({sum(len(t) for t in texts) / 1000:.0f}k characters)\n")
+
+    print(f"{'backend':<28} {'dims':>5} {'load s':>8} {'embed s':>8} {'chunks/s':>9}")
+    for backend in EMBEDDING_BACKENDS:
+        if backend == "OpenAI" and not os.environ.get("OPENAI_API_KEY"):
+            print(f"{backend:<28} skipped (no OPENAI_API_KEY)")
+            continue
+        try:
+            result = bench_backend(backend, texts)
+        except ImportError as e:
+            print(f"{backend:<28} skipped ({e})")
+            continue
+        print(f"{backend:<28} {result['dimensions']:>5} {result['load_seconds']:>8.2f} "
+              f"{result['embed_seconds']:>8.2f} {result['chunks_per_second']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
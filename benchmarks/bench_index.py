@@ -0,0 +1,72 @@
+# benchmarks/bench_index.py
+"""
+Recall-vs-latency benchmark of the FAISS index types against the exact flat baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_index --vectors 200000 --dimensions 1536 --queries 200
+
+Vectors are synthetic and clustered (like chunks of many chapters), so the
+numbers are comparable between runs without any API calls.
+"""
+
+import argparse
+import time
+import faiss
+import numpy as np
+
+from app.vector_index import INDEX_TYPES, index_factory_string, tune_search_params, _training_size
+
+RECALL_AT = 10
+
+
+def synthetic_vectors(count, dimensions, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 500), dimensions)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), size=count)
+    vectors = centers[assignments] + 0.3 * rng.normal(size=(count, dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def build_index(index_type, vectors):
+    factory = index_factory_string(index_type, len(vectors), vectors.shape[1])
+    index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+    started = time.perf_counter()
+    if not index.is_trained:
+        index.train(vectors[:_training_size(index, len(vectors))])
+    index.add(vectors)
+    tune_search_params(index)
+    return index, factory, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    vectors = synthetic_vectors(args.vectors, args.dimensions)
+    queries = synthetic_vectors(args.queries, args.dimensions, seed=1)
+
+    baseline, _, _ = build_index("Flat", vectors)
+    _, truth = baseline.search(queries, RECALL_AT)
+
+    print(f"{args.vectors} vectors x {args.dimensions} dims, {args.queries} queries, recall@{RECALL_AT}\n")
+    print(f"{'index':<16} {'factory':<18} {'build s':>8} {'MB':>8} {'ms/query':>9} {'recall':>7}")
+    for index_type in INDEX_TYPES:
+        if index_type == "Auto":
+            continue
+        index, factory, build_seconds = build_index(index_type, vectors)
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        started = time.perf_counter()
+        _, found = index.search(queries, RECALL_AT)
+        ms_per_query = (time.perf_counter() - started) * 1000 / len(queries)
+
+        recall = np.mean([len(set(f) & set(t)) / RECALL_AT for f, t in zip(found, truth)])
+        print(f"{index_type:<16} {factory:<18} {build_seconds:>8.2f} {size_mb:>8.1f} {ms_per_query:>9.3f} {recall:>7.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end benchmark of the generation pipeline with a fake chat model and
+fake embeddings: no API calls, and the same numbers on every run.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pipeline --pages 10 50 200 --json results.json
+    python -m benchmarks.bench_pipeline --baseline results.json --tolerance 0.25
+
+For every corpus size, sample PDF, DOCX and TXT chapters with that many pages
+are generated from a fixed seed and run through the real code:
+
+- loading and splitting each file (iter_split_chunks, the body of
+  load_and_split_document without Streamlit's cache);
+- embedding the chunks and building the FAISS index (build_vector_store),
+  then querying it;
+- get_learning_module_chain against the retriever and a deterministic fake
+  chat model (--llm-latency simulates the provider), then TolerantParser;
+- render_module_to_markdown, generate_markdown (ABUnews) and
+  create_printable_word_doc.
+
+Each corpus size runs in a fresh process, so its peak RSS is its own. With
+--baseline, p95 latencies more than --tolerance above the baseline's are
+reported as regressions and the exit code is 1.
+
+A run must make no network calls, so that it works on an offline machine and
+its numbers don't depend on one. Tokens are counted with the ~4 characters
+per token estimate instead of tiktoken, whose encoding files may need a
+download, and any attempt to open an internet connection raises an error.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from docx import Document as DocxDocument
+
+from app.document_processor import iter_split_chunks
+from app.embeddings import get_embeddings, FAKE_EMBEDDING_BACKEND
+from app.langchain_logic import get_learning_module_chain
+from app.llm_providers import FakeChatModel, ResilientLLM
+from app.markdown_renderer import render_module_to_markdown, generate_markdown
+import app.prompt_registry as prompt_registry_module
+from app.rate_limit import RateLimiter
+from app.vector_index import build_vector_store
+from benchmarks.bench_render import synthetic_unit, synthetic_news_document
+from converter import create_printable_word_doc
+from workbook import peak_rss_mb
+
+SEED = 42
+LINES_PER_PAGE = 50
+TOPIC = "Das Schweizer Jugendstrafrecht und seine Schutzmassnahmen"
+
+WORDS = (
+    "Jugendstrafrecht Jugendliche Schutzmassnahme Strafe Erziehung Gericht Jugendanwaltschaft Gesetz "
+    "Verfahren Gewaltentrennung Parlament Bundesrat Gemeinde Kanton Verfassung Grundrecht Pflicht "
+    "Verantwortung Gesellschaft Arbeit Lehrvertrag Lohn Versicherung Miete Vertrag Konsum Schulden "
+    "Umwelt Klima Energie Mobilität Medien Demokratie Abstimmung Initiative Referendum Partei "
+    "die der das und mit für von zu im auf eine einen wird werden ist sind hat haben nicht auch"
+).split()
+
+
+_INTERNET = (socket.AF_INET, socket.AF_INET6)
+_socket_connect = socket.socket.connect
+
+
+def _offline_connect(sock, address):
+    # Only internet sockets: multiprocessing talks to its workers over pipes.
+    if sock.family in _INTERNET:
+        raise RuntimeError(f"The pipeline benchmark must not use the network (connection to {address}).")
+    return _socket_connect(sock, address)
+
+
+def go_offline():
+    """Makes token counts use the character estimate and internet connections fail."""
+    prompt_registry_module.tiktoken = None
+    prompt_registry_module._encoding.cache_clear()
+    socket.socket.connect = _offline_connect
+
+
+def sample_pages(pages, seed=SEED):
+    """Deterministic German-looking text: `pages` lists of lines."""
+    rng = random.Random(seed)
+    return [
+        [" ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "." for _ in range(LINES_PER_PAGE)]
+        for _ in range(pages)
+    ]
+
+
+def _pdf_text(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """A minimal PDF with one text page per entry of `pages`, written without a PDF library."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # the page tree, once the page objects are numbered
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for lines in pages:
+        content = "BT /F1 9 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_text(line)}) '" for line in lines) + " ET"
+        data = content.encode("cp1252")
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>")
+        objects.append(data)
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode()
+        if isinstance(body, bytes):
+            out += f"<< /Length {len(body)} >>\nstream\n".encode() + body + b"\nendstream"
+        else:
+            out += body.encode("cp1252")
+        out += b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def write_samples(directory, pages):
+    """Writes the same chapter as PDF, DOCX and TXT; returns {extension: path}."""
+    text_pages = sample_pages(pages)
+    paths = {ext: os.path.join(directory, f"kapitel_{pages}{ext}") for ext in (".pdf", ".docx", ".txt")}
+    write_pdf(paths[".pdf"], text_pages)
+    document = DocxDocument()
+    for lines in text_pages:
+        document.add_paragraph(" ".join(lines))
+    document.save(paths[".docx"])
+    with open(paths[".txt"], 'w', encoding='utf-8') as f:
+        f.write("\n\n".join("\n".join(lines) for lines in text_pages))
+    return paths
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[round(fraction * (len(sorted_values) - 1))]
+
+
+def summarize(seconds):
+    ordered = sorted(seconds)
+    total = sum(ordered)
+    return {
+        "n": len(ordered),
+        "ops_per_s": len(ordered) / total if total else float("inf"),
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+    }
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def load_chunks(path):
+    with open(path, 'rb') as f:
+        return list(iter_split_chunks(os.path.basename(path), f))
+
+
+def run_corpus(pages, settings):
+    """Runs every stage for one corpus size; executed in its own process."""
+    go_offline()
+    stages = {}
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_samples(directory, pages)
+
+        chunks = None
+        for ext, path in paths.items():
+            seconds = []
+            for _ in range(settings["repeat"]):
+                chunks, elapsed = timed(load_chunks, path)
+                seconds.append(elapsed)
+            stages[f"load {ext[1:]}"] = summarize(seconds)
+        chunk_count = len(chunks)
+
+        embeddings = get_embeddings(FAKE_EMBEDDING_BACKEND)
+        seconds = []
+        for _ in range(settings["repeat"]):
+            vector_store, elapsed = timed(build_vector_store, chunks, embeddings)
+            seconds.append(elapsed)
+        stages["embed + index"] = summarize(seconds)
+
+        retriever = vector_store.as_retriever(search_kwargs={"k": 10})
+        rng = random.Random(SEED)
+        queries = [" ".join(rng.choice(WORDS) for _ in range(6)) for _ in range(settings["queries"])]
+        stages["query"] = summarize([timed(retriever.invoke, query)[1] for query in queries])
+
+        answer = synthetic_unit().model_dump_json()
+        llm = ResilientLLM("fake", FakeChatModel(responses=[answer], latency_seconds=settings["llm_latency"]),
+                           RateLimiter(None))
+        chain, parser = get_learning_module_chain(llm, retriever, settings["structured_output"])
+        chain_seconds, parse_seconds, render_seconds, news_seconds, docx_seconds = [], [], [], [], []
+        news_document = synthetic_news_document()
+        for i in range(settings["requests"]):
+            result, elapsed = timed(chain.invoke, {"input": TOPIC})
+            chain_seconds.append(elapsed)
+            unit, elapsed = timed(parser.parse, result["answer"], result["context"], TOPIC)
+            parse_seconds.append(elapsed)
+            markdown, elapsed = timed(render_module_to_markdown, unit)
+            render_seconds.append(elapsed)
+            news_seconds.append(timed(generate_markdown, news_document)[1])
+
+            md_path = os.path.join(directory, f"modul_{i}.md")
+            with open(md_path, 'w', encoding='utf-8') as f:
+                f.write(markdown)
+            docx_seconds.append(timed(create_printable_word_doc, md_path,
+                                      os.path.join(directory, f"modul_{i}.docx"), False)[1])
+        stages["chain (fake LLM)"] = summarize(chain_seconds)
+        stages["parse"] = summarize(parse_seconds)
+        stages["render markdown"] = summarize(render_seconds)
+        stages["generate_markdown"] = summarize(news_seconds)
+        stages["printable docx"] = summarize(docx_seconds)
+
+    return {"pages": pages, "chunks": chunk_count, "peak_rss_mb": peak_rss_mb(), "stages": stages}
+
+
+def print_results(result, baseline=None, tolerance=0.25):
+    """Prints one corpus size; returns the names of the stages that regressed against the baseline."""
+    peak = result["peak_rss_mb"]
+    print(f"\n{result['pages']} pages ({result['chunks']} chunks indexed)"
+          + (f", peak RSS {peak:.0f} MB" if peak else ""))
+    print(f"{'stage':<20} {'n':>4} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9}" + (f" {'vs base':>8}" if baseline else ""))
+    regressions = []
+    for name, stats in result["stages"].items():
+        line = (f"{name:<20} {stats['n']:>4} {stats['ops_per_s']:>9.1f} "
+                f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f}")
+        base = (baseline or {}).get("stages", {}).get(name)
+        if base:
+            ratio = stats["p95_ms"] / base["p95_ms"] if base["p95_ms"] else 1.0
+            line += f" {ratio:>7.2f}x"
+            if ratio > 1 + tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    if baseline and peak and baseline.get("peak_rss_mb") and peak > baseline["peak_rss_mb"] * (1 + tolerance):
+        print(f"{'peak RSS':<20} {peak:.0f} MB vs {baseline['peak_rss_mb']:.0f} MB  REGRESSION")
+        regressions.append("peak RSS")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200], help="Corpus sizes in pages.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the loading and indexing stages.")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="Modules generated per corpus size.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per LLM answer.")
+    parser.add_argument("--text-output", action="store_true",
+                        help="Use format instructions in the prompt instead of structured output.")
+    parser.add_argument("--json", help="Write the results to this file, e.g. as a later --baseline.")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 / peak RSS increase.")
+    args = parser.parse_args(argv)
+
+    settings = {"repeat": args.repeat, "queries": args.queries, "requests": args.requests,
+                "llm_latency": args.llm_latency, "structured_output": not args.text_output}
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = {str(result["pages"]): result for result in json.load(f)["results"]}
+
+    print(f"Pipeline benchmark, settings {settings}")
+    results, regressions = [], []
+    for pages in args.pages:
+        # A fresh process per corpus size: its peak RSS is not inflated by the previous one.
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(run_corpus, pages, settings).result()
+        results.append(result)
+        regressions += [f"{pages} pages: {name}" for name in
+                        print_results(result, baseline.get(str(pages)), args.tolerance)]
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"settings": settings, "python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    if regressions:
+        print(f"\n{len(regressions)} regressions: " + ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
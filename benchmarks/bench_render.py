@@ -0,0 +1,120 @@
+# benchmarks/bench_render.py
+"""
+Measures Markdown rendering throughput of both document models.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_render --modules 5000
+    python -m benchmarks.bench_render path/to/archive/*.json
+
+JSON files are validated as FullLearningUnit or AbuNewsDocument, whichever
+fits; without files a synthetic module of each kind is rendered repeatedly.
+"""
+
+import argparse
+import json
+import time
+from pydantic import ValidationError
+
+from app.models import FullLearningUnit, AbuNewsDocument
+from app.markdown_renderer import render_document
+
+
+def _questions(n):
+    return {
+        "title": f"Fragen {n}",
+        "assignment_id": f"assignment-{n}",
+        "sub_id": "sub",
+        "questions": [f"Wie beurteilen Sie Aspekt {i} des Themas?" for i in range(1, 6)],
+    }
+
+
+def synthetic_unit():
+    return FullLearningUnit.model_validate({
+        "frontmatter": {"topic": ["Recht", "Jugend"], "chapter": ["3 Recht"], "type": "ABUnews",
+                        "source": "SRF", "summary": "Eine Zusammenfassung des Beitrags."},
+        "title": "ABUnews - Jugendkriminalität",
+        "objectives_block": {"introduction": "Worum es geht.", "objectives": [f"Lernziel {i}" for i in range(4)],
+                             "keywords": ["Strafrecht", "Jugend"], "aspects": ["Recht", "Ethik"]},
+        "activation_questions": _questions(1),
+        "importance_block": {"points": [f"Grund {i}" for i in range(3)]},
+        "media_block": {"audio_url": "https://example.org/beitrag.mp3", "source_url": "https://example.org",
+                        "comprehension_questions": _questions(2)},
+        "answers_block": {"iframe_url": "https://example.org/answers"},
+        "solution_suggestions": {"answer_key_name": "Verständnisfragen",
+                                 "solutions": [f"Lösung {i}" for i in range(5)]},
+        "language_deep_dive": {"instruction": "Wählen Sie eine Textsorte.", "writing_assignments": [
+            {"text_type": text_type, "objective": "Ziel der Aufgabe.", "guidance_questions": _questions(3 + i)}
+            for i, text_type in enumerate(["Leserbrief", "Kommentar", "Zusammenfassung"])
+        ]},
+    })
+
+
+def synthetic_news_document():
+    details = {"assignmentId": "news", "subIds": "1", "height": "450px",
+               "questions": [f"Frage {i}" for i in range(1, 6)]}
+    return AbuNewsDocument.model_validate({
+        "title": "ABUnews",
+        "sections": [
+            {"type": "info", "title": "Worum geht es?", "content": "Zeile eins\nZeile zwei",
+             "nested_block": {"type": "success", "title": "Lernziele", "content_list": ["Ziel 1", "Ziel 2"]}},
+            {"type": "keywords", "title": "Schlüsselbegriffe", "items": ["[[Strafrecht]]", "Jugend"]},
+            {"type": "iframe_question", "title": "Aktivierung", "iframe_details": details},
+            {"type": "audio", "title": "Radiobeitrag", "audio_url": "https://example.org/a.mp3",
+             "nested_quote_title": "Verständnisfragen", "nested_quote_iframe_details": details},
+        ],
+        "teacher_material": {"title": "LP-MATERIAL", "warning_block": {"title": "Lösungen", "content": "1. ...\n2. ..."}},
+    })
+
+
+def load_documents(paths):
+    documents = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for model in (FullLearningUnit, AbuNewsDocument):
+            try:
+                documents.append(model.model_validate(data))
+                break
+            except ValidationError:
+                continue
+        else:
+            print(f"Skipping {path}: matches neither document model.")
+    return documents
+
+
+def bench(documents, repeat):
+    started = time.perf_counter()
+    characters = 0
+    for _ in range(repeat):
+        for document in documents:
+            characters += len(render_document(document))
+    seconds = time.perf_counter() - started
+    rendered = repeat * len(documents)
+    return rendered, seconds, characters
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Archived module JSON files.")
+    parser.add_argument("--modules", type=int, default=2000, help="Renders per synthetic model (without files).")
+    args = parser.parse_args(argv)
+
+    if args.files:
+        suites = [("archive", load_documents(args.files), 1)]
+    else:
+        suites = [
+            ("FullLearningUnit", [synthetic_unit()], args.modules),
+            ("AbuNewsDocument", [synthetic_news_document()], args.modules),
+        ]
+
+    print(f"{'documents':<18} {'rendered':>9} {'seconds':>8} {'µs/doc':>8} {'docs/s':>9} {'MB out':>7}")
+    for name, documents, repeat in suites:
+        if not documents:
+            continue
+        rendered, seconds, characters = bench(documents, repeat)
+        print(f"{name:<18} {rendered:>9} {seconds:>8.3f} {seconds * 1e6 / rendered:>8.1f} "
+              f"{rendered / seconds:>9.0f} {characters / 1e6:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
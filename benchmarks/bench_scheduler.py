@@ -0,0 +1,66 @@
+# benchmarks/bench_scheduler.py
+"""
+Offline load test of the LLM scheduler (rate limiting, retries, fallback) with
+the fake provider.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_scheduler --requests 200 --concurrency 16 --rpm 600 --error-rate 0.2
+
+The primary fake model fails with a 429 at --error-rate; requests that still
+fail after the retries go to a fallback fake model without errors. Every 429
+pauses all callers of the limiter, so with a high --error-rate the throughput
+stays well below --rpm; with --error-rate 0 it should come close to it.
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.llm_providers import FakeChatModel, ResilientLLM
+from app.rate_limit import RateLimiter
+
+PROMPT = "Erstelle ein Lernmodul zum Thema Jugendstrafrecht. " * 40
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rpm", type=float, default=600)
+    parser.add_argument("--tpm", type=float, default=None)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per answer.")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="Probability of a 429 from the primary model.")
+    parser.add_argument("--retries", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    fallback = ResilientLLM("fallback", FakeChatModel(latency_seconds=args.latency), RateLimiter(None))
+    llm = ResilientLLM(
+        "fake",
+        FakeChatModel(latency_seconds=args.latency, rate_limit_probability=args.error_rate),
+        RateLimiter(args.rpm, args.tpm),
+        fallback=fallback,
+        max_retries=args.retries,
+    )
+
+    def timed_call(_):
+        started = time.perf_counter()
+        llm.invoke(PROMPT)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = sorted(pool.map(timed_call, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    stats = llm.stats()
+    print(f"\n{args.requests} requests, concurrency {args.concurrency}, limit {args.rpm:g} rpm, "
+          f"{args.error_rate:.0%} 429s from the primary model")
+    print(f"throughput {args.requests / elapsed * 60:.0f} requests/min (limit {args.rpm:g}), wall {elapsed:.1f}s")
+    print(f"latency p50 {statistics.median(latencies):.2f}s, "
+          f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f}s, max {latencies[-1]:.2f}s")
+    print(f"rate limited {stats['rate_limited']}, other retries {stats['retries']}, fallbacks {stats['fallbacks']}")
+
+
+if __name__ == '__main__':
+    main()
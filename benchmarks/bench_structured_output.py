@@ -0,0 +1,106 @@
+# benchmarks/bench_structured_output.py
+"""
+Compares the learning-module chain with the schema's format instructions in the
+prompt ("text") against the provider's native structured output ("native").
+
+Usage (from the repository root):
+    python -m benchmarks.bench_structured_output --models gpt-4o gemini-2.5-flash --runs 3
+    python -m benchmarks.bench_structured_output --document chapter.txt --topic "Das Jugendstrafrecht"
+
+First prints the static prompt prefix of both modes, counted with each model's
+tokenizer (Gemini counts are the ~4 characters per token estimate). Then every
+model whose API key is set is called --runs times per mode with the same
+context, and the input tokens reported by the provider, the mean latency and
+the number of answers that validate as a FullLearningUnit are shown.
+`--models fake` runs the script offline.
+"""
+
+import argparse
+import time
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.documents import Document
+
+from app.config import load_api_keys
+from app.langchain_logic import get_learning_module_chain
+from app.llm_providers import get_chat_model, provider_for, provider_available
+from app.models import FullLearningUnit
+from app.prompt_registry import prompt_registry, count_tokens
+from app.tolerant_parsing import TolerantParser
+
+MODES = (("text", False), ("native", True))
+
+SAMPLE_PARAGRAPH = (
+    "Das Jugendstrafrecht der Schweiz gilt für Jugendliche zwischen 10 und 18 Jahren. "
+    "Im Vordergrund stehen nicht Strafe und Vergeltung, sondern Erziehung und Schutz. "
+    "Die Jugendanwaltschaft klärt die persönlichen Verhältnisse ab und kann Schutzmassnahmen "
+    "wie eine Aufsicht, eine persönliche Betreuung oder eine ambulante Behandlung anordnen. "
+)
+
+
+def load_context(document_path, chunks):
+    """The document's paragraphs (or a sample text) as retrieved chunks."""
+    if document_path:
+        with open(document_path, 'r', encoding='utf-8') as f:
+            paragraphs = [p.strip() for p in f.read().split("\n\n") if p.strip()]
+    else:
+        paragraphs = [SAMPLE_PARAGRAPH * 3] * chunks
+    return [Document(page_content=p) for p in paragraphs[:chunks]]
+
+
+def static_prompt_tokens(model_name, structured_output):
+    return count_tokens(prompt_registry.get_learning_module_prompt(structured_output).static_text, model_name)
+
+
+def run_mode(llm, structured_output, topic, context, runs):
+    """(mean input tokens, mean seconds, valid answers) over `runs` calls."""
+    chain, _ = get_learning_module_chain(llm, None, structured_output)
+    parser = TolerantParser(FullLearningUnit)
+    input_tokens, seconds, valid = [], [], 0
+    for _ in range(runs):
+        usage = UsageMetadataCallbackHandler()
+        started = time.perf_counter()
+        result = chain.invoke({"input": topic, "context": context}, config={"callbacks": [usage]})
+        seconds.append(time.perf_counter() - started)
+        input_tokens.append(sum(u.get("input_tokens", 0) for u in usage.usage_metadata.values()))
+        try:
+            parser.parse(result["answer"])
+            valid += 1
+        except ValueError:
+            pass
+    return sum(input_tokens) / runs, sum(seconds) / runs, valid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["gpt-4o", "gemini-2.5-flash"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--document", help="A text file whose paragraphs are used as the context.")
+    parser.add_argument("--chunks", type=int, default=10, help="Number of context chunks.")
+    parser.add_argument("--topic", default="Das Schweizer Jugendstrafrecht")
+    args = parser.parse_args(argv)
+
+    load_api_keys()
+    context = load_context(args.document, args.chunks)
+
+    print("Static prompt prefix (tokens)\n")
+    print(f"{'model':<18} {'text':>8} {'native':>8} {'saved':>8}")
+    for model_name in args.models:
+        text, native = (static_prompt_tokens(model_name, structured) for _, structured in MODES)
+        print(f"{model_name:<18} {text:>8} {native:>8} {text - native:>8}")
+
+    print(f"\nLive calls, mean of {args.runs} runs with {len(context)} context chunks\n")
+    print(f"{'model':<18} {'mode':<7} {'input tokens':>13} {'seconds':>8} {'valid':>6}")
+    for model_name in args.models:
+        if not provider_available(provider_for(model_name)):
+            print(f"{model_name:<18} skipped: no API key for {provider_for(model_name)}")
+            continue
+        # Without the fallback, so every number comes from this model.
+        llm = get_chat_model(model_name, with_fallback=False)
+        for mode, structured_output in MODES:
+            tokens, seconds, valid = run_mode(llm, structured_output, args.topic, context, args.runs)
+            print(f"{model_name:<18} {mode:<7} {tokens:>13.0f} {seconds:>8.1f} {valid:>3}/{args.runs}")
+
+
+if __name__ == '__main__':
+    main()
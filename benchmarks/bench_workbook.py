@@ -0,0 +1,70 @@
+# benchmarks/bench_workbook.py
+"""
+Measures time and peak memory of building one workbook from many modules.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_workbook --modules 50
+    python -m benchmarks.bench_workbook --modules 500 --from-store
+
+The modules are synthetic Markdown files written to a temporary folder or, with
+--from-store, synthetic learning units saved to a temporary module store. Python
+allocations are traced in a separate run, since tracing slows the build down.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_converter import MODULE_TEMPLATE, QUESTIONS_URL
+from workbook import build_workbook, markdown_file_modules, stored_modules, peak_rss_mb
+
+
+def fill_store(store, count):
+    """Saves `count` distinct synthetic learning units (identical ones would be stored once)."""
+    from benchmarks.bench_render import synthetic_unit
+
+    unit = synthetic_unit()
+    for n in range(count):
+        store.save(unit.model_copy(update={"title": f"{unit.title} {n:04d}"}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", type=int, default=50)
+    parser.add_argument("--from-store", action="store_true", help="Build from a module store instead of files.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.from_store:
+            from app.module_store import ModuleStore
+
+            store = ModuleStore(os.path.join(tmp_dir, "modules.sqlite"))
+            fill_store(store, args.modules)
+            modules = lambda: stored_modules(store=store)
+        else:
+            for n in range(args.modules):
+                with open(os.path.join(tmp_dir, f"modul_{n:04d}.md"), "w", encoding="utf-8") as f:
+                    f.write(MODULE_TEMPLATE.format(n=n, url=QUESTIONS_URL))
+            modules = lambda: markdown_file_modules([tmp_dir])
+        out_path = os.path.join(tmp_dir, "workbook.docx")
+
+        started = time.perf_counter()
+        build_workbook(modules(), out_path, title="Arbeitsheft")
+        seconds = time.perf_counter() - started
+        size_mb = os.path.getsize(out_path) / 1e6
+
+        tracemalloc.start()
+        build_workbook(modules(), out_path, title="Arbeitsheft")
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"{args.modules} modules -> {size_mb:.2f} MB DOCX in {seconds:.2f}s ({args.modules / seconds:.0f} modules/s)")
+    print(f"peak Python allocations {traced_peak / 1e6:.1f} MB", end="")
+    rss = peak_rss_mb()
+    print(f", peak process RSS {rss:.0f} MB" if rss else "")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,193 +1,322 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
 import re
-import yaml
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, NamedTuple
 from urllib.parse import urlparse, parse_qs, unquote_plus
-from docx import Document
-from docx.shared import Pt, RGBColor
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
 
-# --- Helper Function to create a shaded box for structure ---
-def add_shaded_box(document, title, text_lines):
-    """
-    Creates a table with one cell, a shaded background, and a border 
-    to act as a visual container for content.
-    """
-    table = document.add_table(rows=1, cols=1)
-    table.style = 'Table Grid'
-    cell = table.cell(0, 0)
-
-    # Set the background color of the cell to light gray
-    shading_elm = OxmlElement('w:shd')
-    shading_elm.set(qn('w:val'), 'clear')
-    shading_elm.set(qn('w:fill'), 'EAEAEA') # Light gray fill
-    cell._tc.get_or_add_tcPr().append(shading_elm)
-
-    # Add the title to the cell
-    p_title = cell.add_paragraph()
-    p_title.add_run(title).bold = True
-    
-    # Add the content text to the cell
-    for line in text_lines:
-        # Clean up common markdown from the text
-        cleaned_line = re.sub(r'(\*\*|\[\[|\]\])', '', line)
-        cleaned_line = re.sub(r'\s*\- ', '', cleaned_line) # Remove list markers
-        cell.add_paragraph(cleaned_line.strip())
+from app.docx_writer import DocxWriter, new_document
 
-# --- Helper Function to parse questions from an iFrame URL ---
-def add_questions_from_iframe(document, url):
-    """
-    Parses a URL, extracts question parameters, decodes them, and formats
-    them for a printable worksheet.
-    """
-    parsed_url = urlparse(url)
-    query_params = parse_qs(parsed_url.query)
-    
-    # Find all parameters that start with 'question'
-    question_keys = sorted([k for k in query_params.keys() if k.startswith('question')])
+# --- Precompiled patterns ---
+CALLOUT_RE = re.compile(r'>\[!(\w+)\](.*)')
+IFRAME_SRC_RE = re.compile(r'<iframe src="([^"]+)"')
+AUDIO_SRC_RE = re.compile(r'<source src="([^"]+)"')
+WIKI_LINK_RE = re.compile(r'\[\[(.*?)\]\]')
+BOX_MARKUP_RE = re.compile(r'(\*\*|\[\[|\]\])')
+LIST_MARKER_RE = re.compile(r'\s*\- ')
+EMPHASIS_RE = re.compile(r'(\*\*|\*)')
+QUESTION_KEY_RE = re.compile(r'question(\d+)$')
 
-    if not question_keys:
-        return
 
-    document.add_heading("Fragen zum Beantworten", level=3)
-    
-    for i, key in enumerate(question_keys, 1):
-        # Decode URL-encoded text (e.g., %20 -> space)
-        encoded_text = query_params[key][0]
-        decoded_text = unquote_plus(encoded_text)
-        
-        # Clean up markdown formatting (** for bold, * for italic)
-        clean_text = re.sub(r'(\*\*|\*)', '', decoded_text)
-        
-        # Add the question to the document
-        p = document.add_paragraph()
-        p.add_run(f"{i}. {clean_text}").bold = True
-        
-        # Add blank lines for a printed answer
-        # A table with a bottom border creates clean lines for writing
-        table = document.add_table(rows=4, cols=1)
-        # Apply a style that only has bottom borders (or create one)
-        # For simplicity, we just leave blank paragraphs in the cells
-        for row in table.rows:
-            # Removing the default paragraph margins to make the lines tighter
-            p = row.cells[0].paragraphs[0]
-            p.paragraph_format.space_before = Pt(0)
-            p.paragraph_format.space_after = Pt(4)
+# --- Intermediate representation of a worksheet ---
+class Heading(NamedTuple):
+    level: int
+    text: str
 
+class Callout(NamedTuple):
+    """A `>[!type] title` block with the `>>` lines that follow it."""
+    kind: str
+    title: str
+    lines: List[str]
 
-# --- Main Parsing and Generation Function ---
-def create_printable_word_doc(md_file_path, docx_file_path):
+class Questions(NamedTuple):
+    """The questions encoded in an answers.html iframe URL."""
+    items: List[str]
+
+class Audio(NamedTuple):
+    url: str
+
+class Paragraph(NamedTuple):
+    """Plain text; wiki-links are already resolved to their target."""
+    text: str
+
+
+def iframe_questions(url):
+    """Extracts and decodes the question parameters of an iframe URL, in question order."""
+    query_params = parse_qs(urlparse(url).query)
+    numbered = sorted(
+        (int(match.group(1)), key) for key in query_params if (match := QUESTION_KEY_RE.match(key))
+    )
+    return [unquote_plus(query_params[key][0]) for _, key in numbered]
+
+
+def _body_lines(lines):
     """
-    Parses a structured Markdown file and generates a clean, printable Word document.
+    Yields the stripped lines after an optional `---` frontmatter block. Only the
+    frontmatter is buffered; if it is never closed, it is treated as body text.
     """
-    with open(md_file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # 1. Separate body from frontmatter, but we will not use the frontmatter.
-    try:
-        _, _, body_str = content.split('---', 2)
-    except ValueError:
-        body_str = content
-
-    document = Document()
-
-    # 2. Process Markdown Body
-    lines = body_str.strip().split('\n')
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
+    lines = iter(lines)
+    for line in lines:
+        line = line.strip()
         if not line:
-            i += 1
             continue
+        if line != '---':
+            yield line
+            break
+        frontmatter = []
+        for fm_line in lines:
+            if fm_line.strip() == '---':
+                break
+            frontmatter.append(fm_line.strip())
+        else:
+            yield '---'
+            yield from frontmatter
+        break
+    for line in lines:
+        yield line.strip()
+
 
-        # --- Map Markdown/Custom elements to DOCX elements ---
+def parse_markdown(lines):
+    """
+    Tokenizes a structured Markdown worksheet in a single pass and yields its
+    blocks (Heading, Callout, Questions, Audio, Paragraph).
+
+    Args:
+        lines: Any iterable of lines, e.g. an open file, so large files are never
+            held in memory as a whole.
+    """
+    pending = None
+    body = _body_lines(lines)
+    while True:
+        if pending is not None:
+            line, pending = pending, None
+        else:
+            line = next(body, None)
+            if line is None:
+                return
+        if not line:
+            continue
 
         # Heading Levels
-        if line.startswith('#'):
+        if line[0] == '#':
             level = len(line) - len(line.lstrip('#'))
-            title = line.lstrip('# ').strip()
-            # Don't create a title bigger than Heading 1
-            document.add_heading(title, level=min(level, 4))
-            i += 1
+            yield Heading(level, line.lstrip('# ').strip())
 
-        # Custom Callouts -> Shaded Box
-        elif match := re.match(r'>\[!(\w+)\](.*)', line):
+        # Custom Callouts; the `>>` lines that follow belong to the same block
+        elif match := CALLOUT_RE.match(line):
             title = match.group(2).strip()
-            # Gather subsequent lines belonging to the same callout block
             content_lines = []
-            i += 1
-            while i < len(lines) and lines[i].strip().startswith('>>'):
-                content_lines.append(lines[i].strip().lstrip('> '))
-                i += 1
-            
-            # If no content lines, maybe the content is on the same line (older format)
-            if not content_lines and len(line.split(']')) > 1:
-                 # Check for content on the initial callout line itself
-                 potential_content = line.split(']', 1)[1].strip()
-                 if potential_content:
-                     content_lines.append(potential_content)
-
-            add_shaded_box(document, title, content_lines)
+            for next_line in body:
+                if not next_line.startswith('>>'):
+                    pending = next_line
+                    break
+                content_lines.append(next_line.lstrip('> '))
+            # Older format: the content is on the callout line itself
+            if not content_lines and title:
+                content_lines.append(title)
+            yield Callout(match.group(1), title, content_lines)
 
         # iFrames -> Extracted Questions
         elif '<iframe src="' in line:
-            if src_match := re.search(r'src="([^"]+)"', line):
-                url = src_match.group(1)
-                add_questions_from_iframe(document, url)
-            i += 1
+            if src_match := IFRAME_SRC_RE.search(line):
+                yield Questions(iframe_questions(src_match.group(1)))
 
-        # Audio Files -> Simple Link
+        # Audio Files
         elif '<audio controls>' in line:
-            if src_match := re.search(r'<source src="([^"]+)"', line):
-                url = src_match.group(1)
-                document.add_paragraph(f"Zugehöriger Radiobeitrag: {url}")
-            i += 1
-            
+            if src_match := AUDIO_SRC_RE.search(line):
+                yield Audio(src_match.group(1))
+
         # Any other text
         else:
-            # Clean up wiki-links and other simple markdown
-            clean_line = re.sub(r'\[\[(.*?)\]\]', r'\1', line)
+            clean_line = WIKI_LINK_RE.sub(r'\1', line)
             if clean_line.strip():
-                document.add_paragraph(clean_line)
-            i += 1
-            
+                yield Paragraph(clean_line)
+
+
+# --- Helper Function to create a shaded box for structure ---
+def add_shaded_box(document, title, text_lines, writer=None):
+    """
+    Creates a table with one cell, a shaded background, and a border
+    to act as a visual container for content.
+    """
+    # Clean up common markdown and list markers from the text
+    cleaned_lines = [LIST_MARKER_RE.sub('', BOX_MARKUP_RE.sub('', line)).strip() for line in text_lines]
+    (writer or DocxWriter(document)).shaded_box(title, cleaned_lines)
+
+def add_questions(document, questions, writer=None):
+    """Adds numbered questions, each followed by blank lines for a printed answer."""
+    if not questions:
+        return
+    writer = writer or DocxWriter(document)
+
+    writer.heading("Fragen zum Beantworten", level=3)
+    for i, question in enumerate(questions, 1):
+        # Clean up markdown formatting (** for bold, * for italic)
+        writer.paragraph(f"{i}. {EMPHASIS_RE.sub('', question)}", bold=True)
+        writer.answer_lines()
+
+# --- Helper Function to parse questions from an iFrame URL ---
+def add_questions_from_iframe(document, url):
+    """
+    Parses a URL, extracts question parameters, decodes them, and formats
+    them for a printable worksheet.
+    """
+    add_questions(document, iframe_questions(url))
+
+
+def emit_docx(document, blocks):
+    """Writes parsed worksheet blocks into a python-docx document."""
+    writer = DocxWriter(document)
+    for block in blocks:
+        if isinstance(block, Heading):
+            # Don't create a title smaller than Heading 4
+            writer.heading(block.text, level=min(block.level, 4))
+        elif isinstance(block, Callout):
+            add_shaded_box(document, block.title, block.lines, writer)
+        elif isinstance(block, Questions):
+            add_questions(document, block.items, writer)
+        elif isinstance(block, Audio):
+            writer.paragraph(f"Zugehöriger Radiobeitrag: {block.url}")
+        elif isinstance(block, Paragraph):
+            writer.paragraph(block.text)
+    return document
+
+
+# --- Main Parsing and Generation Function ---
+def create_printable_word_doc(md_file_path, docx_file_path, verbose=True):
+    """
+    Parses a structured Markdown file and generates a clean, printable Word document.
+    The file is streamed line by line; the frontmatter is skipped.
+    """
+    document = new_document()
+    with open(md_file_path, 'r', encoding='utf-8') as f:
+        emit_docx(document, parse_markdown(f))
+
     # Add a final paragraph for spacing
     document.add_paragraph()
-    
-    # 3. Save the document
+
+    # Save the document
     document.save(docx_file_path)
-    print(f"Successfully created printable Word document at: {docx_file_path}")
+    if verbose:
+        print(f"Successfully created printable Word document at: {docx_file_path}")
+
+
+# --- Batch Conversion ---
+STATE_FILE = ".converter_state.jsonl"
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def collect_markdown_files(inputs):
+    """Expands files, directories (searched recursively) and glob patterns into Markdown paths."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(glob.glob(os.path.join(item, '**', '*.md'), recursive=True))
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            paths.extend(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+    # Keep the order stable and drop duplicates from overlapping inputs.
+    return list(dict.fromkeys(os.path.normpath(path) for path in sorted(paths)))
+
+
+def output_path(md_path, out_dir):
+    stem = os.path.splitext(os.path.basename(md_path))[0]
+    return os.path.join(out_dir or os.path.dirname(md_path), stem + '.docx')
+
+
+def load_state(state_path):
+    """Maps each output file to the hash of the source it was last built from."""
+    state = {}
+    if not os.path.exists(state_path):
+        return state
+    with open(state_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crash can leave a half-written last line behind.
+                continue
+            state[entry["output"]] = entry["source_hash"]
+    return state
+
+
+def convert_file(md_path, docx_path):
+    """Worker: converts one file and returns the seconds it took."""
+    started = time.perf_counter()
+    create_printable_word_doc(md_path, docx_path, verbose=False)
+    return time.perf_counter() - started
+
+
+def batch_convert(inputs, out_dir=None, workers=None, force=False):
+    """
+    Converts all Markdown files in `inputs` over a process pool. Outputs whose
+    source has not changed since the last run are skipped. Returns the number of failures.
+    """
+    paths = collect_markdown_files(inputs)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir or '.', STATE_FILE)
+    state = {} if force else load_state(state_path)
+
+    jobs = []
+    for md_path in paths:
+        docx_path = output_path(md_path, out_dir)
+        source_hash = file_hash(md_path)
+        if state.get(os.path.abspath(docx_path)) == source_hash and os.path.exists(docx_path):
+            continue
+        jobs.append((md_path, docx_path, source_hash))
+    print(f"{len(paths)} Markdown files, {len(paths) - len(jobs)} unchanged, {len(jobs)} to convert.")
+    if not jobs:
+        return 0
+
+    started = time.perf_counter()
+    converted_bytes = 0
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(state_path, 'a', encoding='utf-8') as state_log:
+        futures = {pool.submit(convert_file, md_path, docx_path): (md_path, docx_path, source_hash)
+                   for md_path, docx_path, source_hash in jobs}
+        for future in as_completed(futures):
+            md_path, docx_path, source_hash = futures[future]
+            try:
+                seconds = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[failed] {md_path}: {e}")
+                continue
+            converted_bytes += os.path.getsize(md_path)
+            state_log.write(json.dumps({"output": os.path.abspath(docx_path), "source_hash": source_hash}) + "\n")
+            state_log.flush()
+            print(f"[done] {md_path} -> {docx_path} ({seconds:.2f}s)")
+
+    elapsed = time.perf_counter() - started
+    converted = len(jobs) - failures
+    print(f"Converted {converted} files in {elapsed:.1f}s ({converted / elapsed:.1f} files/s, "
+          f"{converted_bytes / 1e6 / elapsed:.2f} MB/s), {failures} failed.")
+    return failures
 
 
 # --- Execution ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert structured Markdown modules into printable Word worksheets.")
+    parser.add_argument("inputs", nargs="+", help="Markdown files, directories or glob patterns.")
+    parser.add_argument("--out", help="Output folder (default: next to each Markdown file).")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count).")
+    parser.add_argument("--force", action="store_true", help="Convert all files, even if their source is unchanged.")
+    args = parser.parse_args(argv)
+    return 1 if batch_convert(args.inputs, args.out, args.workers, args.force) else 0
+
+
 if __name__ == '__main__':
-    markdown_file = 'your_markdown_file.md'
-    word_file = 'printable_worksheet.docx'
-    
-    # Re-create the markdown file for demonstration purposes
-    markdown_content = """
----
-topic: ["Politik", "Recht", "Gewaltentrennung", "Politik und Umfeld", "Migration"]
-chapter: []
-type: "news"
-source: "ABUnews"
-summary: "**Worum es geht**: In diesem Radiobeitrag geht es um die **Proteste** in Los Angeles gegen die Einwanderungsbehörde **ICE**, die eskalierten, nachdem US-Präsident Trump gegen den Willen der kalifornischen Behörden die **Nationalgarde** einsetzte."
----
-# ABUnews - Unruhen in den USA
->[!info] Worum geht es?
->> Das Thema dieses Radiobeitrags sind die **heftigen Proteste** in der amerikanischen Stadt Los Angeles. Es geht um einen Konflikt zwischen dem US-Präsidenten und den **Behörden von Kalifornien**, der zeigt, wie unterschiedlich mit Menschen ohne gültige Papiere umgegangen wird.
->
->>[!success] Lernziele
->>- Sie können die Hauptgründe für die Proteste in Los Angeles und die Anliegen der Demonstrierenden erklären.
->>- Sie können die Rolle der Nationalgarde in den USA erläutern und bewerten, warum ihr Einsatz in diesem Fall als aussergewöhnlich gilt.
->
->#### Schlüsselbegriffe
->[[Gewaltentrennung]], [[Politische Rechte]], [[Staatsformen]]
->
->[!question] Wählen Sie **eine Frage** und **begründen Sie** Ihre Antwort 
-><iframe src="https://allgemeinbildung.github.io/textbox/answers.html?assignmentId=Unruhen%20in%20den%20USA&subIds=A.%20Einstiegsfragen%20Unruhen%20in%20den%20USA&question1=**Haben%20Sie%20schon%20einmal%20an%20einer%20Demonstration%20teilgenommen%20oder%20darüber%20nachgedacht?%20Was%20sind%20Ihrer%20Meinung%20nach%20gute%20Gründe,%20um%20auf%20die%20Strasse%20zu%20gehen%20und%20zu%20protestieren?**%20*Wie%20unterscheidet%20sich%20friedlicher%20Protest%20von%20Randalen,%20und%20wo%20ziehen%20Sie%20persönlich%20die%20Grenze?*&question2=**In%20der%20Schweiz%20gibt%20es%20klare%20Regeln,%20wer%20die%20Armee%20oder%20die%20Polizei%20einsetzen%20darf.%20Was%20denken%20Sie,%20was%20passieren%20würde,%20wenn%20sich%20die%20Regierung%20in%20Bern%20über%20den%20Willen%20eines%20Kantons%20hinwegsetzen%20würde,%20um%20zum%20Beispiel%20die%20Armee%20aufzubieten?**&question3=**Menschen%20ohne%20gültige%20Papiere%20('Sans-Papiers')%20leben%20auch%20in%20der%20Schweiz.%20Welche%20Herausforderungen%20und%20Ängste%20haben%20diese%20Menschen%20Ihrer%20Meinung%20nach%20im%20Alltag?**" style="border:0px #ffffff none;" name="myiFrame" scrolling="yes" frameborder="1" marginheight="0px" marginwidth="0px" height="450px" width="100%" allowfullscreen></iframe>
-"""
-    with open(markdown_file, 'w', encoding='utf-8') as f:
-        f.write(markdown_content)
-
-    create_printable_word_doc(markdown_file, word_file)
\ No newline at end of file
+    raise SystemExit(main())
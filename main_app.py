@@ -2,15 +2,28 @@
 
 import streamlit as st
 import os
-import urllib.parse
+import time
+from contextlib import nullcontext
 
 # Import all modularized functions
-from app.config import load_api_keys
+from app.config import load_api_keys, parse_cli_args
 from app.document_processor import load_and_split_document
-from app.langchain_logic import get_retriever, get_llm, get_learning_module_chain
+from app.langchain_logic import index_document, build_retriever, get_llm, get_learning_module_chain, get_prompt_hash, parse_partial_answer
+from app.response_cache import response_cache, make_cache_keys
+from app.prompt_registry import prompt_registry, count_tokens
+from app.retrieval import RETRIEVAL_MODES, context_stats
+from app.embeddings import EMBEDDING_BACKENDS, LOCAL_EMBEDDING_BACKEND, LOCAL_BACKEND_HINT, embedding_backend_available
+from app.vector_index import INDEX_TYPES
+from app.index_cache import index_cache
+from app.index_registry import index_registry, IndexCapacityError
+from app.block_generation import generate_learning_unit
+from app.markdown_renderer import render_module_to_markdown, render_partial_module
+from app.module_store import module_store
+from app.tracing import tracer, span, otel_available, OTEL_ENDPOINT
 
 # --- Load API keys at the very beginning ---
 load_api_keys()
+cli_args = parse_cli_args()
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Pimp My Textbook", layout="wide", initial_sidebar_state="expanded")
@@ -24,109 +37,71 @@ if 'generated_content' not in st.session_state:
     st.session_state.generated_content = None
 if 'retriever' not in st.session_state:
     st.session_state.retriever = None
-
-
-# --- START: REWRITTEN MARKDOWN RENDERER ---
-def render_interactive_block(block):
-    """Helper function to render an interactive questions block to an iframe string."""
-    base_url = "https://allgemeinbildung.github.io/textbox/answers.html?"
-    params = {
-        'assignmentId': block.assignment_id,
-        'subIds': block.sub_id
-    }
-    for i, q_text in enumerate(block.questions, 1):
-        params[f'question{i}'] = q_text
-    
-    iframe_url = base_url + urllib.parse.urlencode(params)
-    return f'><iframe src="{iframe_url}" style="border:0px #ffffff none;" name="myiFrame" scrolling="yes" frameborder="1" marginheight="0px" marginwidth="0px" height="450px" width="100%" allowfullscreen></iframe>\n'
-
-def render_module_to_markdown(module):
-    """
-    Takes a FullLearningUnit object and converts it to a markdown string.
-    This function is now aligned with the complex Pydantic model.
-    """
-    # 1. Frontmatter
-    md_string = "---\n"
-    md_string += f"topic: {module.frontmatter.topic}\n"
-    md_string += f"chapter: {module.frontmatter.chapter}\n"
-    md_string += f"type: {module.frontmatter.type}\n"
-    md_string += f"source: {module.frontmatter.source}\n"
-    md_string += f'summary: "{module.frontmatter.summary}"\n'
-    md_string += "---\n"
-    
-    # 2. Main Title - CORRECTED to use 'title'
-    md_string += f"# {module.title}\n"
-    
-    # 3. Objectives Block
-    obj_block = module.objectives_block
-    md_string += f"\n>[!info] Worum geht es?\n> {obj_block.introduction}\n"
-    md_string += ">>[!success] Lernziele\n"
-    for obj in obj_block.objectives:
-        md_string += f">> - {obj}\n"
-    md_string += f"\n>#### Schlüsselbegriffe\n> {', '.join(obj_block.keywords)}\n"
-    md_string += f"\n>#### Aspekte der Allgemeinbildung\n> {', '.join(obj_block.aspects)}\n"
-
-    # 4. Activation Questions
-    act_block = module.activation_questions
-    md_string += f"\n>[!question] {act_block.title}\n"
-    md_string += render_interactive_block(act_block)
-
-    # 5. Importance Block
-    imp_block = module.importance_block
-    md_string += f"\n>[!info] Warum ist das wichtig?\n"
-    for point in imp_block.points:
-        md_string += f"> - {point}\n"
-
-    # 6. Media Block
-    media = module.media_block
-    if media.audio_url:
-        md_string += f"\n>[!hint] **Radiobeitrag** \n><audio controls><source src=\"{media.audio_url}\"></audio>\n"
-    md_string += f"> Quelle: [Originalquelle]({media.source_url})\n"
-    md_string += ">>[!quote] Beantworten Sie folgende Verständnisfragen:\n"
-    md_string += render_interactive_block(media.comprehension_questions)
-    
-    # 7. Answers Iframe
-    md_string += f"\n>[!success]- Antworten\n"
-    md_string += f'><iframe src="{module.answers_block.iframe_url}" style="border:0px #ffffff none;" name="myiFrame" scrolling="yes" frameborder="1" marginheight="0px" marginwidth="0px" height="400px" width="100%" allowfullscreen></iframe>\n'
-
-    # 8. Teacher Materials
-    solutions = module.solution_suggestions
-    md_string += "\n%-%-%-\n\n# LP-MATERIAL\n"
-    md_string += f'>[!warning] {solutions.answer_key_name} - Lösungsvorschläge\n'
-    for i, sol in enumerate(solutions.solutions, 1):
-        md_string += f"> {i}. **Antwort zu Frage {i}:** {sol}\n"
-        
-    # 9. Language Deep Dive
-    deep_dive = module.language_deep_dive
-    md_string += f"\n# {deep_dive.title}\n"
-    md_string += f"\n>[!abstract] Auftrag\n> {deep_dive.instruction}\n"
-    if media.audio_url:
-        md_string += f'>>[!hint] **Radiobeitrag** \n>><audio controls><source src="{media.audio_url}"></audio>\n'
-    
-    md_string += "\n## Textsorten\n"
-    for assign in deep_dive.writing_assignments:
-        md_string += f"\n### {assign.text_type}\n"
-        md_string += f'>[!info] **[[{assign.text_type}]]**\n> Ziel: {assign.objective}\n'
-        md_string += f'>>[!note]- {assign.text_type} erfassen \n>>#### Schritt-für-Schritt Anleitung\n'
-        md_string += render_interactive_block(assign.guidance_questions)
-        md_string += f'>>\n>>[[{assign.text_type}#✔ Bewertung]]\n'
-
-    return md_string
-# --- END: REWRITTEN MARKDOWN RENDERER ---
+if 'generation_timings' not in st.session_state:
+    st.session_state.generation_timings = None
+if 'context_stats' not in st.session_state:
+    st.session_state.context_stats = None
+if 'parse_stats' not in st.session_state:
+    st.session_state.parse_stats = None
+if 'generated_markdown' not in st.session_state:
+    st.session_state.generated_markdown = None
+if 'traces' not in st.session_state:
+    # The latest trace of each kind ("ingest", "generate"), for the timing panel.
+    st.session_state.traces = {}
+    st.session_state.traced_upload = None
+if 'index_lease' not in st.session_state:
+    # Holds this session's references to the shared indexes; released when the session ends.
+    st.session_state.index_lease = index_registry.lease()
+if 'query_index_keys' not in st.session_state:
+    # The "Chapters to query" selection; kept here so other sessions' uploads and evictions don't reset it.
+    st.session_state.query_index_keys = []
+    st.session_state.auto_selected_index = None
 
 
 # --- Sidebar for Configuration ---
 with st.sidebar:
     st.header("1. File Upload")
     uploaded_file = st.file_uploader("Select textbook chapter", type=['pdf', 'txt', 'docx'], label_visibility="collapsed")
+    extract_workers = st.number_input(
+        "PDF extraction workers",
+        min_value=1,
+        max_value=os.cpu_count() or 1,
+        value=min(max(cli_args.extract_workers, 1), os.cpu_count() or 1),
+        help="Number of processes used to extract the pages of large PDFs in parallel.",
+    )
     
-    if uploaded_file:
-        docs = load_and_split_document(uploaded_file)
-        if docs:
-            st.session_state.retriever = get_retriever(docs)
-            st.success(f"Indexed {len(docs)} document chunks.")
-        else:
-            st.session_state.retriever = None
+    with st.expander("Retrieval settings"):
+        retrieval_mode = st.selectbox(
+            "Retrieval mode",
+            RETRIEVAL_MODES,
+            help="MMR avoids sending near-duplicate chunks; 'Score threshold' drops chunks below a minimum relevance.",
+        )
+        retrieval_k = st.slider("Chunks to retrieve (k)", min_value=1, max_value=20, value=10)
+        mmr_diversity = 0.5
+        score_threshold = 0.5
+        if retrieval_mode == "MMR":
+            mmr_diversity = st.slider("Relevance vs. diversity", min_value=0.0, max_value=1.0, value=0.5,
+                                      help="1.0 = pure relevance, 0.0 = maximum diversity.")
+        elif retrieval_mode == "Score threshold":
+            score_threshold = st.slider("Minimum relevance score", min_value=0.0, max_value=1.0, value=0.5)
+        rerank = False
+        if retrieval_mode == "Hybrid (BM25 + vector)":
+            rerank = st.checkbox(
+                "Rerank with a local cross-encoder",
+                help="Runs on CPU and needs sentence-transformers. Better ordering lets you use a smaller k.",
+            )
+        index_type = st.selectbox(
+            "Index type",
+            INDEX_TYPES,
+            help="'Auto' uses an exact index for chapters and compressed approximate indexes (HNSW, IVF-PQ) for very large corpora.",
+        )
+        max_context_tokens = st.number_input(
+            "Context token budget",
+            min_value=0,
+            value=3000,
+            step=500,
+            help="Retrieved chunks are trimmed to fit this many tokens. 0 = no limit.",
+        )
     
     st.header("2. Model Selection")
     provider = st.selectbox("Provider", ["OpenAI", "Google"])
@@ -137,6 +112,125 @@ with st.sidebar:
     elif provider == "Google":
         model_name = st.selectbox("Model", ["gemini-2.5-pro", "gemini-2.5-flash"])
 
+    embedding_backend = st.selectbox(
+        "Embeddings",
+        [backend for backend in EMBEDDING_BACKENDS if embedding_backend_available(backend)],
+        help="The local backend runs offline on the CPU. " + (
+            "" if embedding_backend_available(LOCAL_EMBEDDING_BACKEND) else LOCAL_BACKEND_HINT),
+    )
+
+    generation_mode = st.radio(
+        "Generation mode",
+        ["Single call", "Parallel blocks"],
+        help="'Parallel blocks' requests the sections of the module concurrently, which is much faster end to end.",
+    )
+
+    structured_output = st.checkbox(
+        "Native structured output",
+        value=True,
+        help="The provider enforces the module's JSON schema, so the prompt needs no format instructions "
+             "(thousands of tokens fewer per request).",
+    )
+
+    export_otel = st.checkbox(
+        "Export traces to OpenTelemetry",
+        help=f"Also sends every trace to the local collector at {OTEL_ENDPOINT} "
+             "(needs opentelemetry-sdk and opentelemetry-exporter-otlp).",
+    )
+    if export_otel and not otel_available():
+        st.warning("OpenTelemetry is not installed; traces are only written to the JSONL file.")
+
+    compiled_prompt = prompt_registry.get_learning_module_prompt(structured_output)
+    static_prompt_tokens = count_tokens(compiled_prompt.static_text, model_name)
+    st.caption(f"Static prompt prefix: {static_prompt_tokens} tokens")
+
+    # Indexing comes after the model selection: it depends on the embedding backend,
+    # and the context token budget is counted with the selected model's tokenizer.
+    current_index_key = None
+    docs = None
+    if uploaded_file:
+        upload = (uploaded_file.name, uploaded_file.size, embedding_backend, index_type)
+        # Reruns are served from the caches; only a new upload (or new settings) is worth a trace.
+        trace_upload = upload != st.session_state.traced_upload
+        trace_context = nullcontext()
+        if trace_upload:
+            trace_context = tracer.trace("ingest", export_otel_spans=export_otel, file=uploaded_file.name,
+                                         embeddings=embedding_backend, index_type=index_type)
+        with trace_context as trace:
+            with span("load_and_split"):
+                docs = load_and_split_document(uploaded_file, workers=int(extract_workers))
+            if docs:
+                with st.spinner("Indexing document..."), span("index", chunks=len(docs)):
+                    try:
+                        current_index_key = index_document(
+                            docs,
+                            uploaded_file.name,
+                            embedding_backend=embedding_backend,
+                            index_type=index_type,
+                            lease=st.session_state.index_lease,
+                        )
+                    except IndexCapacityError as e:
+                        st.error(f"{e} Deselect chapters you no longer need, or try again later.")
+                    except ImportError as e:
+                        st.error(str(e))
+                    except (RuntimeError, ValueError) as e:
+                        # E.g. FAISS rejecting the index settings, or an embedding API error.
+                        st.error(f"Indexing '{uploaded_file.name}' failed: {e}")
+        if trace_upload:
+            st.session_state.traces["ingest"] = trace
+            st.session_state.traced_upload = upload
+    if current_index_key:
+        st.success(f"Indexed {len(docs)} document chunks.")
+        cache_stats = index_cache.stats()
+        st.caption(f"Index cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        current_entry = index_registry.get(current_index_key)
+        embedding_stats = current_entry.embedding_stats if current_entry else None
+        if embedding_stats:
+            st.caption(
+                f"Embedding cache: {embedding_stats['hit_ratio']:.0%} of chunks reused "
+                f"({embedding_stats['hits']} cached, {embedding_stats['misses']} embedded)"
+            )
+
+    # Every chapter indexed by any session can be queried, alone or together.
+    index_entries = {entry.key: entry for entry in index_registry.entries()}
+    # Set before the widget is drawn: the selection without evicted chapters,
+    # plus a newly indexed upload (once, so it can be deselected again).
+    selection = [key for key in st.session_state.query_index_keys if key in index_entries]
+    if current_index_key and current_index_key != st.session_state.auto_selected_index:
+        st.session_state.auto_selected_index = current_index_key
+        if current_index_key in index_entries and current_index_key not in selection:
+            selection.append(current_index_key)
+    st.session_state.query_index_keys = selection
+    selected_index_keys = st.multiselect(
+        "Chapters to query",
+        options=list(index_entries),
+        key="query_index_keys",
+        format_func=lambda key: f"{index_entries[key].name} ({index_entries[key].chunk_count} chunks)",
+        help="Chapters already indexed in this app, by you or by colleagues. Several are queried as one knowledge base.",
+    )
+    held_keys = set(selected_index_keys)
+    if current_index_key:
+        held_keys.add(current_index_key)
+    st.session_state.index_lease.hold(held_keys)
+    registry_stats = index_registry.stats()
+    st.caption(
+        f"Shared indexes: {registry_stats['indexes']} of {registry_stats['max_indexes']} loaded, "
+        f"{registry_stats['chunks']} of {registry_stats['max_chunks']} chunks in memory"
+    )
+
+    st.session_state.retriever = build_retriever(
+        selected_index_keys,
+        mode=retrieval_mode,
+        k=retrieval_k,
+        fetch_k=retrieval_k * 3,
+        lambda_mult=mmr_diversity,
+        score_threshold=score_threshold,
+        max_context_tokens=int(max_context_tokens) or None,
+        model_name=model_name,
+        rerank=rerank,
+    )
+
+
 # --- Main Interaction Area ---
 st.header("3. Define Task")
 col1, col2, col3 = st.columns([1, 2, 1])
@@ -148,6 +242,16 @@ with col2:
         help="e.g., 'A module about the recent changes in youth crime in Zurich, including learning objectives, reflection questions, and comprehension questions based on the text.'"
     )
     
+    cache_col1, cache_col2 = st.columns(2)
+    force_regenerate = cache_col1.checkbox(
+        "Force regenerate",
+        help="Ignore the response cache and always call the LLM.",
+    )
+    match_similar_topics = cache_col2.checkbox(
+        "Reuse answers for similar topics",
+        help="Also reuse a cached answer when an almost identical topic was generated from the same chunks.",
+    )
+    
     generate_button = st.button("✨ Generate Learning Module", type="primary", use_container_width=True)
 
 # --- Generation Logic ---
@@ -158,19 +262,71 @@ if generate_button:
         st.warning("Please ensure a model is selected and a topic is entered.")
     else:
         with st.spinner(f"Running module generation with '{model_name}'. The LLM is thinking..."):
+            generation_trace = None
             try:
-                llm = get_llm(provider, model_name)
-                rag_chain, parser = get_learning_module_chain(llm, st.session_state.retriever)
-                
-                result = rag_chain.invoke({"input": topic})
-                
-                st.session_state.generated_content = parser.parse(result['answer'])
-                st.success("Learning Module generated successfully!")
+                with tracer.trace("generate", export_otel_spans=export_otel, model=model_name,
+                                  mode=generation_mode, topic=topic) as generation_trace:
+                    llm = get_llm(provider, model_name)
+                    if generation_mode == "Parallel blocks":
+                        module, timings = generate_learning_unit(llm, st.session_state.retriever, topic)
+                        st.session_state.generated_content = module
+                        st.session_state.generation_timings = timings
+                        st.session_state.context_stats = None
+                        st.session_state.parse_stats = None
+                    else:
+                        rag_chain, parser = get_learning_module_chain(llm, st.session_state.retriever, structured_output)
+                    
+                        # Retrieve once up front: the chunk IDs are part of the cache key.
+                        retriever = st.session_state.retriever
+                        with span("retrieval"):
+                            context_docs = retriever.invoke(topic)
+                        st.session_state.context_stats = context_stats(context_docs, static_prompt_tokens, model_name)
+                        cache_key, cache_scope = make_cache_keys(model_name, get_prompt_hash(structured_output), topic, context_docs)
+                        topic_vector = None
+                        if match_similar_topics:
+                            topic_vector = retriever.vectorstore.embedding_function.embed_query(topic)
+                    
+                        answer = None if force_regenerate else response_cache.get(cache_key, cache_scope, topic_vector)
+                        from_cache = answer is not None
+                        generation_trace.attributes["from_cache"] = from_cache
+                        if from_cache:
+                            st.info("Loaded from the response cache. Tick 'Force regenerate' to call the LLM again.")
+                        else:
+                            # Stream the answer and show every section as soon as it is complete.
+                            preview = st.empty()
+                            answer = ""
+                            last_render = 0.0
+                            for chunk in rag_chain.stream({"input": topic, "context": context_docs}):
+                                part = chunk.get("answer", "")
+                                # Structured output streams the object parsed so far, text mode the new text.
+                                answer = part if isinstance(part, dict) else answer + part
+                                if time.monotonic() - last_render < 0.3:
+                                    continue
+                                last_render = time.monotonic()
+                                partial = answer if isinstance(answer, dict) else parse_partial_answer(answer)
+                                if partial:
+                                    preview.markdown(render_partial_module(partial))
+                            preview.empty()
+                    
+                        # Broken blocks are repaired or re-requested instead of discarding the answer.
+                        st.session_state.generated_content = parser.parse(answer, context=context_docs, topic=topic)
+                        st.session_state.generation_timings = None
+                        st.session_state.parse_stats = parser.stats()
+                        if not from_cache:
+                            # Only answers that parse are worth serving again, and the repaired version at that.
+                            response_cache.put(cache_key, cache_scope, topic,
+                                               st.session_state.generated_content.model_dump_json(), topic_vector)
+                    with span("render"):
+                        st.session_state.generated_markdown = render_module_to_markdown(st.session_state.generated_content)
+                    module_store.save(st.session_state.generated_content, topic=topic,
+                                      source=uploaded_file.name if uploaded_file else None, model=model_name)
+                    st.success("Learning Module generated successfully!")
 
             except Exception as e:
                 st.error(f"An error occurred: {e}")
                 st.exception(e) # This will print the full traceback for debugging
                 st.session_state.generated_content = None
+            st.session_state.traces["generate"] = generation_trace
 
 # --- Results Display ---
 if st.session_state.generated_content:
@@ -179,8 +335,8 @@ if st.session_state.generated_content:
     
     module_object = st.session_state.generated_content
     
-    # Use our new render function to display the markdown
-    markdown_output = render_module_to_markdown(module_object)
+    # Rendered once per generation (see the "render" span), not on every rerun
+    markdown_output = st.session_state.generated_markdown
     
     st.markdown(markdown_output)
     
@@ -197,5 +353,46 @@ if st.session_state.generated_content:
         mime="text/markdown"
     )
 
+    if st.session_state.context_stats:
+        stats = st.session_state.context_stats
+        st.caption(
+            f"Input sent to the LLM: {stats['chunks_sent']} chunks, "
+            f"{stats['context_tokens']} context tokens, {stats['prompt_tokens']} prompt tokens in total."
+        )
+
+    parse_stats = st.session_state.parse_stats
+    if parse_stats and (parse_stats["json_repaired"] or parse_stats["blocks_rerequested"]):
+        st.caption(
+            f"The LLM's answer needed repairs: {parse_stats['blocks_rerequested']} blocks requested again "
+            f"({parse_stats['repair_calls']} calls, {parse_stats['repair_tokens']} tokens); "
+            f"{parse_stats['wasted_tokens']} tokens of the original answer were discarded."
+        )
+
+    if st.session_state.generation_timings:
+        with st.expander("Show Generation Timings"):
+            st.table({
+                "Stage": list(st.session_state.generation_timings),
+                "Seconds": [round(t, 2) for t in st.session_state.generation_timings.values()],
+            })
+
     with st.expander("Show Generated JSON Data"):
-        st.json(module_object.model_dump_json(indent=2))
\ No newline at end of file
+        st.json(module_object.model_dump_json(indent=2))
+
+# --- Timing Panel ---
+# At the end of the script, so it already shows the traces of this run.
+with st.sidebar:
+    with st.expander("Timings", expanded=bool(st.session_state.traces)):
+        if not st.session_state.traces:
+            st.caption("Upload a document or generate a module to see where the time goes.")
+        for name, trace in st.session_state.traces.items():
+            if trace is None:
+                continue
+            totals = trace.totals()
+            summary = f"**{name}**: {trace.seconds:.2f}s"
+            if totals["input_tokens"] or totals["output_tokens"]:
+                summary += (f", {totals['input_tokens']} tokens in / {totals['output_tokens']} out, "
+                            f"~${totals['cost_usd']:.4f}")
+            st.markdown(summary)
+            st.dataframe(trace.rows(), hide_index=True, use_container_width=True)
+        if tracer.path:
+            st.caption(f"All traces are appended to {tracer.path}.")
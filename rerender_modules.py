@@ -0,0 +1,100 @@
+# rerender_modules.py
+"""
+Re-renders every stored module to Markdown, DOCX and HTML without calling the LLM.
+
+Usage:
+    python rerender_modules.py --out rendered/ --formats md,docx,html --workers 8
+
+Every module generated by the Streamlit app, batch_generate.py or app.py is kept
+as JSON in the module store (PIMP_MODULE_STORE_PATH). After a template change,
+run this command to rebuild all outputs; the modules are rendered in parallel
+worker processes.
+"""
+
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.module_store import ModuleStore, MODULE_STORE_PATH, MODEL_TYPES, load_document
+from app.markdown_renderer import render_document
+from app.output_generator import markdown_to_html
+
+FORMATS = ("md", "docx", "html")
+
+
+def output_stem(record):
+    slug = re.sub(r'[^\w-]+', '_', record["title"].strip())[:60].strip('_')
+    return f"{slug}__{record['id'][:8]}"
+
+
+def render_record(record, out_dir, formats):
+    """Renders one stored module to the requested formats. Runs in a worker process."""
+    started = time.perf_counter()
+    document = load_document(record["kind"], record["data"])
+    markdown = render_document(document)
+    base = os.path.join(out_dir, output_stem(record))
+
+    written = []
+    md_path = base + ".md"
+    if "md" in formats or "docx" in formats:
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write(markdown)
+        written.append(md_path)
+    if "docx" in formats:
+        # The printable worksheet is built from the Markdown, like for hand-written modules.
+        from converter import create_printable_word_doc
+        create_printable_word_doc(md_path, base + ".docx", verbose=False)
+        written.append(base + ".docx")
+        if "md" not in formats:
+            os.remove(md_path)
+            written.remove(md_path)
+    if "html" in formats:
+        with open(base + ".html", 'w', encoding='utf-8') as f:
+            f.write(markdown_to_html(markdown, document.title))
+        written.append(base + ".html")
+    return written, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="rendered_modules", help="Output folder.")
+    parser.add_argument("--formats", default="md,docx,html", help=f"Comma-separated subset of {', '.join(FORMATS)}.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+    parser.add_argument("--kind", choices=sorted(MODEL_TYPES), help="Only re-render modules of this type.")
+    parser.add_argument("--store", default=MODULE_STORE_PATH, help="Path of the module store.")
+    args = parser.parse_args(argv)
+
+    formats = {fmt.strip().lower() for fmt in args.formats.split(",") if fmt.strip()}
+    unknown = formats - set(FORMATS)
+    if unknown:
+        parser.error(f"Unknown format(s): {', '.join(sorted(unknown))}")
+
+    # Every row is submitted to the pool at once, so the documents are loaded up front here.
+    records = list(ModuleStore(args.store).records(kind=args.kind))
+    print(f"Re-rendering {len(records)} modules to {', '.join(sorted(formats))} with {args.workers} workers.")
+    if not records:
+        return 0
+    os.makedirs(args.out, exist_ok=True)
+
+    started = time.perf_counter()
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(render_record, record, args.out, formats): record for record in records}
+        for future in as_completed(futures):
+            record = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[failed] {record['id']} ({record['title']}): {e}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Finished in {elapsed:.1f}s: {len(records) - failures} rendered, {failures} failed "
+          f"({len(records) / elapsed:.1f} modules/s).")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
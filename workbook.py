@@ -0,0 +1,138 @@
+# workbook.py
+"""
+Builds one printable semester workbook from many modules.
+
+Usage:
+    python workbook.py modules/ --out Arbeitsheft.docx --title "Arbeitsheft Recht" --pdf
+    python workbook.py --from-store --out Arbeitsheft.docx
+
+Modules are Markdown files (files, folders or glob patterns, in name order) or,
+with --from-store, every FullLearningUnit/AbuNewsDocument in the module store.
+They are streamed one at a time into a single document: each module is parsed
+line by line and written straight into the workbook, so no per-module Document
+is ever built and all modules share the styles of one template. The workbook
+starts with a table of contents listing each module once (its first H1, or its
+name), and every module begins on a new page.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from app.docx_writer import DocxWriter
+from converter import Heading, parse_markdown, emit_docx, collect_markdown_files
+
+
+def markdown_file_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from f
+
+
+def markdown_file_modules(inputs):
+    """(name, lines) for every Markdown file; the files are only opened when their turn comes."""
+    for path in collect_markdown_files(inputs):
+        yield os.path.splitext(os.path.basename(path))[0], markdown_file_lines(path)
+
+
+def stored_modules(kind=None, store=None):
+    """
+    (name, lines) for every module in the store (default: the app's module
+    store), loaded and rendered to Markdown one at a time.
+    """
+    from app.module_store import module_store, load_document
+    from app.markdown_renderer import render_document
+
+    for record in (store or module_store).records(kind=kind):
+        markdown = render_document(load_document(record["kind"], record["data"]))
+        yield record["title"], iter(markdown.split("\n"))
+
+
+# Identifier of the workbook's TC entries: the TOC lists exactly one entry per
+# module, not every Heading 1 inside the modules.
+TOC_IDENTIFIER = "M"
+
+
+def _collect_title(blocks, titles):
+    """Passes the blocks through and appends the module's first H1 (if any) to `titles`."""
+    for block in blocks:
+        if not titles and isinstance(block, Heading) and block.level == 1:
+            titles.append(block.text)
+        yield block
+
+
+def build_workbook(modules, out_path, title=None):
+    """
+    Writes all (name, lines) modules into one DOCX with a table of contents and
+    a page break before every module. Returns the number of modules.
+    """
+    writer = DocxWriter()
+    if title:
+        writer.heading(title, level=0)
+    writer.paragraph("Inhaltsverzeichnis", bold=True)
+    toc = writer.table_of_contents(levels="1-1", identifier=TOC_IDENTIFIER)
+
+    count = 0
+    for name, lines in modules:
+        page_break = writer.page_break()
+        titles = []
+        emit_docx(writer.document, _collect_title(parse_markdown(lines), titles))
+        # The TC field goes after the break, so it points to the module's first page.
+        toc.add_entry(titles[0] if titles else name, at=page_break)
+        count += 1
+
+    writer.save(out_path)
+    return count
+
+
+def convert_to_pdf(docx_path):
+    """Converts the workbook with LibreOffice and returns the PDF path."""
+    soffice = shutil.which("soffice") or shutil.which("libreoffice")
+    if soffice is None:
+        raise RuntimeError("PDF export needs LibreOffice (`soffice`) on the PATH.")
+    out_dir = os.path.dirname(os.path.abspath(docx_path))
+    subprocess.run([soffice, "--headless", "--convert-to", "pdf", "--outdir", out_dir, docx_path],
+                   check=True, stdout=subprocess.DEVNULL)
+    return os.path.splitext(os.path.abspath(docx_path))[0] + ".pdf"
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, or None where it cannot be read."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="Markdown files, directories or glob patterns.")
+    parser.add_argument("--from-store", action="store_true", help="Use the modules in the module store instead.")
+    parser.add_argument("--out", default="workbook.docx", help="Output DOCX path.")
+    parser.add_argument("--title", help="Title on the first page.")
+    parser.add_argument("--pdf", action="store_true", help="Also convert the workbook to PDF (needs LibreOffice).")
+    args = parser.parse_args(argv)
+
+    if bool(args.inputs) == args.from_store:
+        parser.error("Give either Markdown inputs or --from-store.")
+    modules = stored_modules() if args.from_store else markdown_file_modules(args.inputs)
+
+    started = time.perf_counter()
+    count = build_workbook(modules, args.out, title=args.title)
+    elapsed = time.perf_counter() - started
+    peak = peak_rss_mb()
+    print(f"Wrote {count} modules to {args.out} in {elapsed:.1f}s "
+          f"({os.path.getsize(args.out) / 1e6:.2f} MB" + (f", peak memory {peak:.0f} MB)" if peak else ")"))
+
+    if args.pdf:
+        print(f"PDF: {convert_to_pdf(args.out)}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())